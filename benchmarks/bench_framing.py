@@ -0,0 +1,53 @@
+"""Reports the bytes sent over the air for each query using the text protocol and binary frames.
+
+By default uses sample responses from a small router, --live uses the queries of the local system.
+"""
+
+from argparse import ArgumentParser
+
+from loranger.framing import QUERY_TYPES, TEXT, decode_frame, encode_frame
+
+SAMPLES = {
+    "hostname": "gateway-01",
+    "uptime": "1234567.89",
+    "interfaces": ["eth0", "eth1", "wlan0", "br0", "wg0"],
+    "ip4": "eth0[192.168.1.1/24]eth1[10.20.30.1/24,10.20.31.1/24]wlan0[]br0[172.16.0.1/16]wg0[10.200.0.1/32]",
+    "ip6": "eth0[fd00:1::1/64,fe80::2e0:4cff:fe68:1/64]eth1[fe80::2e0:4cff:fe68:2/64]wlan0[]"
+    "br0[fe80::ac1f:6bff:fe00:1/64]wg0[]",
+    "macs": "eth0[00:e0:4c:68:00:01]eth1[00:e0:4c:68:00:02]wlan0[ac:1f:6b:00:00:01]br0[ac:1f:6b:00:00:02]wg0[None]",
+    "routes": [f"eth1[10.{i}.0.0/16]" for i in range(20)] + ["eth0[192.168.1.0/24]", "br0[172.16.0.0/16]"],
+}
+
+
+def live_samples():
+    from loranger.queries import Queries
+
+    queries = Queries()
+    return {name: getattr(queries, f"query_{name}")() for name in SAMPLES}
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--live", action="store_true", help="Use the queries of the local system")
+    parser.add_argument("--baud", type=int, default=9600)
+    args = parser.parse_args()
+
+    samples = live_samples() if args.live else SAMPLES
+    total_text = total_frame = 0
+    print(f"{'query':>12} {'text':>6} {'frame':>6} {'saved':>6} {'airtime':>16}")
+    for name, response in samples.items():
+        text = (",".join(response) if isinstance(response, list) else response).encode() + b"\n"
+        frame = encode_frame(response, QUERY_TYPES.get(name, TEXT))
+        assert decode_frame(frame) == text.decode().strip()
+        total_text += len(text)
+        total_frame += len(frame)
+        text_ms, frame_ms = len(text) * 10000 / args.baud, len(frame) * 10000 / args.baud
+        print(
+            f"{name:>12} {len(text):>6} {len(frame):>6} {1 - len(frame) / len(text):>6.0%} "
+            f"{text_ms:>6.1f}->{frame_ms:>6.1f}ms"
+        )
+    print(f"{'total':>12} {total_text:>6} {total_frame:>6} {1 - total_frame / total_text:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
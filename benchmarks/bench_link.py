@@ -0,0 +1,136 @@
+"""Runs LoRanger.runloop over a simulated radio link and reports latency and throughput for each request.
+
+Results are written as JSON with --output, and compared against a previous run with --compare.
+"""
+
+from argparse import ArgumentParser
+from json import dump, load
+from logging import getLogger
+from threading import Thread
+from time import monotonic, sleep
+
+from loranger import LoRanger
+from loranger.queries import get_queries
+from loranger.simulator import SimulatedLink
+
+ACTIONS = ["get_actions:"]
+COMMANDS = ["echo hello", "uname -a", "seq 1 200"]
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Returns the nearest rank percentile of the values"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_request(client, request_type: str, body: str):
+    if request_type == "q":
+        return client.run_query(body)
+    if request_type == "a":
+        action, _, args = body.partition(":")
+        return client.run_action(action, args.split(",") if args else [])
+    return client.run_command(body, timeout=10)
+
+
+def measure(client, request_type: str, body: str, iterations: int) -> dict:
+    latencies, reply_bytes, failures = [], 0, 0
+    for _ in range(iterations):
+        start = monotonic()
+        reply = run_request(client, request_type, body)
+        latencies.append(monotonic() - start)
+        if reply is None:
+            failures += 1
+        else:
+            reply_bytes += len(reply.encode())
+    total = sum(latencies)
+    return {
+        "iterations": iterations,
+        "failures": failures,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "mean": total / iterations,
+        "requests_per_second": iterations / total,
+        "bytes_per_second": reply_bytes / total,
+    }
+
+
+def compare(results: dict, baseline: dict):
+    print(f"\n{'request':>24} {'p50':>16} {'p99':>16}")
+    for name, result in results["results"].items():
+        if not (old := baseline["results"].get(name)):
+            continue
+        changes = [f"{(result[key] / old[key] - 1) if old[key] else 0:>+16.1%}" for key in ("p50", "p99")]
+        print(f"{name:>24} {' '.join(changes)}")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--air-rate", type=int, default=2400)
+    parser.add_argument("--packet-size", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency added to each packet in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="Packet loss probability")
+    parser.add_argument("--corruption", type=float, default=0.0, help="Packet corruption probability")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-aux", action="store_true", help="Run without the simulated AUX pins")
+    parser.add_argument("--frames", action="store_true", help="Negotiate optional protocol features")
+    parser.add_argument("--query", action="append", help="Queries to run, defaults to all")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare the results with a previous JSON file")
+    args = parser.parse_args()
+
+    link = SimulatedLink(
+        baud=args.baud,
+        air_rate=args.air_rate,
+        packet_size=args.packet_size,
+        latency=args.latency,
+        loss=args.loss,
+        corruption=args.corruption,
+        seed=args.seed,
+    ).start()
+    settings = {"baud": args.baud, "packet_size": args.packet_size, "air_rate": args.air_rate, "read_timeout": 5}
+    server = LoRanger(
+        link.a.port, aux_pin=None if args.no_aux else link.a.aux_pin, logger=getLogger("server"), **settings
+    )
+    client = LoRanger(
+        link.b.port, aux_pin=None if args.no_aux else link.b.aux_pin, logger=getLogger("client"), **settings
+    )
+    Thread(target=server.runloop, daemon=True).start()
+    client.read_data(timeout=2)  # The server announcement
+    sleep(0.5)
+    if args.frames:
+        client.negotiate()
+
+    queries = args.query or [name.removeprefix("query_") for name in get_queries() if name.startswith("query_")]
+    requests = [("q", query) for query in queries] + [("a", action) for action in ACTIONS]
+    requests += [("c", command) for command in COMMANDS]
+
+    results = {}
+    for request_type, body in requests:
+        name = f"{request_type}:{body}"
+        results[name] = result = measure(client, request_type, body, args.iterations)
+        print(
+            f"{name:>24} p50={result['p50'] * 1000:8.1f}ms p99={result['p99'] * 1000:8.1f}ms "
+            f"{result['requests_per_second']:6.2f}req/s {result['bytes_per_second']:8.1f}B/s "
+            f"failures={result['failures']}"
+        )
+
+    report = {
+        "settings": vars(args),
+        "results": results,
+        "link": link.stats(),
+        "transmit": {"server": server.transmitter.stats(), "client": client.transmitter.stats()},
+        "retransmit": {"server": server.transfers.stats(), "client": client.chunk_assembler.stats()},
+    }
+    link.close()
+    if args.output:
+        with open(args.output, "w") as f:
+            dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compares the legacy polling receive loop with the event driven Receiver.
+
+Frames are written to one end of a pty pair at the configured baud rate while the other end is read.
+Reports the CPU used per second of waiting and the latency from the last byte written to the frame being returned.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger
+from os import close, openpty, ttyname, write
+from threading import Thread
+from time import monotonic, process_time, sleep
+
+from serial import Serial
+
+from loranger.receiver import Receiver
+
+
+def legacy_read(serial, terminator, timeout):
+    """The original read_all + sleep(0.001) loop from LoRanger.read_data"""
+    current_time = monotonic()
+    data = b""
+    while monotonic() - current_time < timeout:
+        if chunk := serial.read_all():
+            data += chunk
+            current_time = monotonic()
+        if terminator and data.endswith(terminator):
+            break
+        sleep(0.001)
+    return data
+
+
+def writer(fd, frames, frame, interval, baud, sent_times):
+    byte_time = 10 / baud  # 8N1
+    for _ in range(frames):
+        sleep(interval)
+        for i in range(0, len(frame), 32):
+            sleep(byte_time * 32)
+            write(fd, frame[i : i + 32])
+        sent_times.append(monotonic())
+
+
+def run(name, read, frames, frame, interval, baud):
+    master, slave = openpty()
+    serial = Serial(ttyname(slave), baudrate=baud)
+    sent_times, latencies = [], []
+    thread = Thread(target=writer, args=(master, frames, frame, interval, baud, sent_times))
+    wall_start, cpu_start = monotonic(), process_time()
+    thread.start()
+    for _ in range(frames):
+        if read(serial, b"\n", interval * 4):
+            latencies.append(monotonic())
+    thread.join()
+    wall, cpu = monotonic() - wall_start, process_time() - cpu_start
+    serial.close()
+    close(master)
+    close(slave)
+    latencies = sorted(done - sent for done, sent in zip(latencies, sent_times))
+    print(
+        f"{name:>8}: frames={len(latencies)} idle_cpu={cpu / wall:.2%} "
+        f"latency_p50={latencies[len(latencies) // 2] * 1000:.2f}ms latency_max={latencies[-1] * 1000:.2f}ms"
+    )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--size", type=int, default=400, help="Frame size in bytes")
+    parser.add_argument("--interval", type=float, default=0.5, help="Idle time between frames in s")
+    parser.add_argument("--baud", type=int, default=9600)
+    args = parser.parse_args()
+    frame = b"x" * (args.size - 1) + b"\n"
+
+    run("legacy", legacy_read, args.frames, frame, args.interval, args.baud)
+    receivers = {}
+
+    def receiver_read(serial, terminator, timeout):
+        receiver = receivers.setdefault(serial, Receiver(serial, getLogger("bench")))
+        return receiver.read_until(terminator, timeout)
+
+    run("receiver", receiver_read, args.frames, frame, args.interval, args.baud)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Reports the import and startup time of the loranger_client, loranger_server and loranger_scanner entry points.
+
+Each run is a fresh interpreter, which imports the entry point module then creates a LoRanger on a pty.
+Also reports which optional dependencies were loaded during startup, clients should not load netlink or GPIO code.
+"""
+
+from argparse import ArgumentParser
+from json import dump, loads
+from os import close, openpty, ttyname
+from statistics import median
+from subprocess import run
+from sys import executable
+from time import perf_counter
+
+ENTRY_POINTS = {
+    "loranger_client": ("loranger.client", {"read_timeout": 10, "cache_queries": False}),
+    "loranger_server": ("loranger.server", {}),
+    "loranger_scanner": ("loranger.scanner", {"read_timeout": 1, "cache_queries": False}),
+}
+LAZY_MODULES = ["pyroute2", "sys_gpio", "subprocess", "asyncio", "difflib"]
+
+CHILD = """
+import sys
+from time import perf_counter
+start = perf_counter()
+import {module}
+imported = perf_counter()
+from loranger import LoRanger
+LoRanger(sys.argv[1], 9600, **{kwargs})
+ready = perf_counter()
+import json
+print(json.dumps({{
+    "import": imported - start,
+    "startup": ready - imported,
+    "loaded": [name for name in {lazy} if name in sys.modules],
+}}))
+"""
+
+
+def measure(module: str, kwargs: dict, port: str) -> dict:
+    start = perf_counter()
+    ret = run([executable, "-c", CHILD.format(module=module, kwargs=kwargs, lazy=LAZY_MODULES), port], capture_output=True)
+    if ret.returncode:
+        raise RuntimeError(ret.stderr.decode())
+    result = loads(ret.stdout)
+    result["process"] = perf_counter() - start
+    return result
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    master, slave = openpty()
+    port = ttyname(slave)
+    results = {}
+    print(f"{'entry point':>18} {'import':>9} {'startup':>9} {'process':>9}  loaded")
+    for name, (module, kwargs) in ENTRY_POINTS.items():
+        runs = [measure(module, kwargs, port) for _ in range(args.iterations)]
+        results[name] = {key: median(run[key] for run in runs) for key in ("import", "startup", "process")}
+        results[name]["loaded"] = runs[-1]["loaded"]
+        print(
+            f"{name:>18} {results[name]['import'] * 1000:7.1f}ms {results[name]['startup'] * 1000:7.1f}ms "
+            f"{results[name]['process'] * 1000:7.1f}ms  {','.join(results[name]['loaded']) or '-'}"
+        )
+    close(master)
+    close(slave)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            dump({"settings": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
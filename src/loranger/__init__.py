@@ -14,6 +14,13 @@ BASE_ARGS = [
     {"flags": {"--m0-pin"}, "help": "M0 pin to use", "action": "store", "dest": "m0_pin"},
     {"flags": {"--m1-pin"}, "help": "M1 pin to use", "action": "store", "dest": "m1_pin"},
     {"flags": {"--channel", "-c"}, "help": "Channel number to use", "action": "store"},
+    {
+        "flags": ["--air-rate"],
+        "help": "Air data rate in bits per second",
+        "action": "store",
+        "default": "2400",
+        "dest": "air_rate",
+    },
 ]
 
 
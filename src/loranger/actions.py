@@ -1,15 +1,39 @@
-from subprocess import run
+from ipaddress import ip_interface
+from socket import AF_INET, AF_INET6
 
-from pyroute2 import IPRoute
-from pyroute2.netlink.exceptions import NetlinkError
+from .netlink import Netlink
+
+IFF_UP = 0x1
+NETWORK_OPERATIONS = ("up", "down", "add", "del")
 
 
 def get_actions():
     """Gets the names of all actions in this module."""
-    return [name for name in dir(Actions) if not name.startswith("__")]
+    return [name for name in dir(Actions) if not name.startswith("_") and name not in dir(Netlink)]
+
 
+def parse_network_operation(operation: str) -> tuple:
+    """Parses "<up|down> <interface>" or "<add|del> <interface> <address>[/<prefix>]",
+    returns (operation, interface, address, prefix length, family).
+    Raises ValueError if it is invalid, so a batch with a bad address is rejected before anything is applied."""
+    fields = operation.split()
+    if not fields or fields[0] not in NETWORK_OPERATIONS or len(fields) != 2 + (fields[0] in ("add", "del")):
+        raise ValueError(operation)
+    name, interface, *address = fields
+    if not address:
+        return name, interface, None, None, None
+    has_prefix = "/" in address[0]
+    if name == "add" and not has_prefix:
+        raise ValueError(operation)
+    try:
+        address = ip_interface(address[0])
+    except ValueError:
+        raise ValueError(operation) from None
+    prefixlen = address.network.prefixlen if has_prefix else None
+    return name, interface, str(address.ip), prefixlen, AF_INET6 if address.version == 6 else AF_INET
 
-class Actions:
+
+class Actions(Netlink):
     """Mixins for actions.
     Actions are run in response to r:cmd:arg1,arg2 calls.
     """
@@ -20,24 +44,24 @@ class Actions:
 
     def disable_interface(self, interface_name, *args):
         try:
-            with IPRoute() as ipr:
-                idx = ipr.link_lookup(ifname=interface_name)[0]
-                ipr.link("set", index=idx, state="down")
+            with self.netlink_lock:
+                idx = self.ipr.link_lookup(ifname=interface_name)[0]
+                self.ipr.link("set", index=idx, state="down")
                 return "Disabled inferface: %s" % interface_name
         except IndexError:
             return "Interface not found: %s" % interface_name
-        except NetlinkError as e:
+        except self.netlink_error as e:
             return "Error dissabling interface: %s" % e
 
     def enable_interface(self, interface_name, *args):
         try:
-            with IPRoute() as ipr:
-                idx = ipr.link_lookup(ifname=interface_name)[0]
-                ipr.link("set", index=idx, state="up")
+            with self.netlink_lock:
+                idx = self.ipr.link_lookup(ifname=interface_name)[0]
+                self.ipr.link("set", index=idx, state="up")
                 return "Enabled inferface: %s" % interface_name
         except IndexError:
             return "Interface not found: %s" % interface_name
-        except NetlinkError as e:
+        except self.netlink_error as e:
             return "Error enabling interface: %s" % e
 
     def add_address(self, interface_name, address, *args):
@@ -47,28 +71,90 @@ class Actions:
         except ValueError:
             return "Invalid prefix length: %s" % prefixlen
         try:
-            with IPRoute() as ipr:
-                idx = ipr.link_lookup(ifname=interface_name)[0]
+            with self.netlink_lock:
+                idx = self.ipr.link_lookup(ifname=interface_name)[0]
                 self.logger.debug(f"ipr.addr('add', index={idx}, address={addr}, mask={prefixlen})")
-                ipr.addr("add", index=idx, address=addr, mask=prefixlen)
+                self.ipr.addr("add", index=idx, address=addr, mask=prefixlen)
                 return "[%s] Added address: %s" % (interface_name, address)
         except IndexError:
             return "Interface not found: %s" % interface_name
-        except NetlinkError as e:
+        except self.netlink_error as e:
             return "Error adding address: %s" % e
 
     def del_address(self, interface_name, address, *args):
         try:
-            with IPRoute() as ipr:
-                idx = ipr.link_lookup(ifname=interface_name)[0]
-                ipr.addr("delete", index=idx, address=address)
+            with self.netlink_lock:
+                idx = self.ipr.link_lookup(ifname=interface_name)[0]
+                self.ipr.addr("delete", index=idx, address=address)
                 return "[%s] Deleted address: %s" % (interface_name, address)
         except IndexError:
             return "Interface not found: %s" % interface_name
-        except NetlinkError as e:
+        except self.netlink_error as e:
             return "Error removing address: %s" % e
 
+    def configure_network(self, *operations):
+        """Applies link and address operations in order, in one netlink session,
+        ex: a:configure_network:down eth0,del eth0 10.0.0.1,add eth0 10.0.1.1/24,up eth0
+        Each interface is resolved once. If an operation fails, the applied operations are undone in reverse order."""
+        try:
+            operations = [parse_network_operation(operation) for operation in operations]
+        except ValueError as e:
+            return "Invalid network operation: %s" % e
+        with self.netlink_lock:
+            snapshot = self.netlink_snapshot()
+            try:
+                indexes = {interface: snapshot.link_index(interface) for _, interface, *_ in operations}
+            except IndexError as e:
+                return "Interface not found: %s" % e
+            # The state the operations are checked against, updated as they are applied
+            up = {index: bool(snapshot.links[index]["flags"] & IFF_UP) for index in indexes.values()}
+            assigned = {}  # (index, family): {address: prefix length}
+            undo = []  # (method, command, kwargs) reverting each applied operation
+            for operation in operations:
+                name, interface, address, prefixlen, family = operation
+                index = indexes[interface]
+                if family and (index, family) not in assigned:
+                    addresses = snapshot.get_addresses(index, family)
+                    assigned[(index, family)] = {addr.get_attr("IFA_ADDRESS"): addr["prefixlen"] for addr in addresses}
+                try:
+                    if name in ("up", "down"):
+                        if up[index] != (name == "up"):
+                            self.ipr.link("set", index=index, state=name)
+                            undo.append(("link", "set", {"index": index, "state": "up" if up[index] else "down"}))
+                            up[index] = not up[index]
+                        continue
+                    addresses = assigned[(index, family)]
+                    if name == "add":
+                        if addresses.get(address) != prefixlen:
+                            self.ipr.addr("add", index=index, address=address, mask=prefixlen)
+                            undo.append(("addr", "delete", {"index": index, "address": address, "mask": prefixlen}))
+                            addresses[address] = prefixlen
+                        continue
+                    if address not in addresses:
+                        raise LookupError(f"Address not assigned: {address}")
+                    self.ipr.addr("delete", index=index, address=address, mask=addresses[address])
+                    undo.append(("addr", "add", {"index": index, "address": address, "mask": addresses.pop(address)}))
+                except (self.netlink_error, OSError, ValueError, LookupError) as e:
+                    failed = " ".join(operation[:2] + ((address,) if address else ()))
+                    self.logger.error("Network operation failed: %s: %s, rolling back %d", failed, e, len(undo))
+                    return "Failed %s: %s, rolled back %d/%d" % (failed, e, self._rollback_network(undo), len(undo))
+        return "Applied %d network operations" % len(operations)
+
+    def _rollback_network(self, undo: list) -> int:
+        """Runs the (method, command, kwargs) netlink requests reverting applied operations, newest first,
+        returns the number which succeeded"""
+        rolled_back = 0
+        for method, command, kwargs in reversed(undo):
+            try:
+                getattr(self.ipr, method)(command, **kwargs)
+                rolled_back += 1
+            except (self.netlink_error, OSError, ValueError) as e:
+                self.logger.error("Failed to roll back: %s %s %s: %s", method, command, kwargs, e)
+        return rolled_back
+
     def start_service(self, service_name, *args):
+        from subprocess import run
+
         ret = run(["rc-service", service_name, "start"], capture_output=True)
         if ret.returncode == 0:
             return "Started service: %s" % service_name
@@ -76,6 +162,8 @@ class Actions:
         return ret.stderr.decode()
 
     def stop_service(self, service_name, *args):
+        from subprocess import run
+
         ret = run(["rc-service", service_name, "stop"], capture_output=True)
         if ret.returncode == 0:
             return "Stopped service: %s" % service_name
@@ -0,0 +1,74 @@
+from asyncio import PriorityQueue, Semaphore, create_task, gather, get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+
+class AsyncRunloop:
+    """Asyncio server loop for a LoRanger instance.
+
+    The reader task waits on read_data in a dedicated thread.
+    Each request is dispatched to a bounded pool of worker threads, so fast queries overtake slow commands.
+    A single writer task sends responses by priority, then in the order they complete,
+    so AUX gated transmissions never overlap and query replies overtake queued command output.
+    Once stopped, requests already received are handled and their responses sent before the threads are shut down.
+    """
+
+    def __init__(self, loranger, workers=4):
+        self.loranger = loranger
+        self.logger = loranger.logger
+        self.workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loranger-worker")
+        self.reader_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="loranger-reader")
+        self.writer_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="loranger-writer")
+        self.pending = Semaphore(workers * 4)  # Requests received but not yet handled
+        self.responses = PriorityQueue()  # (priority, sequence, response)
+        self.sequence = count()
+        self.tasks = set()
+
+    async def run(self):
+        """Starts the server, then reads and handles requests until the LoRanger is stopped"""
+        loop = get_running_loop()
+        await loop.run_in_executor(self.writer_thread, self.loranger.server_startup)
+        writer = create_task(self.writer())
+        try:
+            await self.reader()
+            await gather(*self.tasks)
+            await self.responses.join()
+        finally:
+            writer.cancel()
+            for executor in (self.workers, self.reader_thread, self.writer_thread):
+                executor.shutdown(cancel_futures=True)
+
+    async def reader(self):
+        """Reads requests and starts a dispatch task for each, waits while too many are pending, until stopped"""
+        loop = get_running_loop()
+        while not self.loranger.stopped.is_set():
+            await self.pending.acquire()
+            if not (data := await loop.run_in_executor(self.reader_thread, self.loranger.read_data)):
+                self.pending.release()
+                continue
+            task = create_task(self.dispatch(data))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def dispatch(self, data: str):
+        """Handles a request in a worker thread and queues the response"""
+        try:
+            resp = await get_running_loop().run_in_executor(self.workers, self.loranger.respond, data)
+        except Exception as e:
+            return self.logger.exception("Failed to handle request: %s", e)
+        finally:
+            self.pending.release()
+        if resp:
+            await self.responses.put((self.loranger.reply_priority(data), next(self.sequence), resp))
+
+    async def writer(self):
+        """Sends queued responses one at a time"""
+        loop = get_running_loop()
+        while True:
+            priority, _, resp = await self.responses.get()
+            try:
+                await loop.run_in_executor(self.writer_thread, self.loranger.send_msg, resp, True, priority)
+            except Exception as e:
+                self.logger.exception("Failed to send response: %s", e)
+            finally:
+                self.responses.task_done()
@@ -0,0 +1,95 @@
+from threading import Lock
+from time import monotonic
+
+
+class QueryCache:
+    """Caches rendered and encoded query responses.
+
+    Entries for queries which read netlink tables are invalidated when a netlink event changes one of those tables.
+    Other entries, and all entries while no netlink monitor is running, expire after a TTL.
+    Caching is opt-in, only netlink backed queries and queries with a TTL in ttls are cached,
+    so counters and other live statistics are always rendered.
+    """
+
+    # Netlink tables each query is rendered from
+    dependencies = {
+        "interfaces": {"link"},
+        "macs": {"link"},
+        "ip4": {"link", "addr"},
+        "ip6": {"link", "addr"},
+        "routes": {"link", "route"},
+    }
+    # TTL in seconds for queries not invalidated by netlink events, queries which are not listed are not cached
+    ttls = {"uptime": 1, "hostname": 60, "capabilities": 3600}
+    default_ttl = 10  # TTL for netlink backed entries while the monitor is not running
+    netlink_ttl = 300  # Upper bound for netlink backed entries while the monitor is running
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.lock = Lock()
+        self.entries = {}  # (parameter, flags): (response, expiry)
+        self.generations = {"link": 0, "addr": 0, "route": 0}
+        self.monitor = None
+        self.hits = self.misses = self.invalidations = self.expirations = 0
+
+    def start_monitor(self):
+        """Starts the netlink monitor, if it stops, netlink entries fall back to the default TTL"""
+        from .netlink import NetlinkMonitor
+
+        self.monitor = NetlinkMonitor(self.invalidate, self.logger)
+        self.monitor.start()
+
+    def depends_on(self, parameter: str) -> set:
+        """Returns the netlink tables the query depends on, batch queries depend on the tables of each query"""
+        return set().union(*(self.dependencies.get(name, ()) for name in parameter.split(",")))
+
+    def ttl(self, parameter: str) -> float:
+        """Returns the TTL for the query, batch queries use the shortest TTL of their queries"""
+        monitored = self.monitor and self.monitor.is_alive()
+        ttls = []
+        for name in parameter.split(","):
+            if name in self.dependencies:
+                ttls.append(self.netlink_ttl if monitored else self.default_ttl)
+            else:
+                ttls.append(self.ttls.get(name, 0))
+        return min(ttls)
+
+    def invalidate(self, table: str | None = None):
+        """Drops entries depending on the table, or all entries if no table is given"""
+        with self.lock:
+            for name in self.generations if table is None else [table]:
+                self.generations[name] += 1
+            for key in list(self.entries):
+                if table is None or table in self.depends_on(key[0]):
+                    del self.entries[key]
+                    self.invalidations += 1
+
+    def get(self, parameter: str, flags: str, render):
+        """Returns the cached response for the query, or calls render and caches the result.
+        Responses are not stored if a table they depend on changed while rendering."""
+        key = (parameter, flags)
+        with self.lock:
+            if entry := self.entries.get(key):
+                if entry[1] > monotonic():
+                    self.hits += 1
+                    return entry[0]
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            generations = dict(self.generations)
+
+        response = render()
+        if ttl := self.ttl(parameter):
+            with self.lock:
+                if generations == self.generations:
+                    self.entries[key] = (response, monotonic() + ttl)
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "expirations": self.expirations,
+            "entries": len(self.entries),
+        }
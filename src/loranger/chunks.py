@@ -0,0 +1,155 @@
+"""Sequence numbered, CRC protected chunks for long replies.
+
+A reply requested with the "r" flag which does not fit in one packet is split into chunk frames, one per packet.
+The chunk frame payload is: transfer ID, chunk index, chunk count, data, CRC32 of the preceding payload bytes.
+Once the last chunk arrives, or no data arrives for the read timeout, the receiver asks for missing chunks with
+"k:<transfer>:<bitmap>", both in hex, bit n of the bitmap is set if chunk n is missing.
+The sender keeps recent transfers, and resends only the chunks in the bitmap.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from zlib import crc32
+
+from .framing import CHUNK, FRAME_MAGIC, FrameError, decode_varint, encode_varint, frame_size
+
+MAX_CHUNKS = 0xFF
+
+
+def is_chunk(data) -> bool:
+    return data[:1] == FRAME_MAGIC and data[1:2] == bytes([CHUNK])
+
+
+def chunk_data_size(packet_size: int) -> int:
+    """Returns the number of data bytes which fit in a packet sized chunk frame"""
+    return packet_size - 3 - len(encode_varint(packet_size)) - 7
+
+
+def encode_chunk(transfer: int, index: int, count: int, data: bytes) -> bytes:
+    payload = bytes([transfer, index, count]) + data
+    payload += crc32(payload).to_bytes(4, "little")
+    return FRAME_MAGIC + bytes([CHUNK, 0]) + encode_varint(len(payload)) + payload
+
+
+def decode_chunk(frame: bytes) -> tuple[int, int, int, bytes]:
+    """Returns the transfer ID, index, count and data of a chunk frame.
+    Raises FrameError if the frame is incomplete or the CRC does not match."""
+    if (size := frame_size(frame)) is None or len(frame) < size:
+        raise FrameError(frame)
+    length, offset = decode_varint(frame, 3)
+    payload = frame[offset : offset + length]
+    if len(payload) < 7 or crc32(payload[:-4]).to_bytes(4, "little") != payload[-4:]:
+        raise FrameError("Chunk CRC mismatch")
+    transfer, index, count = payload[:3]
+    if index >= count:
+        raise FrameError("Chunk index out of range: %s/%s" % (index, count))
+    return transfer, index, count, payload[3:-4]
+
+
+def encode_bitmap(indexes) -> str:
+    return f"{sum(1 << index for index in indexes):x}"
+
+
+def decode_bitmap(bitmap: str) -> list:
+    value = int(bitmap, 16)
+    return [index for index in range(value.bit_length()) if value >> index & 1]
+
+
+class OutboundTransfers:
+    """Recently sent chunked replies, kept so missing chunks can be resent.
+    Transfers are dropped once there are more than history of them, or after ttl seconds."""
+
+    def __init__(self, history=16, ttl=60):
+        self.history = history
+        self.ttl = ttl
+        self.next_id = 0
+        self.transfers = OrderedDict()  # transfer: (chunks, expiry)
+        self.lock = Lock()
+        self.sent = self.resent = self.bytes_resent = self.bytes_saved = self.unknown = 0
+
+    def add(self, message: bytes, packet_size: int) -> list | None:
+        """Splits the message into chunk frames, returns None if it needs more than MAX_CHUNKS"""
+        data_size = chunk_data_size(packet_size)
+        count = -(-len(message) // data_size)
+        if count > MAX_CHUNKS:
+            return None
+        with self.lock:
+            transfer, self.next_id = self.next_id, (self.next_id + 1) & 0xFF
+            chunks = [
+                encode_chunk(transfer, index, count, message[index * data_size : (index + 1) * data_size])
+                for index in range(count)
+            ]
+            self.transfers.pop(transfer, None)
+            self.transfers[transfer] = (chunks, monotonic() + self.ttl)
+            while len(self.transfers) > self.history:
+                self.transfers.popitem(last=False)
+            self.sent += count
+        return chunks
+
+    def resend(self, transfer: int, bitmap: str) -> list:
+        """Returns the chunks requested by the bitmap, an empty list if the transfer is unknown or expired.
+        Counts the bytes saved compared to sending the whole reply again."""
+        with self.lock:
+            chunks, expiry = self.transfers.get(transfer, ([], 0))
+            if expiry < monotonic():
+                self.unknown += 1
+                return []
+            missing = [chunks[index] for index in decode_bitmap(bitmap) if index < len(chunks)]
+            resent = sum(len(chunk) for chunk in missing)
+            self.resent += len(missing)
+            self.bytes_resent += resent
+            self.bytes_saved += sum(len(chunk) for chunk in chunks) - resent
+        return missing
+
+    def stats(self) -> dict:
+        return {
+            "chunks": self.sent,
+            "resent": self.resent,
+            "bytes_resent": self.bytes_resent,
+            "bytes_saved": self.bytes_saved,
+            "unknown": self.unknown,
+        }
+
+
+class ChunkAssembler:
+    """Reassembles chunked replies, and tracks which chunks are missing.
+    A round of a transfer ends when the last chunk the sender is sending in that round arrives,
+    the first round ends with the last chunk, later rounds with the last chunk asked for."""
+
+    def __init__(self):
+        self.transfers = {}  # transfer: [count, {index: data}, last index of the round]
+        self.complete = self.dropped = self.nacks = 0
+
+    def add(self, frame: bytes) -> tuple[int, bytes | None, bool]:
+        """Adds a chunk frame, returns its transfer ID, the reassembled message once all chunks are received,
+        and whether the round ended with chunks missing.
+        Raises FrameError if the chunk is invalid."""
+        transfer, index, count, data = decode_chunk(frame)
+        if (entry := self.transfers.get(transfer)) is None or entry[0] != count:
+            entry = self.transfers[transfer] = [count, {}, count - 1]
+        entry[1][index] = data
+        if len(entry[1]) < count:
+            return transfer, None, index == entry[2]
+        del self.transfers[transfer]
+        self.complete += 1
+        return transfer, b"".join(entry[1][index] for index in range(count)), False
+
+    def missing(self, transfer: int) -> list:
+        count, received, _ = self.transfers[transfer]
+        return [index for index in range(count) if index not in received]
+
+    def nack(self, transfer: int) -> str:
+        """Returns the request asking for the missing chunks of the transfer, and starts a new round"""
+        self.nacks += 1
+        missing = self.missing(transfer)
+        self.transfers[transfer][2] = missing[-1]
+        return f"k:{transfer:x}:{encode_bitmap(missing)}"
+
+    def drop(self):
+        """Drops all incomplete transfers"""
+        self.dropped += len(self.transfers)
+        self.transfers.clear()
+
+    def stats(self) -> dict:
+        return {"complete": self.complete, "nacks": self.nacks, "dropped": self.dropped}
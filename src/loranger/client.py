@@ -1,6 +1,7 @@
 from zenlib.util import get_kwargs
 
 from loranger import BASE_ARGS, LoRanger
+from loranger.gateway import SOCKET_PATH, GatewayClient
 
 
 def main():
@@ -8,6 +9,14 @@ def main():
         {"flags": ["-q", "--query"], "help": "Query to perform", "action": "store"},
         {"flags": ["-a", "--action"], "help": "action to perform", "action": "store", "nargs": "*"},
         {"flags": ["-c", "--command"], "help": "command to perform", "action": "store"},
+        {"flags": ["--frames"], "help": "Use binary frames and request IDs if supported by the node", "action": "store_true"},
+        {"flags": ["--stream"], "help": "Print command output as it arrives", "action": "store_true"},
+        {
+            "flags": ["--targets", "-t"],
+            "help": "Send the query or action to these nodes at once, comma separated, or * for all nodes",
+            "action": "store",
+        },
+        {"flags": ["--socket"], "help": "Gateway socket, used if a gateway is running", "action": "store", "default": SOCKET_PATH},
     ]
 
     kwargs = get_kwargs(package="loranger", description="loranger", arguments=args)
@@ -17,19 +26,42 @@ def main():
     query = kwargs.pop("query", None)
     action = kwargs.pop("action", None)
     command = kwargs.pop("command", None)
+    frames = kwargs.pop("frames", False)
+    stream = kwargs.pop("stream", False)
+    targets = kwargs.pop("targets", None)
 
-    client = LoRanger(console=console, baud=baud, logger=logger, read_timeout=10)
+    if client := GatewayClient.connect(kwargs.pop("socket", SOCKET_PATH)):
+        logger.info(f"Sending requests through the gateway at: {client.path}")
+    else:
+        client = LoRanger(console=console, baud=baud, logger=logger, read_timeout=10, cache_queries=False)
 
-    if query:
+    if frames or stream:
+        client.negotiate()
+
+    if targets:  # An empty list sends to all nodes
+        targets = [] if targets == "*" else targets.split(",")
+
+    if query and targets is not None:
+        logger.info(f"Sending query to {targets or 'all nodes'}: {query}")
+        for hostname, result in client.run_multicast("q", query, targets or None).items():
+            logger.info(f"[{hostname}] [{query}] Got response: {result}")
+    elif query:
         logger.info(f"Sending query: {query}")
         logger.info(f"[{query}] Got response: {client.run_query(query)}")
 
-    if action:
+    if action and targets is not None:
+        logger.info(f"Sending action to {targets or 'all nodes'}: {action[0]} with args: {action[1:]}")
+        for hostname, result in client.run_multicast("a", f"{action[0]}:{','.join(action[1:])}", targets or None).items():
+            logger.info(f"[{hostname}] [{action[0]}] Got response: {result}")
+    elif action:
         action_name = action[0]
         action_args = action[1:]
         logger.info(f"Sending action: {action_name} with args: {action_args}")
         logger.info(f"[{action_name}] Got response: {client.run_action(action_name, action_args)}")
 
-    if command:
+    if command and stream:
+        logger.info(f"Sending command: {command}")
+        client.run_command(command, callback=lambda output: print(output, end="", flush=True))
+    elif command:
         logger.info(f"Sending command: {command}")
         logger.info(f"[{command}] Got response:\n{client.run_command(command)}")
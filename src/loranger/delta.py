@@ -0,0 +1,134 @@
+"""Delta encoded responses for slowly changing queries.
+
+Responses are split into entries, and versioned by the CRC32 of their text.
+A client asks for changes since the version it has with "q:<parameter>~<version>", the node responds with:
+  =                   - Unchanged
+  ~<version><ops>     - Edit operations to apply to the entries of the version the client has
+  *<text>             - The full response, if the version the client has is not known
+Each op is "\\x1d<index>,<delete count>," followed by the inserted entries separated by "\\x1f".
+Ops refer to indexes of the old entries, and are applied in reverse order.
+"""
+
+import re
+from threading import Lock
+from zlib import crc32
+
+# Queries which can be delta encoded, and the separator between their entries
+DELTA_QUERIES = {"interfaces": ",", "routes": ",", "ip4": "", "ip6": "", "macs": ""}
+
+GROUP_PATTERN = re.compile(r"[^\[\]]*\[[^\]]*\]")
+
+OP_SEPARATOR = "\x1d"  # ASCII group separator
+ENTRY_SEPARATOR = "\x1f"  # ASCII unit separator
+
+
+class DeltaError(Exception):
+    def __str__(self):
+        return f"Delta could not be applied: {self.args[0]}"
+
+
+def state_version(text: str) -> str:
+    return f"{crc32(text.encode()):08x}"
+
+
+def split_entries(parameter: str, text: str) -> list:
+    if separator := DELTA_QUERIES[parameter]:
+        return text.split(separator) if text else []
+    return GROUP_PATTERN.findall(text)
+
+
+def join_entries(parameter: str, entries: list) -> str:
+    return DELTA_QUERIES[parameter].join(entries)
+
+
+def diff_entries(old: list, new: list) -> str:
+    """Returns the ops which turn the old entries into the new entries"""
+    from difflib import SequenceMatcher  # Only used by nodes, not clients
+
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag != "equal":
+            ops.append(f"{OP_SEPARATOR}{i1},{i2 - i1},{ENTRY_SEPARATOR.join(new[j1:j2])}")
+    return "".join(ops)
+
+
+def apply_ops(entries: list, ops: str) -> list:
+    """Applies ops created by diff_entries to a copy of the entries"""
+    entries = list(entries)
+    for op in reversed(ops.split(OP_SEPARATOR)[1:]):
+        index, count, inserted = op.split(",", 2)
+        index, count = int(index), int(count)
+        entries[index : index + count] = inserted.split(ENTRY_SEPARATOR) if inserted else []
+    return entries
+
+
+class StateVersions:
+    """Recent versions of delta encodable query responses, used to respond with the changes since a client's version.
+    Only the last history versions of each query are kept."""
+
+    def __init__(self, history=4):
+        self.history = history
+        self.versions = {}  # parameter: {version: entries}, oldest first
+        self.lock = Lock()
+
+    def respond(self, parameter: str, text: str, since: str) -> str:
+        """Returns the delta response for the current response text and the client's version"""
+        version = state_version(text)
+        if since == version:
+            return "="
+        entries = split_entries(parameter, text)
+        if join_entries(parameter, entries) != text:  # Not in the expected format, ex: an error
+            return f"*{text}"
+        with self.lock:
+            known = self.versions.setdefault(parameter, {})
+            known.pop(version, None)
+            known[version] = entries
+            while len(known) > self.history:
+                known.pop(next(iter(known)))
+            old = known.get(since)
+        if old is not None:
+            delta = f"~{version}{diff_entries(old, entries)}"
+            if len(delta) <= len(text):
+                return delta
+        return f"*{text}"
+
+
+class DeltaViews:
+    """Client side materialized views of delta encoded queries"""
+
+    def __init__(self):
+        self.views = {}  # parameter: (version, entries)
+
+    def since(self, parameter: str) -> str:
+        """Returns the version of the view, or an empty string if there is none"""
+        return self.views[parameter][0] if parameter in self.views else ""
+
+    def drop(self, parameter: str):
+        self.views.pop(parameter, None)
+
+    def update(self, parameter: str, reply: str) -> str:
+        """Applies a delta response to the view, returns the full response text.
+        Replies without a delta marker are returned as-is.
+        Raises DeltaError if the view is missing or the result does not match the version sent by the node."""
+        if reply.startswith("*"):
+            text = reply[1:]
+            self.views[parameter] = (state_version(text), split_entries(parameter, text))
+            return text
+        if reply == "=":
+            if parameter not in self.views:
+                raise DeltaError("No view for unchanged response: %s" % parameter)
+            return join_entries(parameter, self.views[parameter][1])
+        if reply.startswith("~"):
+            if parameter not in self.views:
+                raise DeltaError("No view for delta response: %s" % parameter)
+            version, ops = reply[1:9], reply[9:]
+            try:
+                entries = apply_ops(self.views[parameter][1], ops)
+            except ValueError as e:
+                raise DeltaError(e)
+            text = join_entries(parameter, entries)
+            if state_version(text) != version:
+                raise DeltaError("Version mismatch for: %s" % parameter)
+            self.views[parameter] = (version, entries)
+            return text
+        return reply
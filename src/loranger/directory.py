@@ -0,0 +1,57 @@
+"""Directory of the nodes heard by the scanner.
+
+Nodes are added when their hello is received, or when they are given on the command line.
+Each node keeps the time it was last seen, its capabilities, and the latest result of each polled query.
+"""
+
+from time import time
+
+
+class Node:
+    """A node known to the scanner, and the state from its last poll"""
+
+    def __init__(self, hostname: str, interval: float):
+        self.hostname = hostname
+        self.interval = interval  # Seconds between polls
+        self.first_seen = self.last_seen = time()
+        self.last_poll = None  # Time of the last successful poll
+        self.capabilities = None  # Set by the first poll
+        self.state = {}  # query: latest result
+        self.reply_bytes = None  # Bytes received by the last successful poll, used to estimate its airtime
+        self.failures = 0  # Consecutive polls without a reply
+        self.due = None  # Time the next poll is due, None if it is not scheduled
+
+    def __str__(self):
+        last_poll = f"{time() - self.last_poll:.0f}s ago" if self.last_poll else "never"
+        return f"{self.hostname} last poll: {last_poll} failures={self.failures}"
+
+
+class NodeDirectory:
+    def __init__(self, interval=60):
+        self.interval = interval  # Default poll interval for new nodes
+        self.nodes = {}  # hostname: Node
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes.values())
+
+    def get(self, hostname: str) -> Node | None:
+        return self.nodes.get(hostname)
+
+    def seen(self, hostname: str) -> Node:
+        """Records that a node was heard, adding it to the directory if it is new"""
+        if (node := self.nodes.get(hostname)) is None:
+            node = self.nodes[hostname] = Node(hostname, self.interval)
+        node.last_seen = time()
+        return node
+
+    def update(self, hostname: str, results: dict, reply_bytes: int) -> Node:
+        """Stores the results of a successful poll, queries which timed out keep their previous result"""
+        node = self.seen(hostname)
+        node.state.update({query: result for query, result in results.items() if result is not None})
+        node.last_poll = node.last_seen
+        node.reply_bytes = reply_bytes
+        node.failures = 0
+        return node
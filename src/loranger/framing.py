@@ -0,0 +1,268 @@
+"""Compact binary framing for over the air messages.
+
+A frame is: MAGIC, type, flags, request ID if the REQUEST_ID flag is set, payload length as a varint, payload.
+Typed payloads pack addresses into their binary form, and any payload may be deflated
+using a preset dictionary of tokens which are common in responses.
+
+Frames always decode to the same text the text protocol would have sent,
+so callers do not need to know which format was used.
+"""
+
+import re
+from ipaddress import IPv4Address, IPv6Address
+from zlib import MAX_WBITS, compressobj, decompressobj
+from zlib import error as ZlibError
+
+FRAME_MAGIC = b"\x1e"  # ASCII record separator, never sent by the text protocol
+BATCH_SEPARATOR = "\x1f"  # ASCII unit separator, separates name=value responses in batch query responses
+
+# CHUNK frames are handled by chunks.py, TELEMETRY frames by telemetry.py
+TEXT, IP4, IP6, MACS, ROUTES, BATCH, CHUNK, TELEMETRY = range(8)
+
+COMPRESSED = 0x01
+REQUEST_ID = 0x02
+
+ZDICT = b"".join(
+    [
+        b"Command not found: Query not found: Action not found: Interface not found: ",
+        b"Error adding address: Error removing address: Running Stopped service: Started service: ",
+        b"Disabled inferface: Enabled inferface: Added address: Deleted address: ",
+        b"total drwxr-xr-x root root -rw-r--r-- ",
+        b"00:00:00:00:00:00 fe80::/64 ::1/128 127.0.0.1/8 192.168.10.0.0.",
+        b"wlan0[wlan1[br0[bond0[wg0[eth1[eth0[lo[",
+    ]
+)
+
+GROUP_PATTERN = re.compile(r",?([^\[\],]+)\[([^\]]*)\]")
+
+
+class FrameError(Exception):
+    def __str__(self):
+        return f"Invalid frame: {self.args[0]}"
+
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(data, offset=0) -> tuple[int, int]:
+    """Decodes a varint at offset, returns the value and the offset after it.
+    Raises IndexError if the data ends before the varint does."""
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _pack_str(value: str) -> bytes:
+    value = value.encode()
+    if len(value) > 0xFF:
+        raise ValueError("String too long to pack: %s" % value)
+    return bytes([len(value)]) + value
+
+
+def _unpack_str(data, offset) -> tuple[str, int]:
+    end = offset + 1 + data[offset]
+    return bytes(data[offset + 1 : end]).decode(), end
+
+
+def _parse_groups(text: str) -> list[tuple[str, str]]:
+    """Parses name[value]name[value] or name[value],name[value] text into (name, value) tuples"""
+    groups, end = [], 0
+    for match in GROUP_PATTERN.finditer(text):
+        if match.start() != end:
+            raise ValueError("Unexpected data at offset: %s" % end)
+        groups.append(match.groups())
+        end = match.end()
+    if end != len(text):
+        raise ValueError("Unexpected data at offset: %s" % end)
+    return groups
+
+
+def _address_packer(address_type):
+    size = len(address_type(0).packed)
+
+    def pack(text: str) -> bytes:
+        out = bytearray()
+        for name, addresses in _parse_groups(text):
+            addresses = addresses.split(",") if addresses else []
+            out += _pack_str(name) + bytes([len(addresses)])
+            for address in addresses:
+                address, prefixlen = address.split("/")
+                out += address_type(address).packed + bytes([int(prefixlen)])
+        return bytes(out)
+
+    def unpack(data) -> str:
+        out, offset = [], 0
+        while offset < len(data):
+            name, offset = _unpack_str(data, offset)
+            count, offset = data[offset], offset + 1
+            addresses = []
+            for _ in range(count):
+                address = address_type(bytes(data[offset : offset + size]))
+                addresses.append(f"{address}/{data[offset + size]}")
+                offset += size + 1
+            out.append(f"{name}[{','.join(addresses)}]")
+        return "".join(out)
+
+    return pack, unpack
+
+
+def _pack_macs(text: str) -> bytes:
+    out = bytearray()
+    for name, mac in _parse_groups(text):
+        mac = b"" if mac == "None" else bytes.fromhex(mac.replace(":", ""))
+        out += _pack_str(name) + bytes([len(mac)]) + mac
+    return bytes(out)
+
+
+def _unpack_macs(data) -> str:
+    out, offset = [], 0
+    while offset < len(data):
+        name, offset = _unpack_str(data, offset)
+        end = offset + 1 + data[offset]
+        mac = bytes(data[offset + 1 : end]).hex(":") or "None"
+        out.append(f"{name}[{mac}]")
+        offset = end
+    return "".join(out)
+
+
+def _pack_routes(text: str) -> bytes:
+    """Packs interface[dst/len],... routes, interface names are stored once in a table"""
+    names, routes = {}, bytearray()
+    for name, route in _parse_groups(text):
+        destination, prefixlen = route.split("/")
+        index = names.setdefault(name, len(names))
+        routes += bytes([index]) + IPv4Address(destination).packed + bytes([int(prefixlen)])
+    if len(names) > 0xFF:
+        raise ValueError("Too many interfaces to pack: %s" % len(names))
+    return bytes([len(names)]) + b"".join(_pack_str(name) for name in names) + bytes(routes)
+
+
+def _unpack_routes(data) -> str:
+    names, offset = [], 1
+    for _ in range(data[0]):
+        name, offset = _unpack_str(data, offset)
+        names.append(name)
+    routes = []
+    for offset in range(offset, len(data), 6):
+        destination = IPv4Address(bytes(data[offset + 1 : offset + 5]))
+        routes.append(f"{names[data[offset]]}[{destination}/{data[offset + 5]}]")
+    return ",".join(routes)
+
+
+def _pack_batch(text: str) -> bytes:
+    """Packs name=value batch responses, each value is packed using the codec for its query"""
+    out = bytearray()
+    for item in text.split(BATCH_SEPARATOR):
+        name, _, value = item.partition("=")
+        frame_type, payload = _pack(value, QUERY_TYPES.get(name, TEXT))
+        out += _pack_str(name) + bytes([frame_type]) + encode_varint(len(payload)) + payload
+    return bytes(out)
+
+
+def _unpack_batch(data) -> str:
+    items, offset = [], 0
+    while offset < len(data):
+        name, offset = _unpack_str(data, offset)
+        frame_type = data[offset]
+        if frame_type not in CODECS or frame_type == BATCH:
+            raise FrameError("Unknown batch item type: %s" % frame_type)
+        length, offset = decode_varint(data, offset + 1)
+        items.append(f"{name}={CODECS[frame_type][1](data[offset : offset + length])}")
+        offset += length
+    return BATCH_SEPARATOR.join(items)
+
+
+CODECS = {
+    TEXT: (str.encode, lambda data: bytes(data).decode()),
+    IP4: _address_packer(IPv4Address),
+    IP6: _address_packer(IPv6Address),
+    MACS: (_pack_macs, _unpack_macs),
+    ROUTES: (_pack_routes, _unpack_routes),
+    BATCH: (_pack_batch, _unpack_batch),
+}
+
+QUERY_TYPES = {"ip4": IP4, "ip6": IP6, "macs": MACS, "routes": ROUTES}
+
+
+def is_frame(data) -> bool:
+    return data[:1] == FRAME_MAGIC
+
+
+def _length_offset(data) -> int:
+    """Returns the offset of the payload length, raises IndexError if the flags have not been received"""
+    return 4 if data[2] & REQUEST_ID else 3
+
+
+def frame_size(data) -> int | None:
+    """Returns the total size of the frame at the start of data, or None if the header is incomplete"""
+    try:
+        length, offset = decode_varint(data, _length_offset(data))
+    except IndexError:
+        return None
+    return offset + length
+
+
+def frame_request_id(frame) -> int | None:
+    """Returns the request ID of the frame, or None if it has none"""
+    return frame[3] if frame[2] & REQUEST_ID else None
+
+
+def with_request_id(frame: bytes, request_id: int) -> bytes:
+    """Returns a copy of the frame tagged with the request ID"""
+    if frame[2] & REQUEST_ID:
+        return frame[:3] + bytes([request_id]) + frame[4:]
+    return frame[:2] + bytes([frame[2] | REQUEST_ID, request_id]) + frame[3:]
+
+
+def _pack(text: str, frame_type: int) -> tuple[int, bytes]:
+    """Packs text using the codec for frame_type, falls back to TEXT if it cannot be represented exactly"""
+    if frame_type != TEXT:
+        pack, unpack = CODECS[frame_type]
+        try:
+            payload = pack(text)
+            if unpack(payload) == text:
+                return frame_type, payload
+        except (ValueError, IndexError, KeyError):
+            pass
+    return TEXT, text.encode()
+
+
+def encode_frame(data, frame_type: int = TEXT, compress: bool = True) -> bytes:
+    """Encodes a response as a frame, lists are joined with commas like the text protocol"""
+    if isinstance(data, list):
+        data = ",".join(data)
+    frame_type, payload = _pack(data, frame_type)
+    flags = 0
+    if compress and len(payload) > 16:
+        compressor = compressobj(9, wbits=-MAX_WBITS, zdict=ZDICT)
+        deflated = compressor.compress(payload) + compressor.flush()
+        if len(deflated) < len(payload):
+            payload, flags = deflated, flags | COMPRESSED
+    return FRAME_MAGIC + bytes([frame_type, flags]) + encode_varint(len(payload)) + payload
+
+
+def decode_frame(frame: bytes) -> str:
+    """Decodes a frame back to the text the text protocol would have sent"""
+    if not is_frame(frame) or (size := frame_size(frame)) is None or len(frame) < size:
+        raise FrameError(frame)
+    frame_type, flags = frame[1], frame[2]
+    payload = memoryview(frame)[size - decode_varint(frame, _length_offset(frame))[0] : size]
+    if frame_type not in CODECS:
+        raise FrameError("Unknown frame type: %s" % frame_type)
+    try:
+        if flags & COMPRESSED:
+            payload = decompressobj(wbits=-MAX_WBITS, zdict=ZDICT).decompress(payload)
+        return CODECS[frame_type][1](payload)
+    except (ZlibError, IndexError, ValueError) as e:
+        raise FrameError(e)
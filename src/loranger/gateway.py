@@ -0,0 +1,253 @@
+"""Local gateway which owns the radio link, so many client processes can share one module.
+
+Clients connect to a Unix socket and send one JSON request per line, ex: {"method": "run_query", "args": ["uptime"]}
+Each request gets one JSON response line, {"reply": <reply>} or {"error": <message>}.
+"""
+
+from concurrent.futures import Future
+from json import dumps, loads
+from pathlib import Path
+from queue import Empty, Queue
+from socket import AF_UNIX, SOCK_STREAM, socket
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+from threading import Event, Lock, Thread
+
+from zenlib.util import get_kwargs
+
+from loranger import BASE_ARGS, LoRanger
+
+SOCKET_PATH = "/run/loranger.sock"
+METHODS = ("run_query", "run_action", "run_command", "run_multicast", "negotiate", "telemetry")
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayHandler(StreamRequestHandler):
+    """Handles the requests of one client connection, in its own thread"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = loads(line)
+                response = {"reply": self.server.gateway.submit(request["method"], request.get("args", [])).result()}
+            except Exception as e:
+                response = {"error": str(e)}
+            self.wfile.write(dumps(response).encode() + b"\n")
+
+
+class Gateway:
+    """Serves requests from local clients on a Unix socket, over the radio link of a LoRanger.
+
+    Requests from all clients are queued, and run by a single radio thread.
+    Queries which are queued together are sent as one batch query, actions and commands are pipelined,
+    so with request IDs a slow command does not hold up the other requests of its batch.
+    Requests queued while a batch is running wait for it, so a slow command still delays them.
+    Identical queries which are waiting or in flight are sent once, every client waiting for them gets the reply.
+    While there are no requests, the radio thread reads, so telemetry pushed by nodes is stored.
+    """
+
+    def __init__(self, loranger, path=SOCKET_PATH):
+        self.loranger = loranger
+        self.logger = loranger.logger
+        self.path = path
+        self.requests = Queue()  # (method, args, future)
+        self.lock = Lock()
+        self.queries = {}  # parameter: Future, for queries which are waiting or in flight
+        self.coalesced = 0
+        self.idle_read = 0.1  # Seconds to read for while there are no requests
+        self.server = None
+        self.radio_thread = Thread(target=self.radio_loop, name="gateway-radio", daemon=True)
+        self.stopped = Event()
+
+    def submit(self, method: str, args: list) -> Future:
+        """Queues a request for the radio thread, returns the future of an identical query if one is pending"""
+        if method not in METHODS:
+            raise GatewayError(f"Unknown method: {method}")
+        future = Future()
+        if method == "telemetry":  # Answered from the stored telemetry, without the radio
+            future.set_result(self.telemetry(*args))
+            return future
+        if method == "run_query":
+            with self.lock:
+                if pending := self.queries.get(args[0]):
+                    self.coalesced += 1
+                    self.loranger.metrics.count("coalesced_queries")
+                    return pending
+                self.queries[args[0]] = future
+        self.requests.put((method, args, future))
+        return future
+
+    def complete(self, method: str, args: list, future: Future, reply=None, exception=None):
+        """Sets the result of a request, queries are no longer pending once they complete"""
+        if method == "run_query":
+            with self.lock:
+                self.queries.pop(args[0], None)
+        if exception:
+            return future.set_exception(exception)
+        future.set_result(reply)
+
+    def telemetry(self, hostname=None, name=None, since=0.0):
+        """Returns the latest telemetry of each node by hostname, or the (time, value) series of a node's value"""
+        if hostname is None:
+            return {hostname: buffer.latest() for hostname, buffer in list(self.loranger.telemetry.nodes.items())}
+        if (buffer := self.loranger.telemetry.get(hostname)) is None:
+            raise GatewayError(f"No telemetry from: {hostname}")
+        return buffer.series(name, since) if name else buffer.latest()
+
+    def pipelined_request(self, method: str, args: list) -> tuple:
+        """Returns the run_pipelined request for a run_action or run_command request"""
+        if method == "run_action":
+            return "a", f"{args[0]}:{','.join(args[1])}"
+        return "c", args[0], args[1] if len(args) > 1 else 35
+
+    def run_batch(self, batch: list):
+        """Runs the queued requests, queries are combined, actions and commands are pipelined,
+        other requests run in order"""
+        queries = [request for request in batch if request[0] == "run_query"]
+        if len(queries) > 1:
+            replies = self.loranger.run_queries([args[0] for _, args, _ in queries])
+            for method, args, future in queries:
+                self.complete(method, args, future, replies.get(args[0]))
+        pipelined = [request for request in batch if request[0] in ("run_action", "run_command")]
+        if len(pipelined) > 1:
+            requests = [self.pipelined_request(method, args) for method, args, _ in pipelined]
+            for (method, args, future), reply in zip(pipelined, self.loranger.run_pipelined(requests)):
+                self.complete(method, args, future, reply)
+        for method, args, future in batch:
+            if not future.done():
+                self.complete(method, args, future, getattr(self.loranger, method)(*args))
+
+    def radio_loop(self):
+        """Takes every queued request, and runs them as a batch"""
+        while not self.stopped.is_set():
+            try:
+                batch = [self.requests.get(timeout=self.idle_read)]
+            except Empty:
+                self.loranger.read_data(timeout=self.idle_read)
+                continue
+            try:
+                while True:
+                    batch.append(self.requests.get_nowait())
+            except Empty:
+                pass
+            self.logger.debug("Running %d gateway requests", len(batch))
+            try:
+                self.run_batch(batch)
+            except Exception as e:
+                self.logger.exception("Failed to run gateway requests: %s", e)
+                for method, args, future in batch:
+                    if not future.done():
+                        self.complete(method, args, future, exception=e)
+
+    def listen(self):
+        """Starts the radio thread, and listens on the socket, replacing a stale socket file"""
+        if client := GatewayClient.connect(self.path):
+            client.close()
+            raise GatewayError(f"A gateway is already listening on: {self.path}")
+        Path(self.path).unlink(missing_ok=True)
+        self.server = ThreadingUnixStreamServer(self.path, GatewayHandler)
+        self.server.daemon_threads = True
+        self.server.gateway = self
+        self.radio_thread.start()
+        self.logger.info("Gateway listening on: %s", self.path)
+
+    def start(self):
+        """Serves clients in a background thread"""
+        self.listen()
+        Thread(target=self.server.serve_forever, name="gateway-socket", daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        """Serves clients until interrupted, then removes the socket"""
+        self.listen()
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            self.stop()
+
+    def stop(self):
+        """Stops the radio thread once its requests are done, and removes the socket"""
+        self.stopped.set()
+        self.radio_thread.join()
+        Path(self.path).unlink(missing_ok=True)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.stop()
+
+
+class GatewayClient:
+    """Sends requests through a running gateway, has the request methods of LoRanger used by loranger_client"""
+
+    def __init__(self, path=SOCKET_PATH):
+        self.path = path
+        self.socket = socket(AF_UNIX, SOCK_STREAM)
+        try:
+            self.socket.connect(path)
+        except OSError:
+            self.socket.close()
+            raise
+        self.file = self.socket.makefile("rwb")
+
+    @classmethod
+    def connect(cls, path=SOCKET_PATH):
+        """Returns a client for the gateway, None if no gateway is listening on the path"""
+        try:
+            return cls(path)
+        except OSError:
+            return None
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def request(self, method: str, *args):
+        self.file.write(dumps({"method": method, "args": args}).encode() + b"\n")
+        self.file.flush()
+        if not (line := self.file.readline()):
+            raise GatewayError(f"Gateway closed the connection: {self.path}")
+        if "error" in (response := loads(line)):
+            raise GatewayError(response["error"])
+        return response["reply"]
+
+    def negotiate(self):
+        return self.request("negotiate")
+
+    def run_query(self, parameter):
+        return self.request("run_query", parameter)
+
+    def run_action(self, action, args):
+        return self.request("run_action", action, args)
+
+    def run_command(self, command: str, timeout=35, callback=None):
+        """Runs a command through the gateway, the callback is called once with the whole output"""
+        output = self.request("run_command", command, timeout)
+        if callback and output:
+            callback(output.removesuffix("\x00\x00"))
+        return output
+
+    def run_multicast(self, request_type: str, body: str, targets=None, slots=16, timeout=None) -> dict:
+        return self.request("run_multicast", request_type, body, targets, slots, timeout)
+
+    def telemetry(self, hostname=None, name=None, since=0.0):
+        return self.request("telemetry", hostname, name, since)
+
+
+def main():
+    args = BASE_ARGS + [
+        {"flags": ["--socket"], "help": "Unix socket to listen on", "action": "store", "default": SOCKET_PATH},
+        {"flags": ["--frames"], "help": "Use binary frames and request IDs if supported by the node", "action": "store_true"},
+    ]
+    kwargs = get_kwargs(package="loranger", description="loranger", arguments=args)
+    path = kwargs.pop("socket", SOCKET_PATH)
+    frames = kwargs.pop("frames", False)
+    loranger = LoRanger(read_timeout=10, cache_queries=False, **kwargs)
+    if frames:
+        loranger.negotiate()
+    Gateway(loranger, path).serve_forever()
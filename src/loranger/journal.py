@@ -0,0 +1,160 @@
+"""Memory mapped outbound journal, keeping messages which could not be sent until the link recovers.
+
+The journal file is a fixed size header followed by a circular log of records.
+The header is the index: it holds the offsets of the oldest and next records, the record count and sequence numbers,
+so opening the journal does not scan the log. Each record is: length, CRC32 of the message, sequence, time, message.
+A record which does not fit before the end of the file is written at the start of the log,
+after a wrap marker, and the oldest records are evicted when the log is full.
+Records are written before the header, so a record torn by a crash is never in the index,
+and when records are evicted, the header is written before the new record overwrites them.
+"""
+
+from mmap import mmap
+from os import O_CREAT, O_RDWR, close, fstat, ftruncate
+from os import open as os_open
+from struct import Struct
+from threading import Lock
+from time import time
+from zlib import crc32
+
+MAGIC = b"LRJ1"
+HEADER = Struct("<4sIIIIQQQ")  # magic, capacity, tail, head, count, next sequence, evicted, expired
+HEADER_SIZE = 64
+RECORD = Struct("<IIQd")  # length, crc32, sequence, time
+WRAP = 0xFFFFFFFF
+
+
+class JournalError(Exception):
+    def __str__(self):
+        return f"Invalid journal record: {self.args[0]}"
+
+
+class OutboundJournal:
+    """Append-only journal of outbound messages with bounded size.
+    Messages are read back oldest first, and removed once acknowledged, ex: after they are sent.
+    Messages older than ttl seconds are dropped instead of being replayed."""
+
+    def __init__(self, path: str, capacity=65536, ttl=3600):
+        if capacity <= HEADER_SIZE + RECORD.size:
+            raise ValueError("Journal capacity too small: %s" % capacity)
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self.lock = Lock()
+        fd = os_open(path, O_RDWR | O_CREAT, 0o600)
+        try:
+            resized = fstat(fd).st_size != capacity
+            if resized:
+                ftruncate(fd, capacity)
+            self.map = mmap(fd, capacity)
+        finally:
+            close(fd)
+        magic, capacity, *state = HEADER.unpack_from(self.map)
+        if resized or magic != MAGIC or capacity != self.capacity:
+            state = [HEADER_SIZE, HEADER_SIZE, 0, 0, 0, 0]
+        self.tail, self.head, self.count, self.next_sequence, self.evicted, self.expired = state
+        self.write_header()
+
+    def __len__(self):
+        return self.count
+
+    def write_header(self):
+        HEADER.pack_into(
+            self.map, 0, MAGIC, self.capacity, self.tail, self.head, self.count,
+            self.next_sequence, self.evicted, self.expired,
+        )
+        self.map.flush()
+
+    def record_offset(self, offset: int) -> int:
+        """Returns the offset of the record at offset, following a wrap marker"""
+        if offset + RECORD.size > self.capacity or int.from_bytes(self.map[offset : offset + 4], "little") == WRAP:
+            return HEADER_SIZE
+        return offset
+
+    def read_record(self, offset: int) -> tuple[int, float, bytes, int]:
+        """Returns the sequence, time and message of the record at offset, and the offset after it"""
+        offset = self.record_offset(offset)
+        length, crc, sequence, timestamp = RECORD.unpack_from(self.map, offset)
+        end = offset + RECORD.size + length
+        if end > self.capacity or crc32(message := self.map[offset + RECORD.size : end]) != crc:
+            raise JournalError(offset)
+        return sequence, timestamp, message, end
+
+    def drop_oldest(self):
+        self.tail = self.read_record(self.tail)[3]
+        self.count -= 1
+        if not self.count:
+            self.tail = self.head = HEADER_SIZE
+
+    def append(self, message: bytes) -> int:
+        """Appends a message, evicting the oldest messages if there is not enough space, returns its sequence"""
+        size = RECORD.size + len(message)
+        if size > self.capacity - HEADER_SIZE:
+            raise ValueError("Message too large for the journal: %s bytes" % len(message))
+        with self.lock:
+            evicted = self.evicted
+            while True:
+                if not self.count:
+                    self.tail = self.head = HEADER_SIZE
+                if self.head > self.tail or not self.count:  # The free space runs to the end of the file
+                    if self.head + size <= self.capacity:
+                        break
+                    if self.head + 4 <= self.capacity:
+                        self.map[self.head : self.head + 4] = WRAP.to_bytes(4, "little")
+                    self.head = HEADER_SIZE
+                elif self.head + size <= self.tail:  # The free space is between the head and the oldest record
+                    break
+                else:
+                    self.drop_oldest()
+                    self.evicted += 1
+            if self.evicted != evicted:  # The evicted records are overwritten, remove them from the index first
+                self.write_header()
+            sequence = self.next_sequence
+            self.write_record(RECORD.pack(len(message), crc32(message), sequence, time()) + message)
+            self.head += size
+            self.count += 1
+            self.next_sequence += 1
+            self.write_header()
+        return sequence
+
+    def write_record(self, record: bytes):
+        """Writes a packed record at the head"""
+        self.map[self.head : self.head + len(record)] = record
+
+    def first(self) -> tuple[int, bytes] | None:
+        """Returns the sequence and message of the oldest message, dropping expired messages.
+        A corrupt record empties the journal, since the records after it can't be found."""
+        with self.lock:
+            while self.count:
+                try:
+                    sequence, timestamp, message, _ = self.read_record(self.tail)
+                except JournalError:
+                    self.tail = self.head = HEADER_SIZE
+                    self.count = 0
+                    self.write_header()
+                    raise
+                if timestamp + self.ttl >= time():
+                    return sequence, message
+                self.drop_oldest()
+                self.expired += 1
+                self.write_header()
+
+    def ack(self, sequence: int):
+        """Removes messages up to and including the sequence"""
+        with self.lock:
+            while self.count and self.read_record(self.tail)[0] <= sequence:
+                self.drop_oldest()
+            self.write_header()
+
+    def stats(self) -> dict:
+        """Returns the journal statistics, bytes is the log space used, including the unused space at the wrap point"""
+        if not self.count:
+            used = 0
+        elif self.head > self.tail:
+            used = self.head - self.tail
+        else:  # Wrapped, or full
+            used = self.capacity - self.tail + self.head - HEADER_SIZE
+        return {"pending": self.count, "bytes": used, "evicted": self.evicted, "expired": self.expired}
+
+    def close(self):
+        self.map.close()
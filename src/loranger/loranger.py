@@ -1,12 +1,41 @@
+import re
 from contextlib import contextmanager
-from time import sleep, time
+from os import uname
+from random import randrange
+from threading import Event, Lock, Thread
+from time import monotonic, perf_counter, sleep, time
 
 from serial import Serial
-from sys_gpio import Pin
 from zenlib.logging import loggify
 
-from .actions import Actions
+from .actions import Actions, get_actions
+from .cache import QueryCache
+from .chunks import ChunkAssembler, OutboundTransfers, is_chunk
+from .delta import DELTA_QUERIES, DeltaError, DeltaViews, StateVersions
+from .framing import (
+    BATCH,
+    BATCH_SEPARATOR,
+    QUERY_TYPES,
+    TEXT,
+    FrameError,
+    decode_frame,
+    encode_frame,
+    frame_request_id,
+    frame_size,
+    is_frame,
+    with_request_id,
+)
+from .journal import JournalError, OutboundJournal
+from .metrics import Metrics
+from .pipeline import RequestPipeline
 from .queries import Queries
+from .receiver import JunkDataError, Receiver
+from .telemetry import FIELDS, TelemetryStore, encode_telemetry, is_telemetry
+from .transmit import BULK, CONTROL, INTERACTIVE, AirtimeLimiter, TransmitQueue, Transmitter
+
+TEXT_REQUEST_ID = re.compile(rb"#([0-9a-f]{1,2}):")
+MULTICAST_REPLY = re.compile(rb"@([^#:@]+)#([0-9a-f]{1,2}):")
+REQUEST_ID_PATTERN = re.compile(r"[0-9a-f]{1,2}")
 
 
 class ActionNotFoundError(Exception):
@@ -26,31 +55,95 @@ class LoRanger(Queries, Actions):
       h:<hostname> - Announces the hostname of the device
     q:uery
       q:<parameter> - Queries the device for the specified parameter
+      q:<parameter>,<parameter>... - Runs several queries, responds with name=value items separated by \\x1f
+      q:<parameter>~<version> - Responds with the changes since the version, see delta.py
     a:ction
       a:<action>:<arg1>,<arg2>... - Runs the specified action with the given arguments
     c:ommand
       c:<command> - Runs the specified command on the device
+    k:(nack)
+      k:<transfer>:<bitmap> - Resends the missing chunks of a chunked reply, see chunks.py
+
+    Request types may be followed by flags before the colon:
+      f - Respond with a binary frame, ex: qf:ip4
+      r - Send replies longer than a packet as CRC protected chunks, ex: cr:dmesg
+    A request may be addressed to one node by hostname after the flags, other nodes ignore it:
+      q@node1:uptime - Only node1 responds
+    With the "m" flag, the request is for a set of nodes, each responds in its own slot tagged with its hostname:
+      am@node1+node2:start_service:sshd - node1 responds in the first slot, node2 in the second, ex: @node2:<response>
+      qm@*16:uptime - All nodes respond, each in a random one of 16 slots
+    A request ID may follow the flags and address, the response will be tagged with it:
+      q#1f:uptime - Responds with #1f:<uptime>, or a binary frame with the request ID set
     """
 
     def __init__(
         self, console: str, baud: int, read_timeout=5, packet_size=200,
         power_pin=None, aux_pin=None, m0_pin=None, m1_pin=None,
-        channel=None,
+        channel=None, cache_queries=True, pipeline_window=4,
+        buffer_size=400, air_rate=2400, metrics_file=None, hostname=None, duty_cycle=None,
+        telemetry_interval=0, telemetry_fields=",".join(FIELDS), telemetry_history=720,
+        journal=None, journal_size=65536, journal_ttl=3600,
         *args, **kwargs
     ):
+        self.telemetry_fields = telemetry_fields.split(",")
+        if unknown := set(self.telemetry_fields) - set(FIELDS):
+            raise ValueError(f"Unknown telemetry fields: {', '.join(sorted(unknown))}")
         self.serial = Serial(port=console, baudrate=baud)
         self.read_timeout = read_timeout  # serial read timeout in s
         self.packet_size = packet_size
+        self.air_rate = int(air_rate)
+        self.hostname = hostname or uname().nodename  # Announced, and used to match addressed requests
+        self.target = None  # Hostname requests are addressed to, None sends them to all nodes
+        self.on_hello = None  # Called with the hostname of announcements read while waiting for replies
+        self.stopped = Event()  # Set by stop, ends the server loops
+        self.metrics = Metrics()
+        self.receiver = Receiver(self.serial, self.logger, self.metrics)
+        self.use_frames = False  # Set by negotiate when the remote node supports binary frames
+        self.use_ids = False  # Set by negotiate when the remote node supports request IDs
+        self.use_batch = False  # Set by negotiate when the remote node supports batch queries
+        self.use_stream = False  # Set by negotiate when the remote node supports streaming command output
+        self.use_delta = False  # Set by negotiate when the remote node supports delta encoded responses
+        self.use_chunks = False  # Set by negotiate when the remote node supports chunked replies
+        self.nack_retries = 3  # Times missing chunks are requested before a chunked reply is dropped
+        self.slot_guard = 0.05  # Seconds added to each multicast reply slot for processing and timing jitter
+        self.max_slots = 64  # Most reply slots a multicast request may ask for, larger requests are ignored
+        self.transfers = OutboundTransfers()
+        self.chunk_assembler = ChunkAssembler()
+        self.pipeline = RequestPipeline(window=pipeline_window)
+        self.cache = QueryCache(self.logger) if cache_queries else None
+        self.state_versions = StateVersions()
+        self.delta_views = DeltaViews()
+        self.metrics_file = metrics_file  # Prometheus textfile written by the server
+        self.telemetry_interval = float(telemetry_interval or 0)  # Seconds between telemetry pushes, 0 disables them
+        self.telemetry = TelemetryStore(int(telemetry_history))  # Telemetry received from other nodes
+        # Messages which could not be sent are journaled to this file, and replayed once the link recovers
+        self.journal = OutboundJournal(journal, int(journal_size), float(journal_ttl)) if journal else None
+        self.journal_lock = Lock()
+        self.link_up = True  # Cleared when the module is reset or a write fails, set once it is started or data is read
 
         if m1_pin and not m0_pin or m0_pin and not m1_pin:
             raise ValueError("Both M0 and M1 pins must be defined")
 
         self.channel = channel
-        self.power_pin = Pin(power_pin, logger=self.logger) if power_pin else None
-        self.aux_pin = Pin(aux_pin, logger=self.logger) if aux_pin else None
-        self.m0_pin = Pin(m0_pin, logger=self.logger) if m0_pin else None
-        self.m1_pin = Pin(m1_pin, logger=self.logger) if m1_pin else None
-
+        self.power_pin = self.get_pin(power_pin)
+        self.aux_pin = self.get_pin(aux_pin)
+        self.m0_pin = self.get_pin(m0_pin)
+        self.m1_pin = self.get_pin(m1_pin)
+        # Bursts of up to a module buffer are sent at once, then transmissions are limited to the duty cycle
+        limiter = AirtimeLimiter(float(duty_cycle), int(buffer_size) * 8 / self.air_rate) if duty_cycle else None
+        self.transmitter = Transmitter(
+            self.serial, self.logger, self.aux_ready, self.aux_pin, packet_size, int(buffer_size), self.air_rate, limiter
+        )
+        self.tx_queue = TransmitQueue(self.transmitter, self.metrics)
+
+    def get_pin(self, pin):
+        """Returns a Pin for the pin number, objects with a value are used as-is, ex: a SimulatedPin
+        sys_gpio is only imported when a pin number is given, clients without pins never load it."""
+        if not pin or hasattr(pin, "value"):
+            return pin or None
+        from sys_gpio import Pin
+
+        return Pin(pin, logger=self.logger)
 
     def module_init(self):
         """ Sets the module channel """
@@ -80,69 +173,209 @@ class LoRanger(Queries, Actions):
             self.aux_pin.direction = "in"
 
         self.serial.reset_input_buffer()
+        self.receiver.clear()
         self.module_init()
 
         if self.m0_pin:
             self.logger.info("Setting M0 and M1 to 1")
             # a value of 1 activates nfets tying the pins to module ground enabling transmission
             self.m0_pin.value, self.m1_pin.value = 1, 1
+        self.link_up = True
         self.announce()
 
     def module_reset(self):
-        """Power cycles the module then sets the AUX pin high for 1s"""
-        if not self.power_pin and not self.aux_pin:
-            return self.logger.error("No power or AUX pin defined, cannot reset module")
+        """Power cycles the module, used when the receiver cannot resynchronize after repeated junk data.
+        Without a power pin, only the input buffers are cleared."""
+        if not self.power_pin:
+            self.logger.error("No power pin defined, cannot reset module, clearing input buffers")
+            self.serial.reset_input_buffer()
+            return self.receiver.clear()
         self.logger.info("Resetting module")
+        self.metrics.count("resets")
+        self.link_up = False
         self.power_pin.value = 0
         sleep(0.5)  # Power the module off for half a second
         self.power_pin.value = 1
         self.serial.reset_input_buffer() # Clear any junk data
+        self.receiver.clear()
+        self.link_up = True
         self.announce()
 
-    def runloop(self):
-        """Main loop, runs read_data forever and calls the appropriate action"""
+    def server_startup(self):
+        """Starts the module, the query cache monitor and telemetry pushes"""
         self.module_startup()
+        if self.cache:
+            self.cache.start_monitor()
+        if self.metrics_file:
+            self.metrics.start_textfile(self.metrics_file, logger=self.logger, stopped=self.stopped)
+        if self.telemetry_interval:
+            Thread(target=self.push_telemetry, name="telemetry", daemon=True).start()
         self.logger.info("Listening on serial port: %s", self.serial.port)
-        while True:
+
+    def push_telemetry(self):
+        """Sends the configured telemetry fields every telemetry_interval seconds as bulk data, until stopped"""
+        self.logger.info("Pushing telemetry every %ss: %s", self.telemetry_interval, self.telemetry_fields)
+        while not self.stopped.wait(self.telemetry_interval):
+            if not self.link_ready():  # Not journaled, stale samples would be stored as new
+                continue
+            try:
+                self.send_msg(encode_telemetry(self.hostname, self.telemetry_fields), priority=BULK, durable=False)
+            except OSError as e:
+                self.logger.error("Failed to read telemetry: %s", e)
+
+    def runloop(self):
+        """Main loop, runs read_data until stopped and calls the appropriate action"""
+        self.server_startup()
+        while not self.stopped.is_set():
             if data := self.read_data():
-                try:
-                    resp = self.handle_data(data)
-                    self.logger.info("Prepared response: %s", resp)
-                except (ActionNotFoundError, QueryNotFoundError) as e:
-                    self.logger.error(e)
-                    resp = str(e)
-                if resp:
-                    self.send_msg(resp)
+                if resp := self.respond(data):
+                    self.send_msg(resp, priority=self.reply_priority(data))
+
+    def stop(self):
+        """Stops the server loop once the current read or request is done"""
+        self.stopped.set()
+
+    def async_runloop(self, workers=4):
+        """Runs the server loop using asyncio, requests are handled concurrently by workers threads"""
+        from asyncio import run
+
+        from .asyncloop import AsyncRunloop
+
+        run(AsyncRunloop(self, workers).run())
+
+    def respond(self, data: str):
+        """Handles the received data and returns the response to send"""
+        resp = self.handle_data(data)
+        self.logger.info("Prepared response: %s", resp)
+        return resp
+
+    def reply_priority(self, data: str) -> int:
+        """Returns the transmit priority of the reply to a request, command output is bulk"""
+        return BULK if data[:1] == "c" else INTERACTIVE
 
     def announce(self):
         """Sends an announcement message to the serial port"""
-        from os import uname
-
-        self.send_msg(f"h:{uname()[1]}")
+        self.send_msg(f"h:{self.hostname}", priority=CONTROL)
 
     def handle_data(self, data: str):
-        """Handles input data, actions will be in the format of "r:action:arg1,arg2..."
-        run_action may raise ActionNotFoundError if the action is not defined"""
+        """Handles input data, actions will be in the format of "a:action:arg1,arg2..."
+        The type may be followed by flags, "f" requests a binary framed response, ex: "qf:ip4"
+        A request ID may follow the flags, ex: "qf#1f:ip4", it is included in the response.
+        Requests addressed to another node, ex: "q@node2:ip4", are ignored.
+        Multicast requests, ex: "qm@node1+node2:ip4", are answered in this node's slot as text.
+        Unknown actions and queries are reported in the response."""
         self.logger.debug("Handling data: %s", data)
-        data = data.split(":")
-        if data[0] == "a":
-            self.logger.debug("Received action: %s", data)
-            action = data[1]
-            if args := data[2]:
-                arglist = args.split(",")
+        head, _, body = data.partition(":")
+        head, _, request_id = head.partition("#")
+        head, _, target = head.partition("@")
+        request_type, flags = head[:1], head[1:]
+        if "m" in flags:
+            if (slot := self.multicast_slot(target)) is None:
+                return self.logger.debug("Ignoring multicast request for nodes %s: %s", target, data)
+            reply_at, flags = monotonic() + slot * self.slot_time(), "m"  # Multicast replies are one text message
+        elif target and target != self.hostname:
+            return self.logger.debug("Ignoring request for node %s: %s", target, data)
+        if request_id and not REQUEST_ID_PATTERN.fullmatch(request_id):  # Corrupted in transit
+            self.metrics.count("invalid_requests")
+            return self.logger.warning("Discarding request with an invalid request ID: %s", data)
+        try:
+            if request_type == "a":
+                self.logger.debug("Received action: %s", data)
+                action, _, args = body.partition(":")
+                arglist = args.split(",") if args else []
+                self.logger.debug("Action: %s, Args: %s", action, arglist)
+                response = self.encode_response(self.handle_action(action, arglist), flags)
+            elif request_type == "q":
+                self.logger.debug("Received query for parameter: %s", body)
+                if "~" in body:
+                    response = self.handle_delta_query(*body.split("~", 1), flags)
+                else:
+                    response = self.cached_query(body, flags)
+            elif request_type == "c":
+                self.logger.debug("Received command: %s", body)
+                if "s" in flags:
+                    return self.handle_stream_command(body, flags, request_id)
+                response = self.encode_response(self.handle_command(body), flags)
+            elif request_type == "k":
+                return self.handle_nack(body)
             else:
-                arglist = []
-            self.logger.debug("Action: %s, Args: %s", action, arglist)
-            return self.handle_action(action, arglist)
-        elif data[0] == "q":
-            parameter = data[1]
-            self.logger.debug("Received query for parameter: %s", parameter)
-            return self.handle_query(parameter)
-        elif data[0] == "c":
-            command = ":".join(data[1:] )  # Properly handle commands with colons
-            self.logger.debug("Received command: %s", command)
-            return self.handle_command(command)
-        self.logger.debug("Unknown data: %s", data)
+                return self.logger.debug("Unknown data: %s", data)
+        except (ActionNotFoundError, QueryNotFoundError) as e:
+            self.logger.error(e)
+            response = str(e)
+        if "m" in flags:
+            return self.multicast_reply(response, request_id, reply_at)
+        response = self.tag_response(response, request_id)
+        if "r" in flags:
+            return self.send_chunked(response, self.reply_priority(request_type))
+        return response
+
+    def tag_response(self, response, request_id: str):
+        """Adds the request ID to the response, in the frame header or as a "#<id>:" text prefix"""
+        if not request_id or response is None:
+            return response
+        if isinstance(response, bytes):
+            return with_request_id(response, int(request_id, 16))
+        if isinstance(response, list):
+            response = ",".join(response)
+        return f"#{request_id}:{response}"
+
+    def slot_time(self) -> float:
+        """Returns the length of a multicast reply slot, the time to write one packet to the module and send it"""
+        return self.packet_size * (10 / int(self.serial.baudrate) + 8 / self.air_rate) + self.slot_guard
+
+    def multicast_slot(self, target: str) -> int | None:
+        """Returns the reply slot of this node for a multicast target, None if this node is not a target.
+        Targets are hostnames separated by "+", or "*<slots>" for all nodes, which pick a random slot.
+        Requests for more than max_slots slots are ignored, so a request can't keep the node waiting indefinitely."""
+        if target.startswith("*"):
+            try:
+                if 0 < (slots := int(target[1:] or 1)) <= self.max_slots:
+                    return randrange(slots)
+            except ValueError:
+                pass
+            self.metrics.count("invalid_requests")
+            return self.logger.warning("Invalid multicast slot count: %s", target)
+        if self.hostname in (targets := target.split("+")[: self.max_slots]):
+            return targets.index(self.hostname)
+
+    def multicast_reply(self, response, request_id: str, reply_at: float) -> str:
+        """Waits for the start of this node's reply slot, returns the response tagged with the hostname.
+        A slot only fits one packet, longer responses are replaced with an error so they don't overrun the slot."""
+        if isinstance(response, list):
+            response = ",".join(response)
+        head = f"@{self.hostname}#{request_id}" if request_id else f"@{self.hostname}"
+        reply = f"{head}:{'' if response is None else response}"
+        if (size := len(self.encode_message(reply))) > self.packet_size:
+            self.metrics.count("multicast_too_long")
+            self.logger.warning("Multicast reply does not fit in a slot, %d bytes: %s", size, reply)
+            reply = f"{head}:Reply too long for a multicast slot: {size} bytes"
+        sleep(max(0.0, reply_at - monotonic()))
+        self.metrics.count("multicast_replies")
+        return reply
+
+    def cached_query(self, parameter: str, flags: str):
+        """Runs the query and encodes the response, using the query cache if enabled"""
+
+        def render():
+            if "," in parameter:
+                return self.encode_response(self.handle_batch_query(parameter.split(",")), flags, BATCH)
+            return self.encode_response(self.handle_query(parameter), flags, QUERY_TYPES.get(parameter, TEXT))
+
+        if not self.cache:
+            return render()
+        return self.cache.get(parameter, flags, render)
+
+    def encode_response(self, response, flags: str, frame_type=TEXT):
+        """Encodes the response as a binary frame if the "f" flag was set, otherwise returns it unchanged.
+        Short single line responses are left as text when the frame header would make them larger."""
+        if "f" not in flags or response is None:
+            return response
+        frame = encode_frame(response, frame_type)
+        text = ",".join(response) if isinstance(response, list) else response
+        if "\n" not in text and len(frame) > len(text.encode()) + 1:
+            return response
+        return frame
 
     @contextmanager
     def aux_ready(self, low_time=10):
@@ -157,61 +390,170 @@ class LoRanger(Queries, Actions):
         low_s = low_time / 1000
 
         self.logger.debug("Checking AUX pin: %s", self.aux_pin.number)
-        while self.aux_pin.value:  # First wait for the AUX pin to go low
-            self.logger.debug("AUX pin is high, waiting for it to go low")
-            with self.aux_pin.on_fall() as val:
-                if val:
-                    self.logger.debug("AUX pin went low")
-                    break  # The pin is low
-
+        wait_start = perf_counter()
         begin_time = time()
-        start_time = begin_time
-        while start_time + low_s > time():
+        while True:
+            while self.aux_pin.value:  # First wait for the AUX pin to go low
+                self.logger.debug("AUX pin is high, waiting for it to go low")
+                with self.aux_pin.on_fall(1) as val:
+                    if val:
+                        self.logger.debug("AUX pin went low")
+            start_time = time()
             with self.aux_pin.on_rise(low_s) as val:
-                if val:  # The pin went high, reset the timer
-                    self.logger.debug("AUX pin went high after %s", time() - start_time)
-                    start_time = time()
+                # The level is checked too, the pin may have gone high before the edge was watched
+                if not val and not self.aux_pin.value:
+                    break
+            self.logger.debug("AUX pin went high after %s, waiting for it to go low", time() - start_time)
         self.logger.debug("AUX pin is low, sending data. Elapsed time: %s", time() - begin_time)
+        self.metrics.observe("aux_ready", perf_counter() - wait_start)
         yield
 
-    def chunk_data(self, data: bytes, chunk_size: int = None):
-        """Chunks the data into chunks of chunk_size"""
-        packet_size = chunk_size or self.packet_size
-        for i in range(0, len(data), packet_size):
-            yield data[i : i + packet_size]
-
-    def send_msg(self, response: str):
-        """Sends the message to the serial port
-        If the aux pin is not defined, there may be data loss.
-        """
+    def encode_message(self, response, terminate=True) -> bytes:
+        """Encodes a response for sending, binary frames are used as-is,
+        text is newline terminated unless terminate is False."""
         if isinstance(response, list) and not isinstance(response, str):
             response = ",".join(response)
-        if not response.endswith("\n"):
-            response += "\n"
-        response = response.encode()
+        if isinstance(response, str):
+            if terminate and not response.endswith("\n"):
+                response += "\n"
+            response = response.encode()
+        return response
+
+    def link_ready(self) -> bool:
+        """Returns False if the link is down or the module is powered off"""
+        return self.link_up and not (self.power_pin and not self.power_pin.value)
+
+    def link_down(self, error):
+        """Marks the link as down after a failed write, messages are journaled until it recovers"""
+        self.logger.warning("Link is down, journaling messages: %s", error)
+        self.metrics.count("link_down")
+        self.link_up = False
+
+    def journal_message(self, message: bytes):
+        """Journals a message which could not be sent, messages too large for the journal are dropped"""
+        try:
+            sequence = self.journal.append(message)
+        except ValueError as e:
+            self.metrics.count("journal_dropped")
+            return self.logger.error(e)
+        self.metrics.count("journaled")
+        self.logger.debug("Journaled message %d: %s", sequence, message)
+
+    def replay_journal(self):
+        """Sends journaled messages oldest first, if the link is up.
+        Messages are removed from the journal once they are handed to the module,
+        there are no end to end acknowledgements, so a message may be delivered twice."""
+        with self.journal_lock:
+            while self.link_ready():
+                try:
+                    if (entry := self.journal.first()) is None:
+                        return
+                except JournalError as e:
+                    self.metrics.count("journal_corrupt")
+                    return self.logger.error("Discarding journal: %s", e)
+                sequence, message = entry
+                self.logger.info("Replaying journaled message %d: %s", sequence, message)
+                try:
+                    self.tx_queue.send(message, BULK)
+                except OSError as e:
+                    return self.link_down(e)
+                self.journal.ack(sequence)
+                self.metrics.count("journal_replayed")
+                self.metrics.count("bytes_out", len(message))
+
+    def send_msg(self, response, terminate=True, priority=INTERACTIVE, durable=True):
+        """Sends the message to the serial port
+        Binary frames are sent as-is, text is newline terminated unless terminate is False.
+        If the aux pin is not defined, writes are paced using the estimated module buffer fill.
+        Messages from concurrent senders are sent whole, in order of priority, the timer includes the wait.
+        With a journal, durable messages are journaled while the link is down, and sent after the journaled messages.
+        """
+        response = self.encode_message(response, terminate)
+        if durable and self.journal is not None:
+            self.replay_journal()
+            if not self.link_ready():
+                return self.journal_message(response)
         self.logger.debug("Sending message: %s", response)
 
-        if not self.aux_pin and len(response) > self.packet_size * 2:
-            self.logger.warning("Data loss may occur without AUX pin")
-
-        for chunk in self.chunk_data(response):
-            with self.aux_ready():
-                self.logger.debug("Sending chunk: %s", chunk)
-                self.serial.write(chunk)
+        try:
+            with self.metrics.timer("send_msg"):
+                self.tx_queue.send(response, priority)
+        except OSError as e:
+            if not durable or self.journal is None:
+                raise
+            self.link_down(e)
+            return self.journal_message(response)
+        self.metrics.count("bytes_out", len(response))
+
+    def send_chunked(self, response, priority=INTERACTIVE):
+        """Sends the response as CRC protected chunks, one per packet.
+        Higher priority messages may be sent between the chunks.
+        Returns the response unchanged if it fits in a single packet, or needs too many chunks."""
+        if response is None:
+            return None
+        message = self.encode_message(response)
+        if len(message) <= self.packet_size or (chunks := self.transfers.add(message, self.packet_size)) is None:
+            return response
+        if self.journal is not None and not self.link_ready():  # Journaled whole, and replayed unchunked
+            return self.journal_message(message)
+        self.logger.debug("Sending %d byte response in %d chunks", len(message), len(chunks))
+        with self.metrics.timer("send_msg"):
+            self.tx_queue.send_chunks(chunks, priority)
+        self.metrics.count("bytes_out", sum(len(chunk) for chunk in chunks))
+
+    def handle_nack(self, body: str):
+        """Resends the chunks of a transfer which are set in the bitmap, body is "<transfer>:<bitmap>" """
+        transfer, _, bitmap = body.partition(":")
+        try:
+            chunks = self.transfers.resend(int(transfer, 16), bitmap)
+        except ValueError:
+            return self.logger.warning("Invalid chunk request: %s", body)
+        if not chunks:
+            return self.logger.warning("Cannot resend chunks for unknown transfer: %s", transfer)
+        self.logger.info("Resending %d chunks of transfer: %s", len(chunks), transfer)
+        with self.metrics.timer("send_msg"):
+            self.tx_queue.send_chunks(chunks)
+        self.metrics.count("bytes_out", sum(len(chunk) for chunk in chunks))
 
     def handle_query(self, parameter: str):
         """Runs the specified query and returns the result"""
         if query := getattr(self, f"query_{parameter}", None):
             self.logger.info("Running query: %s", parameter)
-            return query()
+            with self.metrics.timer("handle_query"):
+                return query()
         raise QueryNotFoundError(parameter)
 
+    def handle_delta_query(self, parameter: str, since: str, flags: str):
+        """Runs the query, responds with the changes since the client's version of the response"""
+        if parameter not in DELTA_QUERIES:
+            raise QueryNotFoundError(f"{parameter}~")
+        response = self.cached_query(parameter, "")
+        if isinstance(response, list):
+            response = ",".join(response)
+        return self.encode_response(self.state_versions.respond(parameter, response, since), flags)
+
+    def handle_batch_query(self, parameters: list):
+        """Runs each query, returns the responses as name=value items separated by BATCH_SEPARATOR
+        Unknown queries are reported in their value."""
+        items = []
+        for parameter in parameters:
+            try:
+                response = self.cached_query(parameter, "")
+            except QueryNotFoundError as e:
+                response = str(e)
+            if isinstance(response, list):
+                response = ",".join(response)
+            items.append(f"{parameter}={response}")
+        return BATCH_SEPARATOR.join(items)
+
     def handle_action(self, action_name: str, args: list):
-        """Runs the specified action with the given arguments
+        """Runs the specified action with the given arguments, only names from get_actions can be run
         Raises ActionNotFoundError if the action is not defined"""
-        if action := getattr(self, action_name, None):
+        if action_name in get_actions():
+            action = getattr(self, action_name)
             self.logger.info("Running action: %s with args: %s", action_name, args)
-            return action(*args)
+            with self.metrics.timer("handle_action"):
+                return action(*args)
         raise ActionNotFoundError(action_name)
 
     def handle_command(self, command: str):
@@ -221,7 +563,8 @@ class LoRanger(Queries, Actions):
         self.logger.info("Running command: %s", command)
         arglist = command.split(" ")
         try:
-            ret = run(arglist, capture_output=True, timeout=30)
+            with self.metrics.timer("handle_command"):
+                ret = run(arglist, capture_output=True, timeout=30)
         except TimeoutExpired as e:
             output = e.stdout.decode()
         except FileNotFoundError:
@@ -232,55 +575,324 @@ class LoRanger(Queries, Actions):
 
         return output
 
-    def read_data(self, timeout=None, break_char="\n"):
-        """Attempts to read data from the serial port, stops after read_timeout"""
+    def handle_stream_command(self, command: str, flags: str, request_id: str):
+        """Runs the specified command, sending its output as it is produced.
+        With the "f" flag, each chunk is sent as a frame tagged with the request ID, otherwise as raw text.
+        The chunks joined together are the same as the handle_command response."""
+        from .streaming import stream_output
+
+        self.logger.info("Streaming command: %s", command)
+
+        def encode_chunk(text):
+            return self.tag_response(encode_frame(text), request_id) if "f" in flags else text
+
+        chunk_size = self.packet_size - 8  # Leave room for the frame header and request ID
+        with self.metrics.timer("stream_command"):
+            try:
+                for chunk in stream_output(command.split(" "), chunk_size, timeout=30):
+                    self.send_msg(encode_chunk(chunk), terminate=False, priority=BULK)
+            except FileNotFoundError:
+                self.send_msg(encode_chunk(f"Command not found: {command}"), terminate=False, priority=BULK)
+        self.send_msg(encode_chunk("\x00\x00"), priority=BULK)
+
+    def read_message(self, timeout=None, break_char="\n") -> bytes:
+        """Reads a raw message from the serial port, stops after read_timeout.
+        Chunks and chunk requests restart the timeout, telemetry does not.
+        Incomplete chunked replies are dropped when other data is returned, chunks sent after it are still assembled,
+        and the ones before it are requested again."""
         if self.power_pin and not self.power_pin.value:
             self.logger.warning("Power is off, re-initializing module")
             self.module_startup()
 
         break_char = break_char.encode() if isinstance(break_char, str) else break_char
         timeout = timeout or self.read_timeout
-        current_time = time()
-        data = b""
-        # Loop while the timeout is not reached, or if data is read
-        while time() - current_time < timeout:
-            if chunk := self.serial.read_all():
-                self.logger.debug("Read chunk: %s", chunk)
-                if (
-                    chunk in [b"\xff\xbf"] or chunk.startswith(b"\xff") or chunk.startswith(b"\xbf")
-                ):  # Got junk, reset AUX
-                    self.logger.warning("Got junk data, resetting AUX pin")
-                    self.module_reset()
-                    data = b""
+        deadline = monotonic() + timeout
+        nacks = 0
+        while True:
+            try:
+                data = self.receiver.read_until(break_char, max(deadline - monotonic(), 0.0))
+            except JunkDataError as e:  # Repeated junk which could not be resynchronized, reset the module
+                self.logger.warning("%s, resetting module", e)
+                self.receiver.clear()
+                self.module_reset()
+                continue
+            self.metrics.count("bytes_in", len(data))
+            if is_telemetry(data):  # Pushed by a node, stored and not returned
+                try:
+                    self.logger.debug("Received telemetry from: %s", self.telemetry.add(data))
+                    self.receiver.record_success()
+                except FrameError as e:
+                    self.metrics.count("invalid_frames")
+                    self.logger.warning(e)
+                if monotonic() < deadline:
                     continue
-                data += chunk
-                current_time = time()
-            if break_char and data.endswith(break_char):
-                break
-            sleep(0.001)
+                data = b""
+            if is_chunk(data):
+                deadline = monotonic() + timeout
+                try:
+                    transfer, message, incomplete = self.chunk_assembler.add(data)
+                except FrameError as e:
+                    self.metrics.count("invalid_frames")
+                    self.logger.warning(e)
+                    continue
+                if message is not None:
+                    return message
+                if incomplete and nacks < self.nack_retries:  # The round ended with chunks missing
+                    nacks += 1
+                    self.send_msg(self.address(self.chunk_assembler.nack(transfer)), priority=CONTROL, durable=False)
+                continue
+            if data and not self.link_up:
+                self.logger.info("Link recovered, data received")
+                self.link_up = True
+            if data and self.chunk_assembler.transfers:  # Interrupted transfers, a later one could reuse their ID
+                self.logger.info("Dropping incomplete chunked replies, other data received")
+                self.chunk_assembler.drop()
+            if data or not self.chunk_assembler.transfers:
+                return data
+            if nacks >= self.nack_retries:
+                self.logger.warning("Dropping incomplete chunked replies after %d retries", nacks)
+                self.chunk_assembler.drop()
+                return data
+            nacks += 1  # Timed out waiting for chunks, ask for the missing ones
+            for transfer in list(self.chunk_assembler.transfers):
+                self.send_msg(self.address(self.chunk_assembler.nack(transfer)), priority=CONTROL, durable=False)
+            deadline = monotonic() + timeout
+
+    def decode_message(self, data: bytes):
+        """Decodes a binary frame or text message, returns None if it is empty or invalid"""
+        if is_frame(data):
+            try:
+                data = decode_frame(data)
+            except FrameError as e:
+                self.metrics.count("invalid_frames")
+                self.logger.warning(e)
+                return None
+            self.logger.debug("Decoded frame: %s", data)
+            self.receiver.record_success()
+            return data or None
         # Sanitize first
         try:
             data = data.decode().strip()
         except UnicodeDecodeError:
-            self.logger.warning("Data could not be decoded: %s", data)
-            return self.module_reset()
+            self.metrics.count("undecodable")
+            self.logger.warning("Discarding data which could not be decoded: %s", data)
+            if self.receiver.record_failure():
+                self.module_reset()
+            return None
         if not data:
             return None
         # log and return data if received
         self.logger.debug("Read data: %s", data)
+        self.receiver.record_success()
+        return data
+
+    def read_data(self, timeout=None, break_char="\n"):
+        """Attempts to read data from the serial port, stops after read_timeout
+        Reads which time out are counted, reads which return data are timed.
+        Messages which can't be decoded are counted by decode_message instead."""
+        start = perf_counter()
+        message = self.read_message(timeout, break_char)
+        if data := self.decode_message(message):
+            self.metrics.observe("read_data", perf_counter() - start)
+        elif not message:
+            self.metrics.count("read_timeouts")
         return data
 
+    def read_reply(self, timeout=None, break_char="\n"):
+        """Reads a reply, returns the request ID, or None if the reply has none, and the decoded data.
+        Text command output is read up to its terminator even if the read started with a shorter break_char."""
+        data = self.read_message(timeout, break_char)
+        if is_frame(data):
+            request_id = frame_request_id(data) if frame_size(data) else None
+        elif match := TEXT_REQUEST_ID.match(data):
+            request_id, data = int(match.group(1), 16), data[match.end() :]
+            if self.pipeline.request_type(request_id) == "c" and not data.endswith(b"\x00\x00\n"):
+                data += self.read_message(timeout, "\x00\x00\n")
+        else:
+            request_id = None
+        return request_id, self.decode_message(data)
+
+    def negotiate(self):
+        """Checks which optional protocol features the remote node supports.
+        Nodes without the capabilities query reply with QueryNotFoundError and are used with the text protocol."""
+        capabilities = (self.run_query("capabilities") or "").split(",")
+        self.set_capabilities(capabilities)
+        self.logger.info("Remote node capabilities: %s", capabilities)
+        return capabilities
+
+    def set_capabilities(self, capabilities: list):
+        """Sets which optional protocol features are used, ex: from a node directory"""
+        self.use_frames = "frames" in capabilities
+        self.use_ids = "ids" in capabilities
+        self.use_batch = "batch" in capabilities
+        self.use_stream = "stream" in capabilities and self.use_frames
+        self.use_delta = "delta" in capabilities
+        self.use_chunks = "chunks" in capabilities
+
+    def request_head(self, request_type: str, request_id=None, flags=""):
+        """Returns the request type with the flags and request ID supported by the remote node"""
+        head = f"{request_type}{flags}f" if self.use_frames else f"{request_type}{flags}"
+        if self.use_chunks:
+            head += "r"
+        if self.target:
+            head += f"@{self.target}"
+        return head if request_id is None else f"{head}#{request_id:x}"
+
+    def address(self, request: str) -> str:
+        """Addresses a request to the target node, ex: "k:1:4" -> "k@node1:1:4" """
+        if not self.target:
+            return request
+        head, _, body = request.partition(":")
+        return f"{head}@{self.target}:{body}"
+
+    def send_request(self, request_type: str, body: str, flags=""):
+        """Sends a request, returns its request ID if the remote node supports them"""
+        request_id = self.pipeline.allocate(request_type) if self.use_ids else None
+        self.send_msg(f"{self.request_head(request_type, request_id, flags)}:{body}")
+        return request_id
+
+    def read_replies(self, timeout=None):
+        """Reads one reply and stores it in the pipeline, replies to unknown or expired requests are dropped"""
+        self.pipeline.expire()
+        break_char = "\x00\x00\n" if self.pipeline.only_commands() else "\n"
+        request_id, data = self.read_reply(timeout or self.pipeline.next_timeout(), break_char)
+        if request_id is None:
+            if data and data.startswith("h:") and self.on_hello:
+                self.on_hello(data[2:])
+            elif data:
+                self.logger.debug("Dropping reply without a request ID: %s", data)
+            return
+        if not self.pipeline.complete(request_id, data):
+            self.logger.warning("Dropping stale reply for request %x: %s", request_id, data)
+
+    def run_request(self, request_type: str, body: str, timeout=None, break_char="\n"):
+        """Sends a request and waits for its reply"""
+        if not self.use_ids:
+            self.send_msg(f"{self.request_head(request_type)}:{body}")
+            return self.read_data(timeout=timeout, break_char=break_char)
+
+        request_id = self.send_request(request_type, body)
+        self.pipeline.set_timeout(request_id, timeout or self.read_timeout)
+        while self.pipeline.waiting(request_id):
+            self.read_replies()
+        return self.pipeline.pop(request_id)
+
+    def run_pipelined(self, requests: list, timeout=None) -> list:
+        """Runs a list of (type, body) requests, ex: [("q", "uptime"), ("a", "enable_interface:eth0")]
+        A request may have a third item, its timeout, ex: ("c", "dmesg", 35), others use timeout.
+        Up to pipeline.window requests are in flight at once if the remote node supports request IDs.
+        Returns the replies in request order, None for requests which timed out."""
+        if not self.use_ids:  # Run one at a time, command output is read up to its terminator
+            return [
+                self.run_request(
+                    request_type, body, *request_timeout or [timeout], "\x00\x00\n" if request_type == "c" else "\n"
+                )
+                for request_type, body, *request_timeout in requests
+            ]
+
+        request_ids = []
+        for request_type, body, *request_timeout in requests:
+            while self.pipeline.full():
+                self.read_replies()
+            request_id = self.send_request(request_type, body)
+            self.pipeline.set_timeout(request_id, (request_timeout or [timeout])[0] or self.read_timeout)
+            request_ids.append(request_id)
+        while any(self.pipeline.waiting(request_id) for request_id in request_ids):
+            self.read_replies()
+        return [self.pipeline.pop(request_id) for request_id in request_ids]
+
+    def run_multicast(self, request_type: str, body: str, targets=None, slots=16, timeout=None) -> dict:
+        """Sends one request to a set of nodes, or all nodes if targets is None, and collects their replies.
+        Each target replies in its own slot, nodes answering a request for all nodes pick one of slots at random.
+        Waits until every target replied, or until the deadline after the last slot, plus timeout for processing.
+        Returns a dict of replies by hostname, targets which did not reply are None."""
+        if not 0 < (len(targets) if targets else slots) <= self.max_slots:
+            raise ValueError(f"Multicast requests may use 1 to {self.max_slots} slots")
+        address = "+".join(targets) if targets else f"*{slots}"
+        request_id = self.pipeline.allocate(request_type)
+        self.send_msg(f"{request_type}m@{address}#{request_id:x}:{body}")
+        deadline = monotonic() + (len(targets) if targets else slots) * self.slot_time() + (timeout or self.read_timeout)
+        results = dict.fromkeys(targets or [])
+        pending = set(targets or [])
+        while (targets is None or pending) and (remaining := deadline - monotonic()) > 0:
+            data = self.read_message(remaining)
+            if (match := MULTICAST_REPLY.match(data)) and int(match.group(2), 16) == request_id:
+                hostname = match.group(1).decode(errors="replace")
+                if targets is None or hostname in results:
+                    results[hostname] = self.decode_message(data[match.end() :]) or ""
+                    pending.discard(hostname)
+            elif data.startswith(b"h:") and self.on_hello:
+                self.on_hello(data[2:].decode(errors="replace").strip())
+            elif data:
+                self.logger.debug("Dropping data while waiting for multicast replies: %s", data)
+        self.pipeline.complete(request_id, None)
+        self.pipeline.pop(request_id)
+        if pending:
+            self.metrics.count("multicast_missing", len(pending))
+            self.logger.warning("No multicast reply from: %s", ", ".join(sorted(pending)))
+        return results
+
     def run_query(self, parameter):
         """Runs a query and returns the result"""
-        self.send_msg(f"q:{parameter}")
-        return self.read_data()
+        if self.use_delta and parameter in DELTA_QUERIES:
+            return self.run_delta_query(parameter)
+        return self.run_request("q", parameter)
+
+    def run_delta_query(self, parameter):
+        """Runs a query asking for the changes since the last response, returns the full result.
+        If the changes can't be applied, the full response is requested."""
+        if (reply := self.run_request("q", f"{parameter}~{self.delta_views.since(parameter)}")) is None:
+            return None
+        try:
+            return self.delta_views.update(parameter, reply)
+        except DeltaError as e:
+            self.logger.warning(e)
+            self.delta_views.drop(parameter)
+        if (reply := self.run_request("q", f"{parameter}~")) is not None:
+            return self.delta_views.update(parameter, reply)
+
+    def run_queries(self, parameters: list) -> dict:
+        """Runs several queries, returns a dict of responses by parameter.
+        Uses a single batch query if the remote node supports them, otherwise pipelines the queries."""
+        if not self.use_batch or len(parameters) < 2:
+            return dict(zip(parameters, self.run_pipelined([("q", parameter) for parameter in parameters])))
+        if not (reply := self.run_query(",".join(parameters))):
+            return dict.fromkeys(parameters)
+        return dict(item.partition("=")[::2] for item in reply.split(BATCH_SEPARATOR))
 
     def run_action(self, action, args):
         """Runs an action with the given arguments"""
-        self.send_msg(f"a:{action}:{','.join(args)}")
-        return self.read_data()
+        return self.run_request("a", f"{action}:{','.join(args)}")
+
+    def run_command(self, command: str, timeout=35, callback=None):
+        """Runs a command and returns the result.
+        If a callback is given and the remote node supports streaming, it is called with output as it arrives."""
+        if callback and self.use_stream:
+            return self.stream_command(command, callback, timeout)
+        output = self.run_request("c", command, timeout=timeout, break_char="\x00\x00\n")
+        if callback and output:
+            callback(output.removesuffix("\x00\x00"))
+        return output
 
-    def run_command(self, command: str, timeout=35):
-        """Runs a command and returns the result"""
-        self.send_msg(f"c:{command}")
-        return self.read_data(timeout=timeout, break_char="\x00\x00\n")
+    def stream_command(self, command: str, callback, timeout=35):
+        """Runs a command using streaming output, calls callback with each chunk of output as it arrives.
+        The timeout is reset whenever a chunk is received. Returns the full output."""
+        request_id = self.send_request("c", command, flags="s")
+        output = []
+        while True:
+            reply_id, data = self.read_reply(timeout)
+            if data is None:
+                self.logger.warning("Timed out waiting for command output: %s", command)
+                break
+            if reply_id != request_id:  # Replies to other requests in flight
+                if reply_id is None or not self.pipeline.complete(reply_id, data):
+                    self.logger.warning("Dropping reply while streaming: %s", data)
+                continue
+            output.append(data)
+            if chunk := data.removesuffix("\x00\x00"):
+                callback(chunk)
+            if chunk != data:
+                break
+        self.pipeline.complete(request_id, None)
+        self.pipeline.pop(request_id)
+        return "".join(output)
@@ -0,0 +1,118 @@
+"""Per-stage timing histograms and counters.
+
+Metrics can be written to a Prometheus textfile for the node_exporter textfile collector,
+and are sent compactly in response to "q:metrics".
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from os import replace
+from threading import Event, Lock, Thread
+from time import perf_counter
+
+# Histogram bucket upper bounds in seconds, the last bucket is +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """Counts observations in fixed buckets, the bucket counts are not cumulative"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction: float) -> float:
+        """Returns the upper bound of the bucket containing the quantile, inf if it is in the last bucket"""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Timers and counters for the stages of handling a request.
+    Each observation is a perf_counter call, a bisect and a few additions under an uncontended lock."""
+
+    def __init__(self, prefix="loranger"):
+        self.prefix = prefix
+        self.lock = Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            if (histogram := self.histograms.get(stage)) is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Observes the time spent in the block, including blocks which raise"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, perf_counter() - start)
+
+    def compact(self) -> str:
+        """Returns the metrics as name=value items, histograms are count/mean ms/p99 ms"""
+        with self.lock:
+            items = [f"{name}={value}" for name, value in self.counters.items()]
+            for stage, histogram in self.histograms.items():
+                mean = histogram.sum / histogram.count * 1000
+                items.append(f"{stage}={histogram.count}/{mean:.1f}/{histogram.quantile(0.99) * 1000:g}")
+        return ",".join(items)
+
+    def prometheus(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name, value in self.counters.items():
+                lines += [f"# TYPE {self.prefix}_{name}_total counter", f"{self.prefix}_{name}_total {value}"]
+            if self.histograms:
+                lines.append(f"# TYPE {self.prefix}_stage_seconds histogram")
+            for stage, histogram in self.histograms.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{self.prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{self.prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Writes the metrics to a temporary file then renames it, so the collector never reads a partial file"""
+        with open(f"{path}.tmp", "w") as f:
+            f.write(self.prometheus())
+        replace(f"{path}.tmp", path)
+
+    def start_textfile(self, path: str, interval=15, logger=None, stopped=None) -> Thread:
+        """Writes the textfile every interval seconds in a daemon thread, until the stopped event is set"""
+        stopped = stopped or Event()
+
+        def writer():
+            while True:
+                try:
+                    self.write_textfile(path)
+                except OSError as e:
+                    if logger:
+                        logger.error("Failed to write metrics to %s: %s", path, e)
+                if stopped.wait(interval):
+                    return
+
+        thread = Thread(target=writer, name="metrics-textfile", daemon=True)
+        thread.start()
+        return thread
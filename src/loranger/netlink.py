@@ -0,0 +1,130 @@
+from collections import defaultdict
+from functools import cached_property
+from threading import RLock, Thread
+
+# pyroute2 is imported when netlink is first used, so clients which never run netlink code start faster
+
+ARPHRD_LOOPBACK = 772
+
+
+class NetlinkSnapshot:
+    """A single dump of links, addresses and routes.
+    Each table is dumped the first time it is used, then indexed by ifindex and family.
+    """
+
+    def __init__(self, ipr, lock):
+        self.ipr = ipr
+        self.lock = lock
+
+    @cached_property
+    def links(self) -> dict:
+        """Links by ifindex"""
+        with self.lock:
+            return {link["index"]: link for link in self.ipr.get_links()}
+
+    @cached_property
+    def addresses(self) -> dict:
+        """Addresses by (ifindex, family)"""
+        addresses = defaultdict(list)
+        with self.lock:
+            for addr in self.ipr.get_addr():
+                addresses[(addr["index"], addr["family"])].append(addr)
+        return addresses
+
+    @cached_property
+    def routes(self) -> list:
+        with self.lock:
+            return list(self.ipr.get_routes())
+
+    def interfaces(self):
+        """Yields (ifindex, name) for all non-loopback links"""
+        for index, link in self.links.items():
+            if link["ifi_type"] != ARPHRD_LOOPBACK:
+                yield index, link.get_attr("IFLA_IFNAME")
+
+    def ifname(self, index: int) -> str | None:
+        if link := self.links.get(index):
+            return link.get_attr("IFLA_IFNAME")
+
+    def link_index(self, ifname: str) -> int:
+        """Returns the ifindex of the named link, raises IndexError if it does not exist"""
+        for index, link in self.links.items():
+            if link.get_attr("IFLA_IFNAME") == ifname:
+                return index
+        raise IndexError(ifname)
+
+    def get_addresses(self, index: int, family: int) -> list:
+        return self.addresses.get((index, family), [])
+
+
+class Netlink:
+    """Mixin for a long lived netlink session shared by queries and actions."""
+
+    netlink_lock = RLock()
+
+    @cached_property
+    def ipr(self):
+        """The netlink session, opened on first use"""
+        from pyroute2 import IPRoute
+
+        with self.netlink_lock:
+            return IPRoute()
+
+    @property
+    def netlink_error(self):
+        """The pyroute2 NetlinkError exception type"""
+        from pyroute2.netlink.exceptions import NetlinkError
+
+        return NetlinkError
+
+    def netlink_snapshot(self) -> NetlinkSnapshot:
+        """Returns a new snapshot using the shared netlink session"""
+        return NetlinkSnapshot(self.ipr, self.netlink_lock)
+
+    def close_netlink(self):
+        """Closes the netlink session, it will be reopened when next used"""
+        with self.netlink_lock:
+            if ipr := self.__dict__.pop("ipr", None):
+                ipr.close()
+
+
+class NetlinkMonitor(Thread):
+    """Listens for link, address and route netlink events and passes the changed table name to the callback."""
+
+    tables = {
+        "RTM_NEWLINK": "link",
+        "RTM_DELLINK": "link",
+        "RTM_NEWADDR": "addr",
+        "RTM_DELADDR": "addr",
+        "RTM_NEWROUTE": "route",
+        "RTM_DELROUTE": "route",
+    }
+
+    def __init__(self, callback, logger):
+        super().__init__(name="netlink-monitor", daemon=True)
+        self.callback = callback
+        self.logger = logger
+
+    def run(self):
+        """Opens the netlink socket in this thread, pyroute2 sockets must be used by the thread which opened them"""
+        try:
+            from pyroute2 import IPRoute
+            from pyroute2.netlink.rtnl import (
+                RTMGRP_IPV4_IFADDR,
+                RTMGRP_IPV4_ROUTE,
+                RTMGRP_IPV6_IFADDR,
+                RTMGRP_IPV6_ROUTE,
+                RTMGRP_LINK,
+            )
+
+            groups = RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_ROUTE
+            with IPRoute() as ipr:
+                ipr.bind(groups=groups)
+                while True:
+                    tables = {self.tables.get(message.get("event")) for message in ipr.get()} - {None}
+                    for table in tables:
+                        self.logger.debug("Netlink %s table changed", table)
+                        self.callback(table)
+        except Exception as e:
+            self.logger.error("Netlink monitor failed, invalidating all entries: %s", e)
+            self.callback(None)
@@ -0,0 +1,73 @@
+from time import monotonic
+
+
+class RequestPipeline:
+    """Correlation table for requests in flight.
+
+    Request IDs are allocated from an 8 bit counter, and up to window requests may be in flight at once.
+    Replies are matched to their request by ID. Requests expire after their timeout,
+    replies which arrive for expired or unknown requests are counted as stale and dropped.
+    """
+
+    def __init__(self, window=4):
+        self.window = window
+        self.next_id = 0
+        self.in_flight = {}  # request_id: [request_type, deadline]
+        self.replies = {}  # request_id: reply, None if the request expired
+        self.stale = self.expired = 0
+
+    def allocate(self, request_type: str) -> int:
+        """Allocates a request ID, skipping IDs which are still in use"""
+        for _ in range(0x100):
+            request_id, self.next_id = self.next_id, (self.next_id + 1) & 0xFF
+            if request_id not in self.in_flight and request_id not in self.replies:
+                self.in_flight[request_id] = [request_type, float("inf")]
+                return request_id
+        raise RuntimeError("No free request IDs")
+
+    def set_timeout(self, request_id: int, timeout: float):
+        """Starts the timeout for a request, should be called once it has been sent"""
+        self.in_flight[request_id][1] = monotonic() + timeout
+
+    def request_type(self, request_id: int) -> str | None:
+        if request := self.in_flight.get(request_id):
+            return request[0]
+
+    def full(self) -> bool:
+        self.expire()
+        return len(self.in_flight) >= self.window
+
+    def only_commands(self) -> bool:
+        """True if all requests in flight are commands, which use a longer terminator"""
+        return bool(self.in_flight) and all(request[0] == "c" for request in self.in_flight.values())
+
+    def next_timeout(self) -> float:
+        """Returns the time until the next request expires"""
+        deadline = min((request[1] for request in self.in_flight.values()), default=monotonic())
+        return max(deadline - monotonic(), 0.01)
+
+    def expire(self):
+        """Expires requests past their deadline, their reply is set to None"""
+        now = monotonic()
+        for request_id, (_, deadline) in list(self.in_flight.items()):
+            if deadline <= now:
+                del self.in_flight[request_id]
+                self.replies[request_id] = None
+                self.expired += 1
+
+    def complete(self, request_id: int, reply) -> bool:
+        """Stores the reply for a request in flight, returns False if the reply is stale"""
+        if self.in_flight.pop(request_id, None) is None:
+            self.stale += 1
+            return False
+        self.replies[request_id] = reply
+        return True
+
+    def waiting(self, request_id: int) -> bool:
+        """True if the request has not been answered or expired"""
+        self.expire()
+        return request_id in self.in_flight
+
+    def pop(self, request_id: int):
+        """Returns and removes the reply for a request, None if it expired"""
+        return self.replies.pop(request_id, None)
@@ -1,12 +1,17 @@
-from pyroute2 import IPRoute
+from os import uname
+from socket import AF_INET, AF_INET6
+
+from .netlink import Netlink
+
+RTN_UNICAST = 1
 
 
 def get_queries():
     """Gets the names of all actions in this module."""
-    return [name for name in dir(Queries) if not name.startswith("__")]
+    return [name for name in dir(Queries) if not name.startswith("_") and name not in dir(Netlink)]
 
 
-class Queries:
+class Queries(Netlink):
     """Mixins for queries.
     Actions are run in response to q:param.
     """
@@ -15,67 +20,82 @@ class Queries:
         """Gets the names of all actions in this module."""
         return get_queries()
 
+    def query_metrics(self):
+        """Gets the request stage timers and counters."""
+        if metrics := getattr(self, "metrics", None):
+            return metrics.compact()
+        return "disabled"
+
+    def query_cache(self):
+        """Gets the query cache statistics."""
+        if cache := getattr(self, "cache", None):
+            return ",".join(f"{name}={value}" for name, value in cache.stats().items())
+        return "disabled"
+
+    def query_transmit(self):
+        """Gets the transmit statistics, including the effective rate relative to the baud rate,
+        and the depth of the transmit queue."""
+        if transmitter := getattr(self, "transmitter", None):
+            stats = transmitter.stats() | self.tx_queue.stats()
+            return ",".join(f"{name}={value:g}" for name, value in stats.items())
+        return "disabled"
+
+    def query_retransmit(self):
+        """Gets the chunked reply statistics, including the bytes saved by resending only missing chunks."""
+        if transfers := getattr(self, "transfers", None):
+            return ",".join(f"{name}={value}" for name, value in transfers.stats().items())
+        return "disabled"
+
+    def query_journal(self):
+        """Gets the outbound journal statistics, including the messages waiting for the link to recover."""
+        if (journal := getattr(self, "journal", None)) is not None:
+            return ",".join(f"{name}={value}" for name, value in journal.stats().items())
+        return "disabled"
+
+    def query_capabilities(self):
+        """Gets the optional protocol features supported by this node."""
+        return "frames,ids,batch,stream,delta,chunks,address,multicast"
+
     def query_interfaces(self):
         """Gets all interfaces of the current machine."""
-        with IPRoute() as ipr:
-            return [link.get_attr("IFLA_IFNAME") for link in ipr.get_links() if link["ifi_type"] != 772]
+        return [name for _, name in self.netlink_snapshot().interfaces()]
 
     def query_hostname(self):
-        """Gets the hostname of the current machine."""
-        from os import uname
+        """Gets the hostname this node announces, and answers addressed requests for."""
+        return getattr(self, "hostname", None) or uname().nodename
 
-        return uname()[1]
+    def _query_addresses(self, family):
+        """Gets all addresses of the given family by interface name."""
+        snapshot = self.netlink_snapshot()
+        out_str = ""
+        for index, name in snapshot.interfaces():
+            addresses = ",".join(
+                f"{addr.get_attr('IFA_ADDRESS')}/{addr['prefixlen']}" for addr in snapshot.get_addresses(index, family)
+            )
+            out_str += f"{name}[{addresses}]"
+        return out_str
 
     def query_ip4(self):
         """Gets all IP addresses of the current machine."""
-        out_str = ""
-        with IPRoute() as ipr:
-            for interface in ipr.get_links():
-                if interface["ifi_type"] == 772:
-                    continue
-                out_str += f"{interface.get_attr('IFLA_IFNAME')}["
-                out_str += ",".join(
-                    f"{addr.get_attr("IFA_ADDRESS")}/{addr["prefixlen"]}"
-                    for addr in ipr.get_addr(index=interface["index"])
-                    if addr["family"] == 2
-                )
-                out_str += "]"
-        return out_str
+        return self._query_addresses(AF_INET)
 
     def query_ip6(self):
         """Gets all IPv6 addresses of the current machine."""
-        out_str = ""
-        with IPRoute() as ipr:
-            for interface in ipr.get_links():
-                if interface["ifi_type"] == 772:
-                    continue
-                out_str += f"{interface.get_attr('IFLA_IFNAME')}["
-                out_str += ",".join(
-                    f"{addr.get_attr("IFA_ADDRESS")}/{addr["prefixlen"]}"
-                    for addr in ipr.get_addr(index=interface["index"])
-                    if addr["family"] == 10
-                )
-                out_str += "]"
-        return out_str
+        return self._query_addresses(AF_INET6)
 
     def query_routes(self):
         """Gets all routes of the current machine."""
-        with IPRoute() as ipr:
-            return [
-                f"{ipr.get_links(route.get_attr("RTA_OIF"))[0].get_attr('IFLA_IFNAME')}[{route.get_attr("RTA_DST")}/{route["dst_len"]}]"
-                for route in ipr.get_routes()
-                if route.get_attr("RTA_DST") is not None and route["family"] == 2 and route["type"] == 1
-            ]
+        snapshot = self.netlink_snapshot()
+        return [
+            f"{snapshot.ifname(route.get_attr('RTA_OIF'))}[{route.get_attr('RTA_DST')}/{route['dst_len']}]"
+            for route in snapshot.routes
+            if route.get_attr("RTA_DST") is not None and route["family"] == AF_INET and route["type"] == RTN_UNICAST
+        ]
 
     def query_macs(self):
         """Gets all MAC addresses of the current machine."""
-        out_str = ""
-        with IPRoute() as ipr:
-            for interface in ipr.get_links():
-                if interface["ifi_type"] == 772:
-                    continue
-                out_str += f"{interface.get_attr('IFLA_IFNAME')}[{interface.get_attr('IFLA_ADDRESS')}]"
-        return out_str
+        snapshot = self.netlink_snapshot()
+        return "".join(f"{name}[{snapshot.links[index].get_attr('IFLA_ADDRESS')}]" for index, name in snapshot.interfaces())
 
     def query_uptime(self):
         """Gets the uptime of the current machine."""
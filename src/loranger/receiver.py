@@ -0,0 +1,197 @@
+from selectors import EVENT_READ, DefaultSelector
+from time import monotonic, process_time
+
+from serial import SerialException
+
+from .framing import COMPRESSED, FRAME_MAGIC, REQUEST_ID, TELEMETRY, frame_size, is_frame
+from .metrics import Metrics
+
+
+class JunkDataError(Exception):
+    def __str__(self):
+        return f"Got junk data: {self.args[0]}"
+
+
+class Receiver:
+    """Event driven receive engine for a serial port.
+
+    Blocks on the serial file descriptor until data is available instead of polling,
+    appends into a single reusable buffer, and only searches newly received data for the terminator.
+    Bytes received after the terminator are kept for the next read.
+
+    Junk and corrupt frames are discarded up to the next message boundary, the next frame magic or newline,
+    so messages after them are still received. JunkDataError is only raised once max_failures
+    junk spans are found without a good message in between, so the caller can reset the module.
+    The caller marks good messages with record_success once they are decoded.
+    """
+
+    junk_prefixes = (b"\xff", b"\xbf")
+    max_failures = 5
+
+    def __init__(self, serial, logger, metrics=None):
+        self.serial = serial
+        self.logger = logger
+        self.metrics = metrics or Metrics()
+        self.failures = 0  # Junk spans since the last good message
+        self.buffer = bytearray()
+        self.selector = None
+        try:
+            self.selector = DefaultSelector()
+            self.selector.register(serial.fileno(), EVENT_READ)
+        except (AttributeError, OSError, ValueError):  # Not backed by a file descriptor, use serial timeouts
+            self.selector = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Resets the receive statistics"""
+        self.frames = 0
+        self.bytes_read = 0
+        self.reads = 0
+        self.wait_time = 0.0  # Wall time spent in read_until
+        self.cpu_time = 0.0  # Process CPU time spent in read_until
+        self.latency_total = 0.0  # Time from the first byte of a frame to the terminator
+        self.latency_max = 0.0
+
+    def stats(self) -> dict:
+        """Returns receive statistics, idle_cpu is the fraction of a core used while waiting for data"""
+        return {
+            "frames": self.frames,
+            "bytes": self.bytes_read,
+            "reads": self.reads,
+            "idle_cpu": self.cpu_time / self.wait_time if self.wait_time else 0.0,
+            "latency_avg": self.latency_total / self.frames if self.frames else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+    def clear(self):
+        """Drops any buffered data"""
+        self.buffer.clear()
+
+    def wait(self, timeout: float) -> bool:
+        """Blocks until data is available or the timeout expires.
+        Raises SerialException if the port is readable without data, the device hung up or was disconnected."""
+        if self.serial.in_waiting:
+            return True
+        if self.selector:
+            if not self.selector.select(timeout):
+                return False
+            if not self.serial.in_waiting:  # Would be readable again immediately, polling until the deadline
+                raise SerialException("Serial port is readable but returned no data, the device hung up")
+            return True
+        self.serial.timeout = timeout
+        if chunk := self.serial.read(1):
+            self.buffer += chunk
+            self.bytes_read += len(chunk)
+            return True
+        return False
+
+    def read_chunk(self, timeout: float) -> int:
+        """Waits up to timeout for data, then appends everything available to the buffer.
+        Returns the number of bytes read, junk at the start of the chunk is discarded.
+        Raises JunkDataError if junk has been found too many times without a good message."""
+        start = len(self.buffer)
+        if not self.wait(timeout):
+            return len(self.buffer) - start
+        if waiting := self.serial.in_waiting:
+            self.buffer += self.serial.read(waiting)
+            self.bytes_read += waiting
+        self.reads += 1
+        chunk = self.buffer[start:]
+        if not is_frame(self.buffer) and chunk.startswith(self.junk_prefixes):  # Frame payloads may contain any byte
+            self.logger.warning("Discarding junk data: %s", bytes(chunk))
+            self.resync(start)
+            if self.record_failure():
+                raise JunkDataError(bytes(chunk))
+            return len(self.buffer) - start
+        self.logger.debug("Read chunk: %s", chunk)
+        return len(chunk)
+
+    def resync(self, start: int) -> int:
+        """Discards the buffer from start up to the next frame magic, or the byte after the next newline.
+        Returns the number of bytes discarded."""
+        buffer = self.buffer
+        end = len(buffer)
+        if (magic := buffer.find(FRAME_MAGIC, start + 1)) != -1:
+            end = magic
+        if (newline := buffer.find(b"\n", start)) != -1:
+            end = min(end, newline + 1)
+        del buffer[start:end]
+        self.metrics.count("resyncs")
+        self.metrics.count("junk_bytes", end - start)
+        return end - start
+
+    def record_failure(self) -> bool:
+        """Records a junk span, or data which could not be decoded,
+        returns True if there have been max_failures of them without a good message in between"""
+        self.failures += 1
+        if self.failures < self.max_failures:
+            return False
+        self.failures = 0
+        self.metrics.count("escalations")
+        return True
+
+    def record_success(self):
+        """Records a message which was decoded, junk and undecodable data before it are forgiven"""
+        self.failures = 0
+
+    def valid_header(self) -> bool:
+        """Checks the type and flags of the frame at the start of the buffer, if they have been received"""
+        if len(self.buffer) < 3:
+            return True
+        return self.buffer[1] <= TELEMETRY and not self.buffer[2] & ~(COMPRESSED | REQUEST_ID)
+
+    def frame_end(self, terminator: bytes, search_from: int) -> int:
+        """Returns the end offset of the first message in the buffer, or -1 if it is incomplete.
+        Binary frames end after their encoded length, text messages end after the terminator."""
+        while is_frame(self.buffer) and not self.valid_header():
+            self.logger.warning("Discarding corrupt frame header: %s", bytes(self.buffer[:3]))
+            self.resync(0)
+            search_from = 0
+            if self.record_failure():
+                raise JunkDataError(bytes(self.buffer[:3]))
+        if is_frame(self.buffer):
+            size = frame_size(self.buffer)
+            return size if size is not None and size <= len(self.buffer) else -1
+        if terminator and (index := self.buffer.find(terminator, search_from)) != -1:
+            return index + len(terminator)
+        return -1
+
+    def read_until(self, terminator: bytes, timeout: float) -> bytes:
+        """Reads until the terminator or a complete binary frame is received,
+        or no data has been received for timeout seconds.
+        Returns everything up to and including the terminator, or all buffered data on timeout."""
+        buffer = self.buffer
+        search_from = 0
+        wall_start, cpu_start = monotonic(), process_time()
+        first_byte = wall_start if buffer else None
+        deadline = wall_start + timeout
+        try:
+            while True:
+                if (end := self.frame_end(terminator, search_from)) != -1:
+                    data = bytes(buffer[:end])
+                    del buffer[:end]
+                    latency = monotonic() - first_byte
+                    self.frames += 1
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+                    return data
+                if terminator:  # Only search the tail which could not contain a full terminator
+                    search_from = max(0, len(buffer) - len(terminator) + 1)
+                if (remaining := deadline - monotonic()) <= 0:
+                    if is_frame(buffer):  # The frame never completed, its length was corrupt or packets were lost
+                        self.logger.warning("Discarding incomplete frame: %s", bytes(buffer[:16]))
+                        self.resync(0)
+                        search_from = 0
+                        if self.record_failure():
+                            raise JunkDataError(bytes(buffer[:16]))
+                        continue
+                    break
+                if self.read_chunk(remaining):
+                    first_byte = first_byte or monotonic()
+                    deadline = monotonic() + timeout  # The timeout is reset whenever data is received
+            data = bytes(buffer)
+            buffer.clear()
+            return data
+        finally:
+            self.wait_time += monotonic() - wall_start
+            self.cpu_time += process_time() - cpu_start
@@ -1,23 +1,50 @@
 from zenlib.util import get_kwargs
 
 from loranger import BASE_ARGS, LoRanger
+from loranger.directory import NodeDirectory
+from loranger.scheduler import AirtimeBudget, PollScheduler
 
 
 def main():
-    args = BASE_ARGS
+    args = BASE_ARGS + [
+        {"flags": ["--node", "-n"], "help": "Node hostname to poll before its hello is heard", "action": "append"},
+        {"flags": ["--query", "-q"], "help": "Query to poll, defaults to uptime", "action": "append"},
+        {"flags": ["--interval"], "help": "Seconds between polls of each node", "action": "store", "default": 60},
+        {
+            "flags": ["--duty-cycle"],
+            "help": "Fraction of each hour the channel may be used by polls",
+            "action": "store",
+            "default": 0.01,
+            "dest": "duty_cycle",
+        },
+    ]
 
     kwargs = get_kwargs(package="loranger", description="loranger", arguments=args)
     console = kwargs.pop("console")
     baud = kwargs.pop("baud")
     logger = kwargs.pop("logger")
-    client = LoRanger(console=console, baud=baud, logger=logger, read_timeout=1)
+    air_rate = int(kwargs.pop("air_rate", 2400))
+    client = LoRanger(
+        console=console, baud=baud, logger=logger, read_timeout=5, air_rate=air_rate, cache_queries=False
+    )
+
+    directory = NodeDirectory(interval=float(kwargs.pop("interval", 60)))
+    budget = AirtimeBudget(air_rate, duty_cycle=float(kwargs.pop("duty_cycle", 0.01)))
+    scheduler = PollScheduler(client, directory, kwargs.pop("query", None) or ["uptime"], budget)
+    client.on_hello = scheduler.hello  # Hellos read while waiting for poll replies
+    for hostname in kwargs.pop("node", None) or []:
+        scheduler.hello(hostname)
 
     while True:
         try:
-            if data := client.read_data():
-                data = data.split(":")
-                if data[0] == "h":
-                    hostname = data[1]
-                    print(f"Received hello from: {hostname}")
+            if (wait := scheduler.next_wait()) > 0:
+                if data := client.read_data(timeout=min(wait, 1)):
+                    data = data.split(":")
+                    if data[0] == "h":
+                        hostname = data[1]
+                        print(f"Received hello from: {hostname}")
+                        scheduler.hello(hostname)
+            elif node := scheduler.poll_next():
+                print(f"{node}: {node.state}")
         except KeyboardInterrupt:
             break
@@ -0,0 +1,162 @@
+"""Polls the nodes of a node directory within a channel airtime budget.
+
+Requests are addressed to one node at a time, and only one poll is in flight,
+so replies from different nodes never collide.
+"""
+
+from collections import deque
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic
+
+from .directory import Node, NodeDirectory
+
+REQUEST_OVERHEAD = 16  # Estimated bytes of request head, address and terminator
+
+
+class AirtimeBudget:
+    """Channel airtime used in a sliding window, limited to duty_cycle of the window.
+    Airtime is estimated from the bytes sent and received at the air data rate."""
+
+    def __init__(self, air_rate=2400, duty_cycle=0.01, window=3600):
+        self.byte_time = 8 / air_rate
+        self.window = window
+        self.limit = duty_cycle * window
+        self.spent = deque()  # (time, airtime)
+        self.used = 0.0  # Airtime spent in the window
+
+    def airtime(self, size: int) -> float:
+        return size * self.byte_time
+
+    def expire(self, now: float):
+        while self.spent and self.spent[0][0] <= now - self.window:
+            self.used -= self.spent.popleft()[1]
+
+    def wait(self, airtime: float) -> float:
+        """Returns the seconds until the airtime fits in the budget, 0 if it fits now.
+        Airtime larger than the whole budget fits once nothing else is in the window."""
+        now = monotonic()
+        self.expire(now)
+        if (excess := self.used + airtime - self.limit) <= 0 or not self.spent:
+            return 0.0
+        for spent_at, spent in self.spent:
+            excess -= spent
+            if excess <= 0:
+                break
+        return spent_at + self.window - now
+
+    def spend(self, airtime: float):
+        self.spent.append((monotonic(), airtime))
+        self.used += airtime
+
+    def stats(self) -> dict:
+        self.expire(monotonic())
+        return {"airtime_used": self.used, "airtime_limit": self.limit}
+
+
+class PollScheduler:
+    """Runs the queries on each node of the directory every node.interval seconds.
+
+    Nodes are kept in a heap ordered by when their next poll is due.
+    The next poll runs once it is due and its estimated airtime fits in the budget,
+    so when the budget is short the most overdue node is polled first.
+    Nodes which do not reply are backed off, doubling their interval up to max_backoff,
+    so unreachable nodes do not use the airtime of reachable ones.
+    Heap entries of nodes which were rescheduled are skipped when they are popped.
+    """
+
+    def __init__(self, client, directory: NodeDirectory, queries: list, budget: AirtimeBudget, max_backoff=3600):
+        self.client = client
+        self.logger = client.logger
+        self.directory = directory
+        self.queries = queries
+        self.budget = budget
+        self.max_backoff = max_backoff
+        self.queue = []  # (due, sequence, hostname)
+        self.sequence = count()
+        self.polls = self.failures = 0
+
+    def schedule(self, node: Node, delay=0.0):
+        node.due = monotonic() + delay
+        heappush(self.queue, (node.due, next(self.sequence), node.hostname))
+
+    def hello(self, hostname: str) -> Node:
+        """Records a hello, new nodes and nodes which were backed off are polled as soon as possible"""
+        node = self.directory.seen(hostname)
+        if node.due is None or node.failures:
+            node.failures = 0
+            self.schedule(node)
+        return node
+
+    def next_node(self) -> Node | None:
+        """Returns the node with the next poll, dropping stale heap entries"""
+        while self.queue:
+            due, _, hostname = self.queue[0]
+            if (node := self.directory.get(hostname)) and node.due == due:
+                return node
+            heappop(self.queue)
+
+    def estimate(self, node: Node) -> float:
+        """Estimates the airtime of polling the node, from the size of its last reply"""
+        request = REQUEST_OVERHEAD + sum(len(query) + 1 for query in self.queries)
+        return self.budget.airtime(request + (node.reply_bytes or self.client.packet_size))
+
+    def next_wait(self) -> float:
+        """Returns the seconds until the next poll can run, inf if no polls are scheduled"""
+        if (node := self.next_node()) is None:
+            return float("inf")
+        return max(node.due - monotonic(), self.budget.wait(self.estimate(node)), 0.0)
+
+    def poll_next(self) -> Node | None:
+        """Polls the next node if it is due and fits in the budget, returns the polled node"""
+        if self.next_wait() > 0:
+            return None
+        node = self.next_node()
+        heappop(self.queue)
+        node.due = None
+        self.poll(node)
+        return node
+
+    def channel_bytes(self) -> tuple[int, int]:
+        counters = self.client.metrics.counters
+        return counters.get("bytes_out", 0), counters.get("bytes_in", 0)
+
+    def poll(self, node: Node):
+        """Polls a node, charging the bytes sent and received to the budget, then reschedules it.
+        Nodes which do not support addressed requests are not rescheduled."""
+        sent, received = self.channel_bytes()
+        self.client.target = node.hostname
+        try:
+            results = self.run_queries(node)
+        finally:
+            self.client.target = None
+        sent_after, received_after = self.channel_bytes()
+        self.budget.spend(self.budget.airtime(sent_after - sent + received_after - received))
+        self.polls += 1
+
+        if node.capabilities is not None and "address" not in node.capabilities:
+            return self.logger.warning("Node does not support addressed requests, not polling: %s", node.hostname)
+        if results and any(result is not None for result in results.values()):
+            self.directory.update(node.hostname, results, received_after - received)
+            return self.schedule(node, node.interval)
+        self.failures += 1
+        node.failures += 1
+        backoff = min(node.interval * 2**node.failures, self.max_backoff)
+        self.logger.warning("No reply from node %s, next poll in %ds", node.hostname, backoff)
+        self.schedule(node, backoff)
+
+    def run_queries(self, node: Node) -> dict | None:
+        """Runs the queries on the client's target node, checking its capabilities on the first poll"""
+        if node.capabilities is None:
+            self.client.set_capabilities([])
+            if (reply := self.client.run_query("capabilities")) is None:
+                return None
+            node.capabilities = reply.split(",")
+            self.logger.info("[%s] Capabilities: %s", node.hostname, node.capabilities)
+        if "address" not in node.capabilities:
+            return None
+        self.client.set_capabilities(node.capabilities)
+        return self.client.run_queries(self.queries)
+
+    def stats(self) -> dict:
+        return {"nodes": len(self.directory), "polls": self.polls, "failures": self.failures} | self.budget.stats()
@@ -4,7 +4,52 @@ from loranger import BASE_ARGS, LoRanger
 
 
 def main():
-    args = BASE_ARGS
+    args = BASE_ARGS + [
+        {"flags": ["--async"], "help": "Handle requests concurrently", "action": "store_true", "dest": "use_async"},
+        {"flags": ["--workers"], "help": "Number of worker threads in async mode", "action": "store", "default": 4},
+        {
+            "flags": ["--metrics-file"],
+            "help": "Prometheus textfile to write metrics to",
+            "action": "store",
+            "dest": "metrics_file",
+        },
+        {
+            "flags": ["--duty-cycle"],
+            "help": "Fraction of time the module may transmit, ex: 0.01 for 1%",
+            "action": "store",
+            "dest": "duty_cycle",
+        },
+        {
+            "flags": ["--telemetry-interval"],
+            "help": "Seconds between telemetry pushes, disabled by default",
+            "action": "store",
+            "dest": "telemetry_interval",
+        },
+        {
+            "flags": ["--telemetry-fields"],
+            "help": "Telemetry fields to push, comma separated, from: uptime,load,interfaces",
+            "action": "store",
+            "default": "uptime,load,interfaces",
+            "dest": "telemetry_fields",
+        },
+        {
+            "flags": ["--journal"],
+            "help": "File to journal messages to while the link is down, they are sent once it recovers",
+            "action": "store",
+        },
+        {
+            "flags": ["--journal-size"],
+            "help": "Size of the journal file in bytes, the oldest messages are dropped when it is full",
+            "action": "store",
+            "default": 65536,
+            "dest": "journal_size",
+        },
+    ]
     kwargs = get_kwargs(package="loranger", description="loranger", arguments=args)
+    use_async = kwargs.pop("use_async", False)
+    workers = int(kwargs.pop("workers", 4))
     loranger = LoRanger(**kwargs)
-    loranger.runloop()
+    if use_async:
+        loranger.async_runloop(workers)
+    else:
+        loranger.runloop()
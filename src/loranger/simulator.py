@@ -0,0 +1,215 @@
+"""Simulated E220 radio link for tests and benchmarks.
+
+Each end of the link is a pty, LoRanger opens the slave side as its serial port.
+The simulated module behind each pty buffers bytes from the host, and sends them over the air in packets
+at the air data rate, while a shared channel lock keeps the link half duplex.
+The AUX pin is high while the module has data to send.
+Packets arrive at the other end after their airtime plus the configured latency, and may be lost or corrupted.
+"""
+
+from contextlib import contextmanager
+from os import close, openpty, read, ttyname, write
+from queue import Queue
+from random import Random
+from select import select
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep
+from tty import setraw
+
+
+class SimulatedPin:
+    """Stand-in for sys_gpio.Pin, driven by the simulated module"""
+
+    def __init__(self, number="sim", value=0):
+        self.number = number
+        self.direction = "in"
+        self._value = value
+        self.edges = {0: 0, 1: 0}  # Number of falling and rising edges
+        self.changed = Condition()
+
+    def __str__(self):
+        return f"SimulatedPin({self.number})"
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        with self.changed:
+            if value != self._value:
+                self._value = value
+                self.edges[value] += 1
+                self.changed.notify_all()
+
+    @contextmanager
+    def _on_edge(self, value, timeout=None):
+        with self.changed:
+            edges = self.edges[value]
+            found = self.changed.wait_for(lambda: self.edges[value] != edges, timeout)
+        yield found
+
+    def on_rise(self, timeout=None):
+        return self._on_edge(1, timeout)
+
+    def on_fall(self, timeout=None):
+        return self._on_edge(0, timeout)
+
+
+class SimulatedModule:
+    """One end of the simulated link"""
+
+    def __init__(self, link, name):
+        self.link = link
+        self.name = name
+        self.master, self.slave = openpty()
+        setraw(self.slave)
+        self.port = ttyname(self.slave)
+        self.aux_pin = SimulatedPin(f"{name}-aux")
+        self.buffer = bytearray()
+        self.last_input = monotonic()
+        self.uart_busy = False
+        self.receiving = False
+        self.input_ready = Condition()
+        self.peer = None
+        self.received = Queue()  # (due time, packet) received over the air, in order
+        self.packets = self.lost = self.corrupted = self.overflow = 0
+        self.airtime = 0.0
+        self.closed = False  # Checked before each read and write, closed fd numbers may be reused by another pty
+
+    def start(self):
+        Thread(target=self.receive_from_host, name=f"{self.name}-uart", daemon=True).start()
+        Thread(target=self.transmit, name=f"{self.name}-radio", daemon=True).start()
+        Thread(target=self.send_to_host, name=f"{self.name}-output", daemon=True).start()
+
+    def receive_from_host(self):
+        """Reads bytes written by the host at the UART rate, bytes which don't fit in the buffer are dropped"""
+        while not self.closed:
+            try:
+                data = read(self.master, 16)
+            except OSError:
+                return
+            with self.input_ready:
+                self.receiving = True
+                self.aux_pin.value = 1  # AUX goes high as soon as the module starts receiving
+            sleep(len(data) * 10 / self.link.baud)
+            if self.closed:
+                return
+            try:
+                pending = bool(select([self.master], [], [], 0)[0])  # More bytes are on the way
+            except (OSError, ValueError):
+                return
+            with self.input_ready:
+                room = self.link.buffer_size - len(self.buffer)
+                self.buffer += data[:room]
+                self.overflow += max(0, len(data) - room)
+                self.last_input = monotonic()
+                self.uart_busy = pending
+                self.receiving = False
+                self.input_ready.notify_all()
+
+    def next_packet(self) -> bytes:
+        """Waits for a full packet, or for the host to stop writing for 3 byte times"""
+        idle_time = 30 / self.link.baud
+        with self.input_ready:
+            while True:
+                self.input_ready.wait_for(lambda: self.buffer)
+                idle = monotonic() - self.last_input
+                if len(self.buffer) >= self.link.packet_size or idle >= idle_time and not self.uart_busy:
+                    packet = bytes(self.buffer[: self.link.packet_size])
+                    del self.buffer[: self.link.packet_size]
+                    return packet
+                self.input_ready.wait(idle_time)
+
+    def transmit(self):
+        while True:
+            packet = self.next_packet()
+            airtime = len(packet) * 8 / self.link.air_rate
+            with self.link.channel:  # Half duplex, one packet on the air at a time
+                sleep(airtime)
+            self.packets += 1
+            self.airtime += airtime
+            with self.input_ready:
+                if not self.buffer and not self.receiving:
+                    self.aux_pin.value = 0
+            self.link.deliver(self, packet)
+
+    def send_to_host(self):
+        """Writes received packets to the host in order, once they are due, at the UART rate"""
+        while not self.closed:
+            due, packet = self.received.get()
+            sleep(max(0, due - monotonic()) + len(packet) * 10 / self.link.baud)
+            if self.closed:
+                return
+            try:
+                select([], [self.master], [], 1)
+                write(self.master, packet)
+            except (OSError, ValueError):
+                return
+
+    def close(self):
+        self.closed = True
+        for fd in (self.master, self.slave):
+            try:
+                close(fd)
+            except OSError:
+                pass
+
+
+class SimulatedLink:
+    """A simulated radio link between two hosts.
+    baud is the UART rate, air_rate the air data rate in bits per second,
+    loss and corruption are per packet probabilities."""
+
+    def __init__(
+        self, baud=9600, air_rate=2400, packet_size=200, buffer_size=400, latency=0.0, loss=0.0, corruption=0.0, seed=None
+    ):
+        self.baud = baud
+        self.air_rate = air_rate
+        self.packet_size = packet_size
+        self.buffer_size = buffer_size
+        self.latency = latency
+        self.loss = loss
+        self.corruption = corruption
+        self.random = Random(seed)
+        self.channel = Lock()
+        self.a, self.b = SimulatedModule(self, "a"), SimulatedModule(self, "b")
+        self.a.peer, self.b.peer = self.b, self.a
+
+    def start(self):
+        self.a.start()
+        self.b.start()
+        return self
+
+    def close(self):
+        self.a.close()
+        self.b.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def deliver(self, sender, packet: bytes):
+        """Delivers a packet to the host at the other end, applying latency, loss and corruption"""
+        if self.random.random() < self.loss:
+            sender.lost += 1
+            return
+        if self.random.random() < self.corruption:
+            sender.corrupted += 1
+            packet = bytearray(packet)
+            packet[self.random.randrange(len(packet))] ^= 1 << self.random.randrange(8)
+        sender.peer.received.put((monotonic() + self.latency, bytes(packet)))
+
+    def stats(self) -> dict:
+        return {
+            end.name: {
+                "packets": end.packets,
+                "lost": end.lost,
+                "corrupted": end.corrupted,
+                "overflow": end.overflow,
+                "airtime": end.airtime,
+            }
+            for end in (self.a, self.b)
+        }
@@ -0,0 +1,38 @@
+from codecs import getincrementaldecoder
+from os import read
+from selectors import EVENT_READ, DefaultSelector
+from subprocess import DEVNULL, PIPE, Popen
+from time import monotonic
+
+
+def stream_output(arglist: list, chunk_size: int, timeout=30, flush_interval=0.2):
+    """Runs the command and yields its decoded stdout in chunks of up to chunk_size bytes as soon as they are ready.
+
+    Partial chunks are flushed when no output has been received for flush_interval seconds.
+    Output is read only while the consumer is ready for the next chunk, so at most chunk_size bytes are buffered here,
+    and a slow consumer makes the command block on its stdout pipe.
+    The command is killed after timeout seconds, output read until then is still yielded.
+    Raises FileNotFoundError if the command does not exist.
+    """
+    decoder = getincrementaldecoder("utf-8")(errors="replace")
+    buffer = bytearray()
+    with Popen(arglist, stdout=PIPE, stderr=DEVNULL) as proc, DefaultSelector() as selector:
+        selector.register(proc.stdout, EVENT_READ)
+        deadline = monotonic() + timeout
+        while (remaining := deadline - monotonic()) > 0:
+            if not selector.select(min(remaining, flush_interval)):
+                if buffer and (text := decoder.decode(bytes(buffer))):  # No new output, flush what there is
+                    yield text
+                buffer.clear()
+                continue
+            if not (data := read(proc.stdout.fileno(), chunk_size - len(buffer))):
+                break  # EOF
+            buffer += data
+            if len(buffer) >= chunk_size:
+                if text := decoder.decode(bytes(buffer)):
+                    yield text
+                buffer.clear()
+        else:
+            proc.kill()
+    if tail := decoder.decode(bytes(buffer), final=True):
+        yield tail
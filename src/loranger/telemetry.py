@@ -0,0 +1,199 @@
+"""Telemetry frames pushed by servers, and the ring buffers which keep them on the receiving side.
+
+The telemetry frame payload is: hostname, field mask, then each field in the mask:
+  uptime - varint, deciseconds
+  load - 1, 5 and 15 minute load averages, 16 bit little endian hundredths
+  interfaces - interface count, then for each: name, oper state, rx bytes, rx packets, tx bytes, tx packets as varints
+Oper states are the RFC 2863 values used by netlink, ex: 6 for up.
+"""
+
+from array import array
+from math import isnan, nan
+from os import getloadavg
+from time import time
+
+from .framing import (
+    FRAME_MAGIC,
+    TELEMETRY,
+    FrameError,
+    _pack_str,
+    _unpack_str,
+    decode_varint,
+    encode_varint,
+    frame_size,
+)
+
+UPTIME, LOAD, INTERFACES = 0x01, 0x02, 0x04
+FIELDS = {"uptime": UPTIME, "load": LOAD, "interfaces": INTERFACES}
+OPER_STATES = ("unknown", "notpresent", "down", "lowerlayerdown", "testing", "dormant", "up")
+COUNTERS = ("rx_bytes", "rx_packets", "tx_bytes", "tx_packets")
+
+
+def is_telemetry(data) -> bool:
+    return data[:1] == FRAME_MAGIC and data[1:2] == bytes([TELEMETRY])
+
+
+def read_uptime() -> float:
+    with open("/proc/uptime") as f:
+        return float(f.read().split()[0])
+
+
+def read_oper_state(name: str) -> int:
+    try:
+        with open(f"/sys/class/net/{name}/operstate") as f:
+            return OPER_STATES.index(f.read().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def read_interfaces(path="/proc/net/dev") -> list:
+    """Returns (name, oper state, rx bytes, rx packets, tx bytes, tx packets) for each interface"""
+    interfaces = []
+    with open(path) as f:
+        for line in f.readlines()[2:]:  # Skip the header lines
+            name, _, counters = line.partition(":")
+            counters = [int(value) for value in counters.split()]
+            name = name.strip()
+            interfaces.append((name, read_oper_state(name), counters[0], counters[1], counters[8], counters[9]))
+    return interfaces
+
+
+def encode_telemetry(hostname: str, fields=FIELDS) -> bytes:
+    """Reads the fields and encodes them as a telemetry frame"""
+    mask = sum(FIELDS[field] for field in fields)
+    payload = bytearray(_pack_str(hostname)) + bytes([mask])
+    if mask & UPTIME:
+        payload += encode_varint(int(read_uptime() * 10))
+    if mask & LOAD:
+        payload += b"".join(min(int(load * 100), 0xFFFF).to_bytes(2, "little") for load in getloadavg())
+    if mask & INTERFACES:
+        interfaces = read_interfaces()[:0xFF]
+        payload.append(len(interfaces))
+        for name, oper_state, *counters in interfaces:
+            payload += _pack_str(name) + bytes([oper_state]) + b"".join(encode_varint(value) for value in counters)
+    return FRAME_MAGIC + bytes([TELEMETRY, 0]) + encode_varint(len(payload)) + payload
+
+
+def decode_telemetry(frame: bytes) -> tuple[str, dict]:
+    """Returns the hostname and sample of a telemetry frame, ex: {"uptime": 12.3, "load1": 0.5, "eth0.oper": 6}
+    Raises FrameError if the frame is incomplete or invalid."""
+    if (size := frame_size(frame)) is None or len(frame) < size:
+        raise FrameError(frame)
+    length, offset = decode_varint(frame, 3)
+    payload = frame[offset : offset + length]
+    try:
+        hostname, offset = _unpack_str(payload, 0)
+        mask, offset = payload[offset], offset + 1
+        sample = {}
+        if mask & UPTIME:
+            uptime, offset = decode_varint(payload, offset)
+            sample["uptime"] = uptime / 10
+        if mask & LOAD:
+            for name in ("load1", "load5", "load15"):
+                sample[name] = int.from_bytes(payload[offset : offset + 2], "little") / 100
+                offset += 2
+        if mask & INTERFACES:
+            count, offset = payload[offset], offset + 1
+            for _ in range(count):
+                name, offset = _unpack_str(payload, offset)
+                sample[f"{name}.oper"], offset = payload[offset], offset + 1
+                for counter in COUNTERS:
+                    sample[f"{name}.{counter}"], offset = decode_varint(payload, offset)
+    except (IndexError, UnicodeDecodeError) as e:
+        raise FrameError(e)
+    return hostname, sample
+
+
+class RingBuffer:
+    """The last size samples of a node, each value is stored in an array of doubles per column.
+    Values missing from a sample are nan. At most max_columns columns are kept, later ones are ignored."""
+
+    def __init__(self, size=720, max_columns=64):
+        self.size = size
+        self.max_columns = max_columns
+        self.times = array("d", [nan]) * size
+        self.columns = {}  # name: array
+        self.index = 0  # Slot of the next sample
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp: float, sample: dict):
+        index = self.index
+        self.times[index] = timestamp
+        for column in self.columns.values():
+            column[index] = nan
+        for name, value in sample.items():
+            if (column := self.columns.get(name)) is None:
+                if len(self.columns) >= self.max_columns:
+                    continue
+                column = self.columns[name] = array("d", [nan]) * self.size
+            column[index] = value
+        self.index = (index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def slots(self):
+        """Returns the slots holding samples, oldest first"""
+        return [(self.index - self.count + offset) % self.size for offset in range(self.count)]
+
+    def latest(self) -> dict:
+        """Returns the values of the latest sample"""
+        if not self.count:
+            return {}
+        index = (self.index - 1) % self.size
+        return {name: column[index] for name, column in self.columns.items() if not isnan(column[index])}
+
+    def series(self, name: str, since=0.0) -> list:
+        """Returns the (time, value) samples of a column since the time, oldest first"""
+        if (column := self.columns.get(name)) is None:
+            return []
+        return [
+            (self.times[index], column[index])
+            for index in self.slots()
+            if self.times[index] >= since and not isnan(column[index])
+        ]
+
+    def rate(self, name: str, window: float) -> float | None:
+        """Returns the per second change of a counter over the last window seconds,
+        None if there are fewer than two samples or the counter was reset"""
+        if len(samples := self.series(name, time() - window)) < 2:
+            return None
+        (start, first), (end, last) = samples[0], samples[-1]
+        if last < first or end <= start:
+            return None
+        return (last - first) / (end - start)
+
+
+class TelemetryStore:
+    """Ring buffers of received telemetry by hostname.
+    Memory is bounded, when max_nodes is reached the node which was updated least recently is dropped."""
+
+    def __init__(self, history=720, max_nodes=64):
+        self.history = history
+        self.max_nodes = max_nodes
+        self.nodes = {}  # hostname: RingBuffer, least recently updated first
+        self.frames = self.invalid = 0
+
+    def get(self, hostname: str) -> RingBuffer | None:
+        return self.nodes.get(hostname)
+
+    def add(self, frame: bytes, timestamp=None) -> str:
+        """Decodes a telemetry frame and stores its sample, returns the hostname.
+        Raises FrameError if the frame is invalid."""
+        try:
+            hostname, sample = decode_telemetry(frame)
+        except FrameError:
+            self.invalid += 1
+            raise
+        if (buffer := self.nodes.pop(hostname, None)) is None:
+            if len(self.nodes) >= self.max_nodes:
+                del self.nodes[next(iter(self.nodes))]
+            buffer = RingBuffer(self.history)
+        self.nodes[hostname] = buffer
+        buffer.append(time() if timestamp is None else timestamp, sample)
+        self.frames += 1
+        return hostname
+
+    def stats(self) -> dict:
+        return {"nodes": len(self.nodes), "frames": self.frames, "invalid": self.invalid}
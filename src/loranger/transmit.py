@@ -0,0 +1,186 @@
+from contextlib import contextmanager
+from heapq import heappop, heappush
+from itertools import count
+from threading import Condition
+from time import monotonic, sleep
+
+# Transmit priority classes, lower values are sent first
+CONTROL, INTERACTIVE, BULK = range(3)
+PRIORITY_NAMES = ("control", "interactive", "bulk")
+
+
+class AirtimeLimiter:
+    """Token bucket of airtime seconds, refilled at duty_cycle seconds per second, holding up to burst seconds.
+    Airtime taken beyond the tokens is owed, and the sender waits until it is repaid."""
+
+    def __init__(self, duty_cycle: float, burst: float):
+        self.duty_cycle = duty_cycle
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def take(self, airtime: float) -> float:
+        """Takes airtime from the bucket, returns the seconds to wait before sending it"""
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.duty_cycle) - airtime
+        self.updated = now
+        return -self.tokens / self.duty_cycle if self.tokens < 0 else 0.0
+
+
+class Transmitter:
+    """Writes messages to the module in packet sized chunks.
+
+    Chunks are memoryview slices of the encoded message.
+    The fill of the module's transmit buffer is estimated from the bytes written and the air data rate,
+    only the first chunk of a message waits for the full AUX handshake,
+    following chunks are written back-to-back while they fit in the buffer.
+    Without an AUX pin, writes are paced so the estimated fill never exceeds the buffer size.
+    With a limiter, each chunk waits for its airtime to fit in the duty cycle.
+    """
+
+    def __init__(
+        self, serial, logger, aux_ready, aux_pin=None, packet_size=200, buffer_size=400, air_rate=2400, limiter=None
+    ):
+        self.serial = serial
+        self.logger = logger
+        self.aux_ready = aux_ready
+        self.aux_pin = aux_pin
+        self.packet_size = packet_size
+        self.buffer_size = buffer_size
+        self.drain_rate = air_rate / 8  # Bytes per second sent over the air
+        self.limiter = limiter
+        self.fill = 0.0
+        self.fill_time = monotonic()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.messages = 0
+        self.bytes_sent = 0
+        self.send_time = 0.0
+        self.aux_waits = 0
+        self.coalesced = 0  # Chunks written without waiting for AUX
+        self.paced_time = 0.0  # Time spent waiting for buffer space without an AUX pin
+        self.limited_time = 0.0  # Time spent waiting for the duty cycle limiter
+
+    def stats(self) -> dict:
+        """Returns transmit statistics, efficiency is the effective rate relative to the configured baud rate"""
+        rate = self.bytes_sent / self.send_time if self.send_time else 0.0
+        uart_rate = self.serial.baudrate / 10  # 8N1
+        return {
+            "messages": self.messages,
+            "bytes": self.bytes_sent,
+            "bytes_per_second": rate,
+            "efficiency": rate / uart_rate,
+            "aux_waits": self.aux_waits,
+            "coalesced": self.coalesced,
+            "paced_time": self.paced_time,
+            "limited_time": self.limited_time,
+        }
+
+    def buffer_fill(self) -> float:
+        """Returns the estimated number of bytes in the module's transmit buffer"""
+        return max(0.0, self.fill - (monotonic() - self.fill_time) * self.drain_rate)
+
+    def write(self, chunk, fill: float):
+        self.serial.write(chunk)
+        self.fill, self.fill_time = fill + len(chunk), monotonic()
+
+    def send(self, data: bytes):
+        """Sends the data in packet sized chunks"""
+        view = memoryview(data)
+        self.send_packets([view[offset : offset + self.packet_size] for offset in range(0, len(view), self.packet_size)])
+
+    def send_packets(self, packets: list, preempt=None) -> int:
+        """Sends each packet as a separate chunk, packets must not be larger than packet_size.
+        If preempt returns True before a chunk after the first, the rest are not sent.
+        Returns the number of packets sent."""
+        start = monotonic()
+        sent = 0
+        for index, chunk in enumerate(packets):
+            if index and preempt and preempt():
+                break
+            if self.limiter and (wait := self.limiter.take(len(chunk) / self.drain_rate)):
+                self.limited_time += wait
+                sleep(wait)
+            sent += 1
+            fill = self.buffer_fill()
+            if self.aux_pin and (index == 0 or fill + len(chunk) > self.buffer_size):
+                with self.aux_ready():  # The module buffer is empty once AUX is ready
+                    self.aux_waits += 1
+                    self.write(chunk, 0.0)
+                continue
+            if (overflow := fill + len(chunk) - self.buffer_size) > 0:
+                pause = overflow / self.drain_rate
+                self.paced_time += pause
+                sleep(pause)
+                fill = self.buffer_fill()
+            if index:
+                self.coalesced += 1
+            self.write(chunk, fill)
+        self.messages += 1
+        self.bytes_sent += sum(len(chunk) for chunk in packets[:sent])
+        # Include the estimated time for the module to send what is left in its buffer
+        self.send_time += monotonic() + self.buffer_fill() / self.drain_rate - start
+        return sent
+
+
+class TransmitQueue:
+    """Orders messages waiting to be sent by priority class, then by arrival.
+
+    A sender waits for its turn while another message is being sent or a higher priority message is waiting.
+    Messages made of chunk frames can be decoded chunk by chunk, so they are preemptible:
+    between chunks they give up their turn to a waiting higher priority message, then wait to send the rest.
+    Other messages are sent whole, since interleaving them would corrupt both.
+    """
+
+    def __init__(self, transmitter: Transmitter, metrics=None):
+        self.transmitter = transmitter
+        self.metrics = metrics
+        self.condition = Condition()
+        self.waiting = []  # (priority, sequence)
+        self.sequence = count()
+        self.sending = False
+        self.max_depth = self.preemptions = 0
+
+    @contextmanager
+    def turn(self, priority: int):
+        """Waits until this sender is first in the queue and nothing is being sent, observes the wait"""
+        entry = (priority, next(self.sequence))
+        start = monotonic()
+        with self.condition:
+            heappush(self.waiting, entry)
+            self.max_depth = max(self.max_depth, len(self.waiting))
+            self.condition.wait_for(lambda: not self.sending and self.waiting[0] == entry)
+            heappop(self.waiting)
+            self.sending = True
+        if self.metrics:
+            self.metrics.observe(f"tx_wait_{PRIORITY_NAMES[priority]}", monotonic() - start)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.sending = False
+                self.condition.notify_all()
+
+    def preempted(self, priority: int) -> bool:
+        """True if a higher priority message is waiting"""
+        with self.condition:
+            return bool(self.waiting) and self.waiting[0][0] < priority
+
+    def send(self, data: bytes, priority=INTERACTIVE):
+        """Sends a message in packet sized chunks in one turn"""
+        with self.turn(priority):
+            self.transmitter.send(data)
+
+    def send_chunks(self, chunks: list, priority=INTERACTIVE):
+        """Sends chunk frames, giving up the turn between chunks if a higher priority message is waiting"""
+        sent = 0
+        while True:
+            with self.turn(priority):
+                sent += self.transmitter.send_packets(chunks[sent:], lambda: self.preempted(priority))
+            if sent >= len(chunks):
+                return
+            self.preemptions += 1
+
+    def stats(self) -> dict:
+        return {"depth": len(self.waiting), "max_depth": self.max_depth, "preemptions": self.preemptions}
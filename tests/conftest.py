@@ -0,0 +1,37 @@
+"""Helpers shared by the tests which run a server and a client over a simulated link"""
+
+from functools import partial
+from logging import getLogger
+from threading import Thread
+
+from loranger import LoRanger
+from loranger.simulator import SimulatedLink
+
+LINK_SETTINGS = {"baud": 115200, "air_rate": 19200}
+
+
+def start_nodes(test, read_timeout=1, runloop=True, hostname="node1", async_workers=0, **server_kwargs):
+    """Starts a simulated link with a server at one end and a client at the other, returns (link, server, client).
+    With runloop, the server loop runs in a thread, and the client reads its announcement.
+    With async_workers, the server runs the asyncio loop with that many workers.
+    The cleanups stop the server loop and wait for it before the link is closed, so it never reads a closed pty.
+    The server reads with a short timeout, so it stops soon after it is asked to."""
+    link = SimulatedLink(**LINK_SETTINGS).start()
+    test.addCleanup(link.close)
+    server = LoRanger(
+        link.a.port, aux_pin=link.a.aux_pin, logger=getLogger("server"), hostname=hostname, read_timeout=0.2,
+        **LINK_SETTINGS, **server_kwargs
+    )
+    client = LoRanger(
+        link.b.port, aux_pin=link.b.aux_pin, logger=getLogger("client"), read_timeout=read_timeout, **LINK_SETTINGS
+    )
+    test.addCleanup(client.serial.close)
+    test.addCleanup(server.serial.close)
+    if runloop:
+        target = partial(server.async_runloop, async_workers) if async_workers else server.runloop
+        thread = Thread(target=target, name="server-runloop", daemon=True)
+        thread.start()
+        test.addCleanup(thread.join)
+        test.addCleanup(server.stop)
+        test.assertEqual(client.read_data(), f"h:{hostname}")
+    return link, server, client
@@ -0,0 +1,115 @@
+from logging import getLogger
+from socket import AF_INET, AF_INET6
+from unittest import TestCase, main
+
+from pyroute2.netlink.exceptions import NetlinkError
+
+from loranger.actions import Actions, parse_network_operation
+
+
+class Message(dict):
+    def __init__(self, attrs, **fields):
+        super().__init__(fields)
+        self.attrs = attrs
+
+    def get_attr(self, name):
+        return self.attrs.get(name)
+
+
+class FakeIPRoute:
+    """Records link and address requests, requests for the address 10.9.9.9 raise a NetlinkError,
+    and for 10.9.9.8 an OSError, like pyroute2 does for addresses it can't encode"""
+
+    def __init__(self):
+        self.requests = []
+        self.dumps = 0
+
+    def get_links(self):
+        self.dumps += 1
+        links = ((1, "eth0"), (2, "eth1"))
+        return [Message({"IFLA_IFNAME": name}, index=index, flags=0, ifi_type=1) for index, name in links]
+
+    def get_addr(self):
+        return [Message({"IFA_ADDRESS": "10.0.0.1"}, index=1, family=AF_INET, prefixlen=24)]
+
+    def link(self, command, **kwargs):
+        self.requests.append(("link", command, kwargs))
+
+    def addr(self, command, **kwargs):
+        if kwargs["address"] == "10.9.9.9":
+            raise NetlinkError(17, "File exists")
+        if kwargs["address"] == "10.9.9.8":
+            raise OSError("illegal IP address string passed to inet_pton")
+        self.requests.append(("addr", command, kwargs))
+
+
+class Node(Actions):
+    logger = getLogger("actions")
+
+    def __init__(self):
+        self.__dict__["ipr"] = FakeIPRoute()
+
+
+class TestConfigureNetwork(TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_network_operation("up eth0"), ("up", "eth0", None, None, None))
+        self.assertEqual(parse_network_operation("add eth0 10.0.0.2/24"), ("add", "eth0", "10.0.0.2", 24, AF_INET))
+        self.assertEqual(parse_network_operation("del eth0 fe80::1"), ("del", "eth0", "fe80::1", None, AF_INET6))
+        invalid = (
+            "", "up", "up eth0 10.0.0.2", "add eth0 10.0.0.2", "add eth0 10.0.0.2/x", "move eth0",
+            "add eth0 10.0.0.300/24", "add eth0 10.0.0.2/33", "del eth0 fe80::zz",
+        )
+        for operation in invalid:
+            with self.assertRaises(ValueError):
+                parse_network_operation(operation)
+
+    def test_batch(self):
+        """ Interfaces are looked up once, operations which change nothing are skipped """
+        node = Node()
+        reply = node.configure_network(
+            "del eth0 10.0.0.1", "add eth0 10.0.1.1/24", "add eth0 10.0.1.1/24", "up eth0", "up eth1"
+        )
+        self.assertEqual(reply, "Applied 5 network operations")
+        self.assertEqual(node.ipr.dumps, 1)
+        self.assertEqual(node.ipr.requests, [
+            ("addr", "delete", {"index": 1, "address": "10.0.0.1", "mask": 24}),
+            ("addr", "add", {"index": 1, "address": "10.0.1.1", "mask": 24}),
+            ("link", "set", {"index": 1, "state": "up"}),
+            ("link", "set", {"index": 2, "state": "up"}),
+        ])
+
+    def test_rollback(self):
+        """ Applied operations are undone newest first when one fails """
+        node = Node()
+        reply = node.configure_network("up eth0", "del eth0 10.0.0.1", "add eth1 10.9.9.9/24", "down eth0")
+        self.assertEqual(reply, "Failed add eth1 10.9.9.9: (17, 'File exists'), rolled back 2/2")
+        self.assertEqual(node.ipr.requests[2:], [
+            ("addr", "add", {"index": 1, "address": "10.0.0.1", "mask": 24}),
+            ("link", "set", {"index": 1, "state": "down"}),
+        ])
+
+    def test_rollback_os_error(self):
+        """ Errors other than NetlinkError also roll back """
+        node = Node()
+        reply = node.configure_network("up eth0", "add eth0 10.9.9.8/24")
+        self.assertIn("rolled back 1/1", reply)
+        self.assertEqual(node.ipr.requests[1:], [("link", "set", {"index": 1, "state": "down"})])
+
+    def test_invalid_address(self):
+        """ A batch with an invalid address is rejected before anything is applied """
+        node = Node()
+        reply = node.configure_network("up eth0", "add eth0 10.0.0.300/24")
+        self.assertEqual(reply, "Invalid network operation: add eth0 10.0.0.300/24")
+        self.assertEqual(node.ipr.requests, [])
+
+    def test_errors(self):
+        node = Node()
+        self.assertEqual(node.configure_network("up eth9"), "Interface not found: eth9")
+        self.assertEqual(node.configure_network("up"), "Invalid network operation: up")
+        self.assertIn("Address not assigned: 10.9.9.9", node.configure_network("del eth0 10.9.9.9"))
+        self.assertEqual(node.ipr.requests, [])
+        self.assertIn("configure_network", node.get_actions())
+
+
+if __name__ == "__main__":
+    main()
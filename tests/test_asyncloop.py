@@ -0,0 +1,32 @@
+from threading import enumerate as threads
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+
+class TestAsyncRunloop(TestCase):
+    def setUp(self):
+        _, self.server, self.client = start_nodes(self, read_timeout=3, async_workers=2)
+
+    def test_query_overtakes_command(self):
+        """ A query is answered while a slow command is still running """
+        self.client.send_msg("c:sleep 1")
+        self.client.send_msg("q:hostname")
+        self.assertEqual(self.client.read_data(), "node1")
+        self.assertEqual(self.client.read_data(break_char="\x00\x00\n"), "\x00\x00")
+
+    def test_stop(self):
+        """ Stopping the server ends the reader, worker and writer threads, once the running request is done """
+        self.assertEqual(self.client.run_query("hostname"), "node1")
+        self.client.send_msg("c:sleep 0.5")
+        self.assertIsNone(self.client.read_data(timeout=0.2))
+        self.server.stop()
+        for thread in threads():
+            if thread.name == "server-runloop":
+                thread.join(5)
+        self.assertEqual([thread.name for thread in threads() if thread.name.startswith(("loranger-", "server-"))], [])
+        self.assertEqual(self.client.read_data(break_char="\x00\x00\n"), "\x00\x00")  # Sent before stopping
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+from logging import getLogger
+from unittest import TestCase, main
+
+from loranger.cache import QueryCache
+
+
+class TestQueryCache(TestCase):
+    def setUp(self):
+        self.cache = QueryCache(getLogger("test"))
+        self.renders = 0
+
+    def render(self):
+        self.renders += 1
+        return f"render {self.renders}"
+
+    def test_hit(self):
+        self.assertEqual(self.cache.get("ip4", "", self.render), "render 1")
+        self.assertEqual(self.cache.get("ip4", "", self.render), "render 1")
+        self.assertEqual(self.cache.get("ip4", "f", self.render), "render 2")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_invalidate(self):
+        """ Only entries depending on the changed table are dropped """
+        self.cache.get("routes", "", self.render)
+        self.cache.get("macs", "", self.render)
+        self.cache.invalidate("route")
+        self.assertEqual(self.cache.get("routes", "", self.render), "render 3")
+        self.assertEqual(self.cache.get("macs", "", self.render), "render 2")
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+    def test_changed_while_rendering(self):
+        """ Responses rendered while a dependency changed are not stored """
+
+        def render():
+            self.cache.invalidate("addr")
+            return self.render()
+
+        self.cache.get("ip4", "", render)
+        self.assertEqual(self.cache.get("ip4", "", self.render), "render 2")
+
+    def test_uncached(self):
+        """ Queries without a TTL or netlink dependencies are not cached """
+        self.cache.get("cache", "", self.render)
+        self.assertEqual(self.cache.get("cache", "", self.render), "render 2")
+        self.cache.get("uptime,transmit", "", self.render)
+        self.assertEqual(self.cache.get("uptime,transmit", "", self.render), "render 4")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+
+if __name__ == "__main__":
+    main()
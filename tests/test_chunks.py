@@ -0,0 +1,111 @@
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+from loranger.chunks import (
+    ChunkAssembler,
+    OutboundTransfers,
+    chunk_data_size,
+    decode_bitmap,
+    decode_chunk,
+    encode_bitmap,
+    is_chunk,
+)
+from loranger.framing import FrameError
+
+
+class TestChunks(TestCase):
+    def setUp(self):
+        self.message = bytes(range(256)) * 3
+        self.transfers = OutboundTransfers()
+        self.chunks = self.transfers.add(self.message, 100)
+
+    def test_round_trip(self):
+        """ Chunks fit in a packet and reassemble in any order """
+        self.assertTrue(all(is_chunk(chunk) and len(chunk) <= 100 for chunk in self.chunks))
+        assembler = ChunkAssembler()
+        for chunk in reversed(self.chunks[1:]):
+            self.assertIsNone(assembler.add(chunk)[1])
+        self.assertEqual(assembler.add(self.chunks[0])[1], self.message)
+
+    def test_crc(self):
+        corrupted = bytearray(self.chunks[0])
+        corrupted[10] ^= 0x04
+        with self.assertRaises(FrameError):
+            ChunkAssembler().add(bytes(corrupted))
+
+    def test_selective_resend(self):
+        """ Only the chunks missing when the round ends are requested and resent """
+        assembler = ChunkAssembler()
+        lost = {1, 4}
+        for index, chunk in enumerate(self.chunks):
+            if index not in lost:
+                transfer, message, incomplete = assembler.add(chunk)
+        self.assertTrue(incomplete)
+        nack = assembler.nack(transfer)
+        self.assertEqual(nack, f"k:0:{encode_bitmap(lost)}")
+        resent = self.transfers.resend(transfer, nack.split(":")[2])
+        self.assertEqual(resent, [self.chunks[1], self.chunks[4]])
+        self.assertEqual(assembler.add(resent[0])[1:], (None, False))
+        self.assertEqual(assembler.add(resent[1])[1], self.message)
+        saved = sum(len(chunk) for chunk in self.chunks) - len(resent[0]) - len(resent[1])
+        self.assertEqual(self.transfers.stats()["bytes_saved"], saved)
+
+    def test_bitmap(self):
+        self.assertEqual(decode_bitmap(encode_bitmap([0, 3, 200])), [0, 3, 200])
+
+    def test_unknown_transfer(self):
+        self.assertEqual(self.transfers.resend(0x42, "1"), [])
+        self.assertEqual(self.transfers.stats()["unknown"], 1)
+
+
+class TestChunkedReplies(TestCase):
+    def setUp(self):
+        self.link, self.server, self.client = start_nodes(self, read_timeout=2)
+
+    def lose_chunks(self, indexes):
+        """Loses the chunks with these indexes the first time the server sends them"""
+        deliver, lost = self.link.deliver, set()
+
+        def lossy_deliver(sender, packet):
+            if sender is self.link.a and is_chunk(packet):
+                try:
+                    index = decode_chunk(packet)[1]
+                except FrameError:  # Not a whole chunk, delivered as-is
+                    index = None
+                if index in indexes and index not in lost:
+                    lost.add(index)
+                    sender.lost += 1
+                    return
+            deliver(sender, packet)
+
+        self.link.deliver = lossy_deliver
+
+    def test_selective_retransmit(self):
+        """ Chunks lost on the link are requested again, and only they are resent """
+        command = "seq 1 300"
+        unchunked = self.client.run_command(command)
+        self.client.set_capabilities(["chunks"])
+        self.lose_chunks({1, 3})
+        self.assertEqual(self.client.run_command(command), unchunked)
+        self.assertEqual(self.link.stats()["a"]["lost"], 2)
+        stats = dict(item.split("=") for item in self.client.run_query("retransmit").split(","))
+        chunks = -(-len(unchunked + "\n") // chunk_data_size(self.server.packet_size))
+        self.assertEqual((stats["chunks"], stats["resent"]), (str(chunks), "2"))
+        self.assertEqual(self.client.chunk_assembler.stats(), {"complete": 1, "nacks": 1, "dropped": 0})
+
+    def test_interrupted_transfer(self):
+        """ Chunks of an interrupted transfer are not used for a later transfer with the same ID """
+        other = OutboundTransfers().add(b"a" * 600 + b"\n", self.server.packet_size)
+        chunks = self.server.transfers.add(b"b" * 600 + b"\n", self.server.packet_size)
+        self.assertEqual((decode_chunk(other[0])[:3], len(other)), (decode_chunk(chunks[0])[:3], len(chunks)))
+        self.server.tx_queue.send_chunks(other[:1])
+        self.server.send_msg("other")
+        self.assertEqual(self.client.read_data(), "other")
+        self.server.tx_queue.send_chunks(chunks[1:])  # The first chunk is requested by the client
+        self.assertEqual(self.client.read_data(), "b" * 600)
+        self.assertEqual(self.client.chunk_assembler.stats(), {"complete": 1, "nacks": 1, "dropped": 1})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+from loranger.delta import DeltaError, DeltaViews, StateVersions
+
+
+class TestDelta(TestCase):
+    def setUp(self):
+        self.versions = StateVersions()
+        self.views = DeltaViews()
+
+    def poll(self, parameter, text):
+        reply = self.versions.respond(parameter, text, self.views.since(parameter))
+        self.assertEqual(self.views.update(parameter, reply), text)
+        return reply
+
+    def test_routes(self):
+        routes = [f"eth0[10.{i}.0.0/16]" for i in range(20)]
+        self.assertTrue(self.poll("routes", ",".join(routes)).startswith("*"))
+        self.assertEqual(self.poll("routes", ",".join(routes)), "=")
+        routes[3] = "eth1[10.3.0.0/16]"
+        del routes[10]
+        routes.append("wg0[10.200.0.0/24]")
+        reply = self.poll("routes", ",".join(routes))
+        self.assertTrue(reply.startswith("~"))
+        self.assertLess(len(reply), 80)
+
+    def test_groups(self):
+        """ Address responses are split into one entry per interface """
+        self.poll("ip4", "eth0[10.0.0.1/8]eth1[]wlan0[192.168.1.2/24]")
+        self.assertTrue(self.poll("ip4", "eth0[10.0.0.1/8]eth1[172.16.0.1/12]wlan0[192.168.1.2/24]").startswith("~"))
+        self.poll("ip4", "")
+
+    def test_unknown_version(self):
+        self.poll("interfaces", "eth0,eth1")
+        self.views.views["interfaces"] = ("00000000", ["eth0"])
+        self.assertTrue(self.poll("interfaces", "eth0,eth1,eth2").startswith("*"))
+
+    def test_mismatch(self):
+        """ Views which do not match the node's version are detected """
+        interfaces = [f"eth{i}" for i in range(10)]
+        self.poll("interfaces", ",".join(interfaces))
+        self.views.views["interfaces"] = (self.views.since("interfaces"), interfaces[1:])
+        reply = self.versions.respond("interfaces", ",".join(interfaces + ["wg0"]), self.views.since("interfaces"))
+        with self.assertRaises(DeltaError):
+            self.views.update("interfaces", reply)
+
+
+class TestDeltaQuery(TestCase):
+    def setUp(self):
+        _, server, self.client = start_nodes(self, cache_queries=False)
+        self.interfaces = [f"eth{i}" for i in range(20)]
+        server.query_interfaces = lambda: list(self.interfaces)
+        self.client.set_capabilities(["delta"])
+        self.replies = []
+        run_request = self.client.run_request
+
+        def record_reply(*args, **kwargs):
+            self.replies.append(reply := run_request(*args, **kwargs))
+            return reply
+
+        self.client.run_request = record_reply
+
+    def query(self):
+        """Runs the query, checks it returns the node's current response, and returns the reply sent for it"""
+        self.assertEqual(self.client.run_query("interfaces"), ",".join(self.interfaces))
+        return self.replies[-1]
+
+    def test_link(self):
+        """ The first reply is the full response, then only the changes since the client's version are sent """
+        self.assertEqual(self.query(), f"*{','.join(self.interfaces)}")
+        self.assertEqual(self.query(), "=")
+        self.interfaces[5] = "wg0"
+        self.assertTrue(self.query().startswith("~"))
+        self.client.delta_views.views["interfaces"] = ("00000000", self.interfaces[1:])  # Unknown to the node
+        self.assertEqual(self.query(), f"*{','.join(self.interfaces)}")
+        self.assertEqual(len(self.replies), 4)
+
+    def test_link_mismatch(self):
+        """ If the changes can't be applied to the client's view, the full response is requested """
+        self.query()
+        self.client.delta_views.views["interfaces"] = (self.client.delta_views.since("interfaces"), self.interfaces[1:])
+        self.interfaces.append("wg0")
+        self.assertEqual(self.query(), f"*{','.join(self.interfaces)}")
+        self.assertTrue(self.replies[1].startswith("~"))
+
+
+if __name__ == "__main__":
+    main()
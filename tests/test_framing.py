@@ -0,0 +1,62 @@
+from unittest import TestCase, main
+
+from loranger.framing import (
+    BATCH,
+    IP4,
+    IP6,
+    MACS,
+    ROUTES,
+    TEXT,
+    FrameError,
+    decode_frame,
+    encode_frame,
+    frame_size,
+)
+
+
+class TestFraming(TestCase):
+    def assertRoundTrip(self, text, frame_type, packed_type=None):
+        frame = encode_frame(text, frame_type)
+        self.assertEqual(frame[1], frame_type if packed_type is None else packed_type)
+        self.assertEqual(frame_size(frame), len(frame))
+        self.assertEqual(decode_frame(frame), ",".join(text) if isinstance(text, list) else text)
+
+    def test_typed_round_trip(self):
+        """ Typed frames decode to the exact text response """
+        self.assertRoundTrip("eth0[192.168.1.5/24,10.0.0.1/8]wlan0[]", IP4)
+        self.assertRoundTrip("eth0[fd00::2/64,fe80::fc:ff:fe00:1/64]wg0[]", IP6)
+        self.assertRoundTrip("eth0[02:fc:00:00:00:01]wg0[None]", MACS)
+        self.assertRoundTrip(["eth0[10.0.0.0/24]", "eth1[10.1.0.0/16]", "eth0[10.2.0.0/16]"], ROUTES)
+
+    def test_batch(self):
+        """ Batch items are packed with the codec for their query """
+        text = "\x1f".join(["uptime=123.45", "ip4=eth0[10.0.0.1/8]", "routes=eth0[10.0.0.0/8]", "nope=Query not found: nope"])
+        self.assertRoundTrip(text, BATCH)
+
+    def test_corrupt_batch(self):
+        """ A batch item with an unknown type is an invalid frame """
+        frame = bytearray(encode_frame("uptime=123.45\x1fhostname=node1", BATCH, compress=False))
+        frame[frame.index(b"uptime") + len("uptime")] = 0x7F
+        with self.assertRaises(FrameError):
+            decode_frame(bytes(frame))
+
+    def test_text_fallback(self):
+        """ Responses which do not match the typed format are sent as text """
+        self.assertRoundTrip("Query not found: ip4", IP4, TEXT)
+        self.assertRoundTrip("eth0[not an address/24]", IP4, TEXT)
+
+    def test_compression(self):
+        text = "Interface not found: eth0\n" * 20
+        frame = encode_frame(text)
+        self.assertLess(len(frame), len(text) // 4)
+        self.assertEqual(decode_frame(frame), text)
+
+    def test_incomplete(self):
+        frame = encode_frame("x" * 300)
+        self.assertIsNone(frame_size(frame[:3]))
+        with self.assertRaises(FrameError):
+            decode_frame(frame[:-1])
+
+
+if __name__ == "__main__":
+    main()
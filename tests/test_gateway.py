@@ -0,0 +1,87 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+from loranger.gateway import Gateway, GatewayClient, GatewayError
+
+
+class TestGateway(TestCase):
+    def setUp(self):
+        _, _, self.loranger = start_nodes(self, read_timeout=2)
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/loranger.sock"
+        self.gateway = Gateway(self.loranger, self.path)
+
+    def client(self):
+        client = GatewayClient(self.path)
+        self.addCleanup(client.close)
+        return client
+
+    def test_requests(self):
+        self.gateway.start()
+        self.addCleanup(self.gateway.close)
+        client = self.client()
+        self.assertEqual(client.run_query("hostname"), "node1")
+        self.assertIn("start_service", client.run_action("get_actions", []))
+        self.assertEqual(client.run_command("echo hello"), "hello\n\x00\x00")
+        self.assertEqual(client.run_multicast("q", "hostname", ["node1"]), {"node1": "node1"})
+        with self.assertRaises(GatewayError):
+            client.request("send_msg", "x")
+
+    def test_coalesced(self):
+        """ Identical queries waiting at once are sent once, and queued queries are batched """
+        futures = [self.gateway.submit("run_query", ["hostname"]) for _ in range(3)]
+        futures.append(self.gateway.submit("run_query", ["capabilities"]))
+        self.gateway.start()
+        self.addCleanup(self.gateway.close)
+        self.assertEqual([future.result(5) for future in futures[:3]], ["node1"] * 3)
+        self.assertIn("address", futures[3].result(5))
+        self.assertEqual(self.gateway.coalesced, 2)
+        self.assertEqual(self.client().run_query("hostname"), "node1")  # Completed queries are sent again
+
+    def test_pipelined(self):
+        """ Actions and commands queued together are pipelined, commands keep their own timeout """
+        self.loranger.set_capabilities(["ids"])
+        futures = [
+            self.gateway.submit("run_action", ["get_actions", []]),
+            self.gateway.submit("run_command", ["sleep 2.5", 4]),  # Longer than the read timeout
+            self.gateway.submit("run_command", ["seq 1 3"]),
+        ]
+        self.gateway.start()
+        self.addCleanup(self.gateway.close)
+        self.assertIn("start_service", futures[0].result(5))
+        self.assertEqual([future.result(10) for future in futures[1:]], ["\x00\x00", "1\n2\n3\n\x00\x00"])
+        self.assertEqual(self.loranger.pipeline.expired, 0)
+
+    def test_socket_removed(self):
+        """ Stopping does not fail if the socket file was already removed """
+        self.gateway.start()
+        Path(self.path).unlink()
+        self.gateway.close()
+
+    def test_clients(self):
+        """ Clients share the link through the gateway """
+        self.gateway.start()
+        self.addCleanup(self.gateway.close)
+        results = []
+        threads = [Thread(target=lambda: results.append(self.client().run_query("hostname"))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(results, ["node1"] * 4)
+
+    def test_single_gateway(self):
+        self.gateway.start()
+        self.addCleanup(self.gateway.close)
+        with self.assertRaises(GatewayError):
+            Gateway(self.loranger, self.path).start()
+        self.assertIsNone(GatewayClient.connect(f"{self.path}.missing"))
+
+
+if __name__ == "__main__":
+    main()
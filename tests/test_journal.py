@@ -0,0 +1,147 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+from loranger.journal import HEADER_SIZE, RECORD, JournalError, OutboundJournal
+from loranger.simulator import SimulatedPin
+
+
+class CrashingJournal(OutboundJournal):
+    """Writes half of each record once crash is set, then raises, like a process killed during the write"""
+
+    crash = False
+
+    def write_record(self, record: bytes):
+        if not self.crash:
+            return super().write_record(record)
+        super().write_record(record[: len(record) // 2])
+        raise SystemExit("crashed")
+
+
+class TestOutboundJournal(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/journal"
+
+    def journal(self, capacity=1024, ttl=3600):
+        journal = OutboundJournal(self.path, capacity, ttl)
+        self.addCleanup(journal.close)
+        return journal
+
+    def drain(self, journal):
+        messages = []
+        while entry := journal.first():
+            messages.append(entry[1])
+            journal.ack(entry[0])
+        return messages
+
+    def test_order(self):
+        journal = self.journal()
+        for message in (b"one", b"two", b"three"):
+            journal.append(message)
+        sequence, message = journal.first()
+        self.assertEqual((sequence, message), (0, b"one"))
+        self.assertEqual(journal.first(), (0, b"one"))  # Not removed until acknowledged
+        journal.ack(sequence)
+        self.assertEqual(self.drain(journal), [b"two", b"three"])
+        self.assertEqual(len(journal), 0)
+
+    def test_eviction(self):
+        """ The oldest messages are dropped when the journal is full, the log wraps around """
+        record = RECORD.size + 100
+        journal = self.journal(capacity=HEADER_SIZE + record * 4 + 50)
+        for number in range(10):
+            journal.append(bytes([number]) * 100)
+        self.assertEqual(len(journal), 4)
+        self.assertEqual(journal.stats()["evicted"], 6)
+        self.assertEqual([message[0] for message in self.drain(journal)], [6, 7, 8, 9])
+
+    def test_bytes(self):
+        """ The unused space at the wrap point is counted until the records before it are removed """
+        record = RECORD.size + 100
+        capacity = HEADER_SIZE + record * 3 + 50
+        journal = self.journal(capacity=capacity)
+        for number in range(4):
+            journal.append(bytes([number]) * 100)
+        self.assertEqual(journal.stats()["bytes"], capacity - HEADER_SIZE)  # Full
+        journal.ack(journal.first()[0])
+        self.assertEqual(journal.stats()["bytes"], record * 2 + 50)
+        self.drain(journal)
+        self.assertEqual(journal.stats()["bytes"], 0)
+
+    def test_crash_while_evicting(self):
+        """ Records overwritten by a new record are removed from the header first, a crash loses only them """
+        record = RECORD.size + 100
+        journal = CrashingJournal(self.path, capacity=HEADER_SIZE + record * 3 + 50)
+        for number in range(3):
+            journal.append(bytes([number]) * 100)
+        journal.crash = True
+        with self.assertRaises(SystemExit):
+            journal.append(bytes([3]) * 100)
+        journal.close()
+        journal = self.journal(capacity=HEADER_SIZE + record * 3 + 50)
+        self.assertEqual([message[0] for message in self.drain(journal)], [1, 2])
+        self.assertEqual(journal.stats()["evicted"], 1)
+
+    def test_reopen(self):
+        """ Pending messages are found from the header after a restart """
+        journal = self.journal(capacity=512)
+        for number in range(12):
+            journal.append(b"message %d" % number)
+            if number < 8:
+                journal.ack(journal.first()[0])
+        journal.close()
+        journal = self.journal(capacity=512)
+        self.assertEqual(self.drain(journal), [b"message %d" % number for number in range(8, 12)])
+        self.assertEqual(journal.append(b"next"), 12)
+
+    def test_resized(self):
+        self.journal(capacity=512).append(b"message")
+        self.assertEqual(len(self.journal(capacity=1024)), 0)
+
+    def test_expired(self):
+        journal = self.journal(ttl=-1)
+        journal.append(b"stale")
+        self.assertIsNone(journal.first())
+        self.assertEqual(journal.stats()["expired"], 1)
+
+    def test_corrupt(self):
+        journal = self.journal()
+        journal.append(b"message")
+        journal.map[HEADER_SIZE + RECORD.size] ^= 0xFF
+        with self.assertRaises(JournalError):
+            journal.first()
+        self.assertEqual(len(journal), 0)
+
+    def test_too_large(self):
+        with self.assertRaises(ValueError):
+            self.journal(capacity=256).append(b"x" * 256)
+
+
+class TestJournalReplay(TestCase):
+    def test_replay(self):
+        """ Messages sent while the module is powered off are sent in order once it is started """
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        _, server, client = start_nodes(
+            self, runloop=False, power_pin=SimulatedPin("power"), journal=f"{directory.name}/journal"
+        )
+        self.addCleanup(server.journal.close)
+        server.module_startup()
+        self.assertEqual(client.read_data(), "h:node1")
+
+        server.power_pin.value = 0
+        server.send_msg("one")
+        server.send_msg("two")
+        self.assertEqual(server.query_journal(), "pending=2,bytes=56,evicted=0,expired=0")
+        self.assertIsNone(client.read_data(timeout=0.3))
+
+        server.read_message(timeout=0.1)  # Restarts the powered off module
+        self.assertEqual([client.read_data() for _ in range(3)], ["one", "two", "h:node1"])
+        self.assertEqual(len(server.journal), 0)
+
+
+if __name__ == "__main__":
+    main()
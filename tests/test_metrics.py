@@ -0,0 +1,76 @@
+from os import path
+from tempfile import TemporaryDirectory
+from threading import Event
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+from loranger.metrics import Histogram, Metrics
+
+
+class TestMetrics(TestCase):
+    def test_quantile(self):
+        histogram = Histogram()
+        for value in [0.002] * 98 + [0.3, 40]:
+            histogram.observe(value)
+        self.assertEqual(histogram.quantile(0.5), 0.0025)
+        self.assertEqual(histogram.quantile(0.99), 0.5)
+        self.assertEqual(histogram.quantile(1), float("inf"))
+
+    def test_compact(self):
+        metrics = Metrics()
+        metrics.count("bytes_in", 10)
+        metrics.count("bytes_in", 5)
+        metrics.observe("send_msg", 0.004)
+        metrics.observe("send_msg", 0.006)
+        self.assertEqual(metrics.compact(), "bytes_in=15,send_msg=2/5.0/10")
+
+    def test_timer_raises(self):
+        """ Blocks which raise are still timed """
+        metrics = Metrics()
+        with self.assertRaises(ValueError), metrics.timer("handle_action"):
+            raise ValueError
+        self.assertEqual(metrics.histograms["handle_action"].count, 1)
+
+    def test_textfile(self):
+        metrics = Metrics()
+        metrics.count("resets")
+        metrics.observe("read_data", 0.02)
+        with TemporaryDirectory() as tmpdir:
+            textfile = path.join(tmpdir, "loranger.prom")
+            metrics.write_textfile(textfile)
+            with open(textfile) as f:
+                lines = f.read().splitlines()
+        self.assertIn("loranger_resets_total 1", lines)
+        self.assertIn('loranger_stage_seconds_bucket{stage="read_data",le="0.01"} 0', lines)
+        self.assertIn('loranger_stage_seconds_bucket{stage="read_data",le="+Inf"} 1', lines)
+        self.assertIn('loranger_stage_seconds_count{stage="read_data"} 1', lines)
+
+    def test_textfile_stopped(self):
+        """ The textfile writer stops once the stopped event is set """
+        stopped = Event()
+        with TemporaryDirectory() as tmpdir:
+            textfile = path.join(tmpdir, "loranger.prom")
+            thread = Metrics().start_textfile(textfile, interval=0.05, stopped=stopped)
+            stopped.set()
+            thread.join(1)
+            self.assertFalse(thread.is_alive())
+            self.assertTrue(path.exists(textfile))
+
+
+class TestMetricsQuery(TestCase):
+    def test_query(self):
+        """ The stage timers and counters of the server are sent for q:metrics """
+        _, _, client = start_nodes(self)
+        self.assertEqual(client.run_query("hostname"), "node1")
+        metrics = dict(item.split("=") for item in client.run_query("metrics").split(","))
+        for stage in ("send_msg", "read_data", "handle_query"):
+            count, mean, p99 = metrics[stage].split("/")
+            self.assertGreaterEqual(int(count), 1)
+            self.assertGreaterEqual(float(p99), float(mean))
+        self.assertGreater(int(metrics["bytes_in"]), 0)
+        self.assertGreater(int(metrics["bytes_out"]), 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from time import monotonic
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+
+class TestMulticast(TestCase):
+    def setUp(self):
+        _, self.server, self.client = start_nodes(self)
+
+    def test_slot(self):
+        self.assertEqual(self.server.multicast_slot("node0+node1"), 1)
+        self.assertIsNone(self.server.multicast_slot("node0+node2"))
+        self.assertIn(self.server.multicast_slot("*4"), range(4))
+        self.assertIsNone(self.server.multicast_slot("*x"))
+
+    def test_max_slots(self):
+        """ Requests for too many slots are ignored instead of delaying the reply """
+        self.assertIsNone(self.server.multicast_slot("*100000000"))
+        self.assertIsNone(self.server.multicast_slot("*0"))
+        self.assertIsNone(self.server.multicast_slot("+".join(f"node{i}" for i in range(2, 66)) + "+node1"))
+        self.assertEqual(self.server.metrics.counters["invalid_requests"], 2)
+        self.client.send_msg("qm@*100000000#1:hostname")
+        self.assertEqual(self.client.run_query("hostname"), "node1")  # Answered without waiting
+        with self.assertRaises(ValueError):
+            self.client.run_multicast("q", "hostname", slots=100000000)
+
+    def test_targets(self):
+        """ Nodes reply in their slot, targets which do not reply are None """
+        start = monotonic()
+        results = self.client.run_multicast("q", "hostname", ["node0", "node1", "node2"], timeout=0.5)
+        self.assertEqual(results, {"node0": None, "node1": "node1", "node2": None})
+        self.assertGreater(monotonic() - start, self.server.slot_time())  # Waited for the node1 slot
+        self.assertEqual(self.client.metrics.counters["multicast_missing"], 2)
+
+    def test_all(self):
+        """ Requests for all nodes collect replies until the deadline """
+        results = self.client.run_multicast("a", "get_actions:", slots=2, timeout=0.5)
+        self.assertEqual(list(results), ["node1"])
+        self.assertIn("start_service", results["node1"])
+
+    def test_too_long(self):
+        """ Replies longer than a packet are replaced, so they don't run into the next slot """
+        results = self.client.run_multicast("c", "seq 1 100", ["node1", "node2"], timeout=0.5)
+        self.assertEqual(results, {"node1": "Reply too long for a multicast slot: 304 bytes", "node2": None})
+        self.assertEqual(self.server.metrics.counters["multicast_too_long"], 1)
+
+    def test_other_nodes(self):
+        """ Multicast requests which do not include the node are ignored """
+        self.assertEqual(self.client.run_multicast("q", "hostname", ["node2"], timeout=0.2), {"node2": None})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+from time import sleep
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+from loranger.pipeline import RequestPipeline
+
+
+class TestRequestPipeline(TestCase):
+    def test_window(self):
+        pipeline = RequestPipeline(window=2)
+        first = pipeline.allocate("q")
+        pipeline.allocate("q")
+        self.assertTrue(pipeline.full())
+        self.assertTrue(pipeline.complete(first, "reply"))
+        self.assertFalse(pipeline.full())
+        self.assertEqual(pipeline.pop(first), "reply")
+
+    def test_out_of_order(self):
+        pipeline = RequestPipeline()
+        ids = [pipeline.allocate("q") for _ in range(3)]
+        for request_id in reversed(ids):
+            pipeline.complete(request_id, f"reply {request_id}")
+        self.assertEqual([pipeline.pop(request_id) for request_id in ids], [f"reply {i}" for i in ids])
+
+    def test_stale(self):
+        """ Replies to expired requests are dropped """
+        pipeline = RequestPipeline()
+        request_id = pipeline.allocate("c")
+        pipeline.set_timeout(request_id, 0.01)
+        sleep(0.02)
+        self.assertFalse(pipeline.waiting(request_id))
+        self.assertFalse(pipeline.complete(request_id, "late"))
+        self.assertIsNone(pipeline.pop(request_id))
+        self.assertEqual((pipeline.expired, pipeline.stale), (1, 1))
+
+    def test_id_reuse(self):
+        """ IDs in flight are not reallocated when the counter wraps """
+        pipeline = RequestPipeline(window=0x100)
+        held = pipeline.allocate("q")
+        ids = {pipeline.allocate("q") for _ in range(0xFF)}
+        self.assertNotIn(held, ids)
+        with self.assertRaises(RuntimeError):
+            pipeline.allocate("q")
+
+
+class TestPipelinedRequests(TestCase):
+    def test_without_ids(self):
+        """ Nodes without request IDs get one request at a time, multi-line command output stays in one reply """
+        _, _, client = start_nodes(self, read_timeout=2)
+        replies = client.run_pipelined([("c", "seq 1 3"), ("q", "hostname"), ("a", "get_actions:")])
+        self.assertEqual(replies[:2], ["1\n2\n3\n\x00\x00", "node1"])
+        self.assertIn("start_service", replies[2])
+
+    def test_out_of_order(self):
+        """ Replies are matched to their requests by ID when a slow command is answered last """
+        _, _, client = start_nodes(self, read_timeout=3, async_workers=4)
+        client.set_capabilities(["ids"])
+        replies = client.run_pipelined([("c", "sleep 0.5"), ("c", "seq 1 3"), ("q", "hostname")])
+        self.assertEqual(replies, ["\x00\x00", "1\n2\n3\n\x00\x00", "node1"])
+        self.assertEqual((client.pipeline.stale, client.pipeline.expired), (0, 0))
+
+    def test_stale(self):
+        """ A reply which arrives after its request timed out is dropped, not returned for the next request """
+        _, _, client = start_nodes(self)
+        client.set_capabilities(["ids"])
+        self.assertIsNone(client.run_request("c", "sleep 0.5", timeout=0.2))
+        self.assertEqual(client.run_request("q", "hostname", timeout=2), "node1")
+        self.assertEqual((client.pipeline.stale, client.pipeline.expired), (1, 1))
+
+
+if __name__ == "__main__":
+    main()
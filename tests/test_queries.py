@@ -0,0 +1,97 @@
+from collections import Counter
+from socket import AF_INET, AF_INET6
+from unittest import TestCase, main
+
+from loranger.netlink import ARPHRD_LOOPBACK, NetlinkSnapshot
+from loranger.queries import RTN_UNICAST, Queries
+
+
+class Message(dict):
+    def __init__(self, attrs, **fields):
+        super().__init__(fields)
+        self.attrs = attrs
+
+    def get_attr(self, name):
+        return self.attrs.get(name)
+
+
+class FakeIPRoute:
+    """Serves fixed link, address and route dumps, and counts the dumps of each table"""
+
+    def __init__(self):
+        self.dumps = Counter()
+
+    def get_links(self):
+        self.dumps["links"] += 1
+        links = ((1, "lo", ARPHRD_LOOPBACK, "00:00:00:00:00:00"), (2, "eth0", 1, "02:00:00:00:00:02"))
+        links += ((3, "wlan0", 1, "02:00:00:00:00:03"),)
+        return [
+            Message({"IFLA_IFNAME": name, "IFLA_ADDRESS": mac}, index=index, ifi_type=ifi_type)
+            for index, name, ifi_type, mac in links
+        ]
+
+    def get_addr(self):
+        self.dumps["addresses"] += 1
+        addresses = ((1, AF_INET, "127.0.0.1", 8), (2, AF_INET, "10.0.0.1", 24), (2, AF_INET6, "fe80::2", 64))
+        addresses += ((3, AF_INET, "192.168.1.2", 24), (3, AF_INET, "192.168.1.3", 24))
+        return [
+            Message({"IFA_ADDRESS": address}, index=index, family=family, prefixlen=prefixlen)
+            for index, family, address, prefixlen in addresses
+        ]
+
+    def get_routes(self):
+        self.dumps["routes"] += 1
+        routes = ((2, AF_INET, "10.0.0.0", 24, RTN_UNICAST), (3, AF_INET, "192.168.1.0", 24, RTN_UNICAST))
+        routes += ((2, AF_INET, None, 0, RTN_UNICAST), (1, AF_INET, "127.0.0.0", 8, 2), (2, AF_INET6, "fe80::", 64, 1))
+        return [
+            Message({"RTA_OIF": index, "RTA_DST": dst}, family=family, dst_len=dst_len, type=route_type)
+            for index, family, dst, dst_len, route_type in routes
+        ]
+
+
+class Node(Queries):
+    def __init__(self):
+        self.__dict__["ipr"] = FakeIPRoute()
+
+
+class TestNetlinkQueries(TestCase):
+    def setUp(self):
+        self.node = Node()
+
+    def query(self, parameter):
+        """Runs the query, checks each table was dumped at most once"""
+        self.node.ipr.dumps.clear()
+        response = getattr(self.node, f"query_{parameter}")()
+        self.assertLessEqual(max(self.node.ipr.dumps.values()), 1)
+        return response
+
+    def test_responses(self):
+        """ Responses match the text of the queries which dumped the tables per interface """
+        self.assertEqual(self.query("interfaces"), ["eth0", "wlan0"])
+        self.assertEqual(self.query("ip4"), "eth0[10.0.0.1/24]wlan0[192.168.1.2/24,192.168.1.3/24]")
+        self.assertEqual(self.query("ip6"), "eth0[fe80::2/64]wlan0[]")
+        self.assertEqual(self.query("macs"), "eth0[02:00:00:00:00:02]wlan0[02:00:00:00:00:03]")
+        self.assertEqual(self.query("routes"), ["eth0[10.0.0.0/24]", "wlan0[192.168.1.0/24]"])
+
+    def test_tables(self):
+        """ Only the tables a query uses are dumped """
+        self.query("interfaces")
+        self.assertEqual(self.node.ipr.dumps, {"links": 1})
+        self.query("ip4")
+        self.assertEqual(self.node.ipr.dumps, {"links": 1, "addresses": 1})
+        self.query("routes")
+        self.assertEqual(self.node.ipr.dumps, {"links": 1, "routes": 1})
+
+    def test_snapshot(self):
+        snapshot = NetlinkSnapshot(self.node.ipr, self.node.netlink_lock)
+        self.assertEqual(snapshot.link_index("wlan0"), 3)
+        self.assertEqual(snapshot.ifname(2), "eth0")
+        self.assertIsNone(snapshot.ifname(9))
+        self.assertEqual(snapshot.get_addresses(3, AF_INET6), [])
+        with self.assertRaises(IndexError):
+            snapshot.link_index("eth9")
+        self.assertEqual(self.node.ipr.dumps, {"links": 1, "addresses": 1})
+
+
+if __name__ == "__main__":
+    main()
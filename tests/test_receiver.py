@@ -0,0 +1,113 @@
+from logging import getLogger
+from os import close, openpty, pipe, ttyname, write
+from time import monotonic
+from unittest import TestCase, main
+
+from conftest import start_nodes
+from serial import Serial, SerialException
+
+from loranger.framing import encode_frame
+from loranger.receiver import JunkDataError, Receiver
+from loranger.simulator import SimulatedPin
+
+
+class HungUpSerial:
+    """A port whose device hung up, its file descriptor is readable but there is no data"""
+
+    in_waiting = 0
+
+    def __init__(self):
+        self.fd, write_fd = pipe()
+        close(write_fd)
+
+    def fileno(self):
+        return self.fd
+
+
+class TestReceiver(TestCase):
+    def setUp(self):
+        self.master, self.slave = openpty()
+        self.serial = Serial(ttyname(self.slave), baudrate=9600)
+        self.receiver = Receiver(self.serial, getLogger("test"))
+
+    def tearDown(self):
+        self.serial.close()
+        close(self.master)
+        close(self.slave)
+
+    def test_read_until_keeps_remainder(self):
+        """ Bytes after the terminator are returned by the next read """
+        write(self.master, b"q:uptime\nq:ip4\n")
+        self.assertEqual(self.receiver.read_until(b"\n", 1), b"q:uptime\n")
+        self.assertEqual(self.receiver.read_until(b"\n", 1), b"q:ip4\n")
+        self.assertEqual(self.receiver.stats()["frames"], 2)
+
+    def test_split_terminator(self):
+        """ A terminator split across reads is found """
+        write(self.master, b"output\x00")
+        self.assertEqual(self.receiver.read_until(b"\x00\x00\n", 0.1), b"output\x00")
+        write(self.master, b"output\x00")
+        self.receiver.read_chunk(1)
+        write(self.master, b"\x00\n")
+        self.assertEqual(self.receiver.read_until(b"\x00\x00\n", 1), b"output\x00\x00\n")
+
+    def test_timeout(self):
+        """ Returns buffered data when no terminator arrives """
+        write(self.master, b"partial")
+        self.assertEqual(self.receiver.read_until(b"\n", 0.1), b"partial")
+        self.assertEqual(self.receiver.read_until(b"\n", 0.1), b"")
+
+    def test_hangup(self):
+        """ A port which is readable without data raises instead of polling until the timeout """
+        serial = HungUpSerial()
+        self.addCleanup(close, serial.fileno())
+        receiver = Receiver(serial, getLogger("test"))
+        start = monotonic()
+        with self.assertRaises(SerialException):
+            receiver.read_until(b"\n", 2)
+        self.assertLess(monotonic() - start, 1)
+
+    def test_junk(self):
+        """ Junk is discarded up to the next message """
+        write(self.master, b"\xff\xbf\x00junk\n")
+        self.assertEqual(self.receiver.read_until(b"\n", 0.1), b"")
+        write(self.master, b"q:uptime\n")
+        self.assertEqual(self.receiver.read_until(b"\n", 1), b"q:uptime\n")
+        self.assertEqual(self.receiver.metrics.counters["resyncs"], 1)
+        self.assertEqual(self.receiver.metrics.counters["junk_bytes"], 8)
+
+    def test_junk_escalation(self):
+        """ Repeated junk without a good message raises JunkDataError """
+        with self.assertRaises(JunkDataError):
+            for _ in range(self.receiver.max_failures):
+                write(self.master, b"\xff\n")
+                self.receiver.read_until(b"\n", 0.1)
+
+    def test_corrupt_frame(self):
+        """ Frames which never complete or have an invalid header are discarded up to the next message """
+        frame = encode_frame("eth0[10.0.0.1/8]")
+        write(self.master, frame[:1] + b"\x00\x00\x7f" + frame[4:] + frame)
+        self.assertEqual(self.receiver.read_until(b"\n", 0.1), frame)
+        write(self.master, b"\x1e\x63\x00\x01x\nq:ip4\n")
+        self.assertEqual(self.receiver.read_until(b"\n", 1), b"q:ip4\n")
+
+
+class TestUndecodable(TestCase):
+    def test_reset(self):
+        """ Undecodable messages without a good message in between reset the module """
+        _, server, client = start_nodes(self, runloop=False, power_pin=SimulatedPin("power"))
+        server.module_startup()
+        self.assertEqual(client.read_data(), "h:node1")
+        max_failures = server.receiver.max_failures
+        client.send_msg(b"\xc3\x28\n" * (max_failures - 1) + b"q:uptime\n" + b"\xc3\x28\n" * max_failures)
+        self.assertEqual([server.read_data() for _ in range(max_failures - 1)], [None] * (max_failures - 1))
+        self.assertEqual(server.read_data(), "q:uptime")  # A good message forgives the earlier failures
+        self.assertEqual([server.read_data() for _ in range(max_failures)], [None] * max_failures)
+        self.assertEqual(server.metrics.counters["resets"], 1)
+        self.assertEqual(server.metrics.counters["undecodable"], max_failures * 2 - 1)
+        self.assertNotIn("read_timeouts", server.metrics.counters)
+        self.assertEqual(client.read_data(), "h:node1")  # Announced after the reset
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from time import sleep
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+from loranger.directory import NodeDirectory
+from loranger.scheduler import AirtimeBudget, PollScheduler
+
+
+class TestAirtimeBudget(TestCase):
+    def test_wait(self):
+        """ Airtime which does not fit waits until enough airtime leaves the window """
+        budget = AirtimeBudget(air_rate=8, duty_cycle=0.5, window=0.2)  # 1 byte per second, 0.1s limit
+        self.assertEqual(budget.airtime(2), 2)
+        self.assertEqual(budget.wait(0.05), 0)
+        budget.spend(0.08)
+        self.assertGreater(budget.wait(0.05), 0.1)
+        sleep(0.2)
+        self.assertEqual(budget.wait(0.05), 0)
+        self.assertEqual(budget.stats()["airtime_used"], 0)
+
+    def test_oversized(self):
+        """ Airtime larger than the budget fits in an empty window """
+        budget = AirtimeBudget(duty_cycle=0.01, window=1)
+        self.assertEqual(budget.wait(5), 0)
+
+
+class TestPollScheduler(TestCase):
+    def setUp(self):
+        _, _, self.client = start_nodes(self)
+        self.directory = NodeDirectory(interval=30)
+        self.scheduler = PollScheduler(self.client, self.directory, ["hostname", "capabilities"], AirtimeBudget(19200))
+
+    def test_addressed(self):
+        """ Only the addressed node replies """
+        self.client.target = "node2"
+        self.assertIsNone(self.client.run_query("hostname"))
+        self.client.target = "node1"
+        self.assertEqual(self.client.run_query("hostname"), "node1")
+
+    def test_poll(self):
+        node = self.scheduler.hello("node1")
+        self.assertEqual(self.scheduler.poll_next(), node)
+        self.assertEqual(node.state["hostname"], "node1")
+        self.assertIn("address", node.capabilities)
+        self.assertGreater(node.reply_bytes, 0)
+        self.assertGreater(self.scheduler.budget.used, 0)
+        self.assertGreater(self.scheduler.next_wait(), 29)  # Not due again until its interval has passed
+        self.assertIsNone(self.scheduler.poll_next())
+
+    def test_backoff(self):
+        """ Nodes which do not reply are backed off, and polled again after a hello """
+        ghost = self.scheduler.hello("ghost")
+        self.scheduler.hello("node1")
+        self.assertEqual(self.scheduler.poll_next(), ghost)  # Due first
+        self.assertEqual(ghost.failures, 1)
+        self.assertEqual(self.scheduler.poll_next().hostname, "node1")
+        self.assertGreater(ghost.due, self.directory.get("node1").due)  # Backed off past the reachable node
+        self.scheduler.hello("ghost")
+        self.assertEqual(self.scheduler.next_node(), ghost)
+
+    def test_budget(self):
+        """ Polls wait for airtime when the budget is used up """
+        self.scheduler.budget = AirtimeBudget(19200, duty_cycle=0.01, window=60)
+        self.scheduler.budget.spend(0.6)
+        self.scheduler.hello("node1")
+        self.assertGreater(self.scheduler.next_wait(), 50)
+        self.assertIsNone(self.scheduler.poll_next())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from time import monotonic
+from unittest import TestCase, main
+
+from conftest import start_nodes
+from serial import Serial
+
+from loranger.simulator import SimulatedLink, SimulatedPin
+
+
+class TestSimulatedLink(TestCase):
+    def open(self, air_rate=19200, **kwargs):
+        link = SimulatedLink(baud=115200, air_rate=air_rate, **kwargs).start()
+        self.addCleanup(link.close)
+        a, b = Serial(link.a.port, 115200, timeout=2), Serial(link.b.port, 115200, timeout=2)
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+        return link, a, b
+
+    def test_airtime(self):
+        """ Data arrives after its airtime, in packets of up to packet_size bytes """
+        link, a, b = self.open(packet_size=50)
+        start = monotonic()
+        a.write(bytes(range(120)))
+        self.assertEqual(b.read(120), bytes(range(120)))
+        self.assertGreater(monotonic() - start, 120 * 8 / 19200)
+        self.assertEqual(link.stats()["a"]["packets"], 3)
+
+    def test_aux(self):
+        """ AUX is high while the module has data to send """
+        link, a, b = self.open(air_rate=9600)
+        a.write(bytes(100))
+        with link.a.aux_pin.on_fall(1) as fell:
+            self.assertTrue(fell)
+        self.assertEqual(link.a.aux_pin.value, 0)
+        self.assertEqual(link.a.aux_pin.edges[1], 1)
+        self.assertEqual(b.read(100), bytes(100))
+
+    def test_loss(self):
+        link, a, b = self.open(loss=1.0)
+        b.timeout = 0.2
+        a.write(b"hello\n")
+        self.assertEqual(b.read(6), b"")
+        self.assertEqual(link.stats()["a"]["lost"], 1)
+
+    def test_pin_timeout(self):
+        with SimulatedPin().on_rise(0.01) as rose:
+            self.assertFalse(rose)
+
+
+class TestLinkRunloop(TestCase):
+    def test_query(self):
+        """ A client gets replies from a server runloop over the simulated link """
+        _, _, client = start_nodes(self, read_timeout=2)
+        self.assertEqual(client.run_command("echo hello"), "hello\n\x00\x00")
+        self.assertEqual(client.run_action("push_telemetry", []), "Action not found: push_telemetry")
+        client.negotiate()
+        self.assertEqual(client.run_queries(["capabilities", "nope"])["nope"], "Query not found: nope")
+
+
+if __name__ == "__main__":
+    main()
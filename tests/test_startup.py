@@ -0,0 +1,15 @@
+from subprocess import run
+from sys import executable
+from unittest import TestCase, main
+
+
+class TestStartup(TestCase):
+    def test_lazy_imports(self):
+        """ Importing LoRanger does not load netlink, GPIO or subprocess code """
+        code = "import sys, loranger; print(*[name in sys.modules for name in ('pyroute2', 'sys_gpio', 'subprocess')])"
+        ret = run([executable, "-c", code], capture_output=True, check=True)
+        self.assertEqual(ret.stdout.split(), [b"False"] * 3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+from tempfile import TemporaryDirectory
+from time import monotonic
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+from loranger.streaming import stream_output
+
+
+class TestStreamOutput(TestCase):
+    def test_chunks(self):
+        """ Output is split into chunks of at most chunk_size bytes """
+        chunks = list(stream_output(["seq", "1", "1000"], 64))
+        self.assertEqual("".join(chunks), "".join(f"{i}\n" for i in range(1, 1001)))
+        self.assertTrue(all(len(chunk.encode()) <= 64 for chunk in chunks))
+
+    def test_flush(self):
+        """ Partial chunks are sent when the command pauses """
+        chunks = list(stream_output(["sh", "-c", "echo first; sleep 0.5; echo second"], 200))
+        self.assertEqual(chunks, ["first\n", "second\n"])
+
+    def test_timeout(self):
+        chunks = list(stream_output(["sh", "-c", "echo partial; sleep 5"], 200, timeout=0.5))
+        self.assertEqual(chunks, ["partial\n"])
+
+    def test_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            list(stream_output(["loranger-missing-command"], 200))
+
+
+class TestStreamCommand(TestCase):
+    def test_link(self):
+        """ Output is passed to the callback as it is produced, and matches the output of run_command """
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with open(f"{directory.name}/script", "w") as f:
+            f.write("echo first\nsleep 1\necho second\n")
+        command = f"sh {directory.name}/script"
+        _, _, client = start_nodes(self, read_timeout=3)
+        client.negotiate()
+        self.assertTrue(client.use_stream)
+        chunks = []
+        output = client.stream_command(command, lambda chunk: chunks.append((monotonic(), chunk)))
+        finished = monotonic()
+        self.assertEqual([chunk for _, chunk in chunks], ["first\n", "second\n"])
+        self.assertLess(chunks[0][0], finished - 0.5)  # Received while the command was sleeping
+        self.assertEqual(output, client.run_command(command))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from unittest import TestCase, main
+
+from conftest import start_nodes
+
+from loranger import LoRanger
+from loranger.framing import FrameError
+from loranger.telemetry import RingBuffer, TelemetryStore, decode_telemetry, encode_telemetry
+
+
+class TestTelemetryFrames(TestCase):
+    def test_round_trip(self):
+        hostname, sample = decode_telemetry(encode_telemetry("node1"))
+        self.assertEqual(hostname, "node1")
+        self.assertGreater(sample["uptime"], 0)
+        self.assertIn("load15", sample)
+        self.assertIn("lo.rx_bytes", sample)
+
+    def test_fields(self):
+        """ Only the configured fields are sent """
+        frame = encode_telemetry("node1", ["uptime"])
+        self.assertLess(len(frame), 16)
+        self.assertEqual(list(decode_telemetry(frame)[1]), ["uptime"])
+
+    def test_truncated(self):
+        frame = encode_telemetry("node1", ["interfaces"])
+        with self.assertRaises(FrameError):
+            decode_telemetry(frame[:-3])
+
+
+class TestRingBuffer(TestCase):
+    def test_wraparound(self):
+        """ Only the last size samples are kept, oldest first """
+        buffer = RingBuffer(size=3)
+        for second in range(5):
+            buffer.append(second, {"uptime": second * 10})
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.series("uptime"), [(2, 20), (3, 30), (4, 40)])
+        self.assertEqual(buffer.series("uptime", since=4), [(4, 40)])
+        self.assertEqual(buffer.latest(), {"uptime": 40})
+
+    def test_missing_values(self):
+        buffer = RingBuffer(size=4, max_columns=2)
+        buffer.append(0, {"a": 1, "b": 2, "c": 3})
+        buffer.append(1, {"a": 2})
+        self.assertEqual(buffer.latest(), {"a": 2})
+        self.assertEqual(buffer.series("b"), [(0, 2)])
+        self.assertEqual(buffer.series("c"), [])  # Over max_columns
+
+    def test_rate(self):
+        buffer = RingBuffer(size=4)
+        for second, value in ((0, 100), (1, 200), (2, 400)):
+            buffer.append(1e10 + second, {"eth0.rx_bytes": value})
+        self.assertEqual(buffer.rate("eth0.rx_bytes", window=1e11), 150)
+        buffer.append(1e10 + 3, {"eth0.rx_bytes": 0})  # Counter reset
+        self.assertIsNone(buffer.rate("eth0.rx_bytes", window=1e11))
+
+
+class TestTelemetryStore(TestCase):
+    def test_max_nodes(self):
+        """ The least recently updated node is dropped """
+        store = TelemetryStore(history=2, max_nodes=2)
+        for hostname in ("node1", "node2", "node1", "node3"):
+            store.add(encode_telemetry(hostname, ["uptime"]))
+        self.assertEqual(list(store.nodes), ["node1", "node3"])
+        self.assertEqual(len(store.get("node1")), 2)
+
+    def test_push(self):
+        """ Telemetry pushed by a server is stored by the client """
+        _, _, client = start_nodes(self, telemetry_interval=0.1, telemetry_fields="uptime,load")
+        self.assertIsNone(client.read_data(timeout=0.5))  # Telemetry frames are not returned
+        self.assertGreater(len(client.telemetry.get("node1")), 1)
+        self.assertEqual(set(client.telemetry.get("node1").latest()), {"uptime", "load1", "load5", "load15"})
+        self.assertEqual(client.run_query("hostname"), "node1")
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            LoRanger("/dev/null", 9600, telemetry_fields="uptime,nope")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+from logging import getLogger
+from os import close, openpty, read, ttyname
+from threading import Thread
+from time import sleep
+from unittest import TestCase, main
+
+from serial import Serial
+
+from loranger.chunks import encode_chunk
+from loranger.transmit import BULK, CONTROL, AirtimeLimiter, TransmitQueue, Transmitter
+
+
+class TestTransmitter(TestCase):
+    def setUp(self):
+        self.master, self.slave = openpty()
+        self.serial = Serial(ttyname(self.slave), baudrate=9600)
+        self.aux_handshakes = 0
+        self.aux_delay = 0
+
+    def tearDown(self):
+        self.serial.close()
+        close(self.master)
+        close(self.slave)
+
+    def read_master(self, size):
+        """Reads size bytes written to the serial port, pty reads may return part of them"""
+        data = b""
+        while len(data) < size:
+            data += read(self.master, size - len(data))
+        return data
+
+    @contextmanager
+    def aux_ready(self):
+        self.aux_handshakes += 1
+        sleep(self.aux_delay)
+        yield
+
+    def test_coalesced_aux(self):
+        """ Chunks which fit in the module buffer skip the AUX handshake """
+        transmitter = Transmitter(self.serial, getLogger("test"), self.aux_ready, aux_pin=True, air_rate=80)
+        transmitter.send(bytes(range(200)) * 3)
+        self.assertEqual(self.aux_handshakes, 2)
+        self.assertEqual(transmitter.stats()["coalesced"], 1)
+        self.assertEqual(len(self.read_master(600)), 600)
+
+    def test_paced_without_aux(self):
+        """ Without an AUX pin, writes wait for room in the module buffer """
+        transmitter = Transmitter(self.serial, getLogger("test"), self.aux_ready, air_rate=8000)
+        transmitter.send(b"x" * 600)
+        self.assertEqual(self.aux_handshakes, 0)
+        self.assertAlmostEqual(transmitter.stats()["paced_time"], 0.2, delta=0.05)
+
+    def test_limiter(self):
+        """ Once the burst is used, chunks wait for their airtime at the duty cycle """
+        limiter = AirtimeLimiter(duty_cycle=0.5, burst=0.1)
+        self.assertEqual(limiter.take(0.1), 0)
+        self.assertAlmostEqual(limiter.take(0.05), 0.1, delta=0.01)
+        transmitter = Transmitter(self.serial, getLogger("test"), self.aux_ready, air_rate=8000, limiter=limiter)
+        transmitter.send(b"x" * 50)  # 0.05s of airtime, waits for the debt from the previous take
+        self.assertGreater(transmitter.stats()["limited_time"], 0.1)
+
+    def test_preemption(self):
+        """ A control message is sent between the chunks of a bulk transfer """
+        self.aux_delay = 0.05
+        transmitter = Transmitter(self.serial, getLogger("test"), self.aux_ready, aux_pin=True, buffer_size=1)
+        queue = TransmitQueue(transmitter)
+        chunks = [encode_chunk(0, index, 4, b"bulk") for index in range(4)]
+        bulk = Thread(target=queue.send_chunks, args=(chunks, BULK))
+        bulk.start()
+        sleep(0.07)  # The first chunk has been sent
+        queue.send(b"h:node1\n", CONTROL)
+        bulk.join()
+        data = self.read_master(len(b"h:node1\n") + sum(len(chunk) for chunk in chunks))
+        self.assertLess(data.index(b"h:node1"), data.index(chunks[-1]))
+        self.assertEqual(data.count(b"bulk"), 4)
+        self.assertEqual(queue.stats()["preemptions"], 1)
+
+
+if __name__ == "__main__":
+    main()